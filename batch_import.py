@@ -0,0 +1,184 @@
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+import extract
+import identity
+import instrument
+import ledger
+import parse_pdf
+import sinks
+
+SOURCE_EXTENSIONS = (".pdf", ".txt")
+
+log = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Parses report PDFs or text files in a pool of worker processes "
+                                                 "and loads them through a single writer.")
+    parser.add_argument("sources", nargs="+", help="Directories or glob patterns naming the PDF or text files to load.")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+            help="The number of parsing processes to run.")
+    parser.add_argument("--manifest", default="import_manifest.jsonl",
+            help="The file to append a result line to for every file processed.")
+    parser.add_argument("--force", action="store_true",
+            help="Load every file, even those the ingest ledger says are unchanged.")
+    parser.add_argument("--quarantine", default="quarantine.jsonl",
+            help="The file to append records which couldn't be parsed to, with their line numbers and errors.")
+    parser.add_argument("--strict", action="store_true",
+            help="Fail a whole file on its first unreadable record instead of quarantining the record.")
+    parser.add_argument("--text-cache", default=None,
+            help="A directory to cache the text extracted from PDFs in, keyed by the hash of the PDF.")
+    parser.add_argument("--db-url", default=None,
+            help="Where to load the records: a Postgres or SQLite URL, csv:///dir or parquet:///dir. "
+                 "Defaults to $KEENE_DB_URL, then the local keene_police_logs database.")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument.run(args):
+        sink = sinks.open_sink(args.db_url)
+        try:
+            summary = run_import(sink, find_sources(args.sources), args.workers, args.manifest, args.force,
+                                 args.text_cache, None if args.strict else args.quarantine)
+        finally:
+            sink.close()
+        log.info("Loaded {loaded} of {files} files ({records} records) in {seconds:.1f}s, "
+                 "{unchanged} unchanged, {failed} failed, {quarantined} records quarantined".format(**summary))
+
+def find_sources(sources):
+    """ Expands each directory or glob pattern in `sources` into a sorted list of files.
+        Only the PDF and text files in a directory are included.
+    """
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(os.path.join(source, f) for f in sorted(os.listdir(source))
+                         if f.endswith(SOURCE_EXTENSIONS))
+        else:
+            paths.extend(sorted(glob.glob(source)))
+    return [p for p in paths if os.path.isfile(p)]
+
+def open_source(path, content_hash, text_cache=None):
+    """ Opens the text of a report, extracting it first if `path` is a PDF """
+    if path.endswith(".pdf"):
+        return extract.extract_lines(path, content_hash, text_cache)
+    return open(path, "r")
+
+def parse_source(task):
+    """ Parses the file named by `task`, a (path, content hash, text cache, strict) tuple, in a
+        worker process. PDFs are extracted in the worker and their text streamed straight
+        into the parser. Officers and dispatchers are resolved against empty caches; the
+        writer maps them onto the database by number. Unless `strict` is set, records which
+        can't be read are set aside in the result's "quarantined" list. The metrics the
+        worker recorded are sent back in "metrics", to be merged into the writer's.
+    """
+    path, content_hash, text_cache, strict = task
+    start = time.time()
+    result = {"path" : path, "content_hash" : content_hash, "records" : [],
+              "report_date" : None, "error" : None, "quarantined" : []}
+    try:
+        with open_source(path, content_hash, text_cache) as handle:
+            lines = parse_pdf.read_lines(handle)
+            report_date = parse_pdf.read_report_date(lines)
+            result["report_date"] = report_date.date()
+            try:
+                for record in parse_pdf.read_records(lines, report_date,
+                        identity.officer_cache(), identity.dispatcher_cache(),
+                        None if strict else result["quarantined"]):
+                    result["records"].append(record)
+            except parse_pdf.DuplicateError as e:
+                log.warning("%s: %s", path, e)
+    except Exception:
+        result["error"] = traceback.format_exc()
+    result["parse_seconds"] = time.time() - start
+    instrument.METRICS.observe("file_parse_seconds", result["parse_seconds"])
+    result["metrics"] = instrument.METRICS.drain()
+    return result
+
+def run_import(sink, paths, workers, manifest_path, force=False, text_cache=None, quarantine_path=None):
+    """ Parses `paths` across `workers` processes and writes each file's records to
+        `sinks.Sink` in its own transaction as soon as they arrive, appending the
+        outcome to the manifest.
+        Files whose contents and parser version match the ingest ledger are skipped;
+        a changed file replaces only the rows of its report date.
+        With a `quarantine_path`, unreadable records are appended there and the rest of
+        their file is loaded; the manifest gives the share of each file's records read.
+        Otherwise a file fails on its first unreadable record.
+        Returns a summary of the run.
+    """
+    start = time.time()
+    summary = {"files" : len(paths), "loaded" : 0, "failed" : 0, "unchanged" : 0, "records" : 0, "quarantined" : 0}
+
+    tasks = []
+    for path in paths:
+        content_hash = ledger.file_digest(path)
+        if not force and sink.is_current(ledger.source_name(path), content_hash, parse_pdf.PARSER_VERSION):
+            summary["unchanged"] += 1
+        else:
+            tasks.append((path, content_hash, text_cache, quarantine_path is None))
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        with open(manifest_path, "a") as manifest, \
+                open(quarantine_path or os.devnull, "a") as quarantine:
+            for result in pool.imap_unordered(parse_source, tasks):
+                path, records, error = result["path"], result["records"], result["error"]
+                instrument.METRICS.merge(result["metrics"])
+                quarantined = result["quarantined"]
+                entry = {"file" : ledger.source_name(path), "records" : len(records),
+                         "quarantined" : len(quarantined),
+                         "coverage" : round(len(records) / float(len(records) + len(quarantined)), 4)
+                                      if records or quarantined else None,
+                         "parse_seconds" : round(result["parse_seconds"], 3)}
+                load_start = time.time()
+                if error is None:
+                    sink.begin()
+                    try:
+                        sink.replace_report_date(result["report_date"])
+                        for record in records:
+                            sink.add(record)
+                        entry["rows"] = sink.flush()
+                        sink.refresh_rollups([result["report_date"]])
+                        sink.record_load(entry["file"], result["content_hash"],
+                                result["report_date"], parse_pdf.PARSER_VERSION, entry["rows"])
+                        sink.commit()
+                    except Exception:
+                        sink.rollback()
+                        error = traceback.format_exc()
+                entry["load_seconds"] = round(time.time() - load_start, 3)
+                instrument.METRICS.observe("file_load_seconds", time.time() - load_start)
+
+                if error is None:
+                    entry["status"] = "ok"
+                    summary["loaded"] += 1
+                    summary["records"] += len(records)
+                    summary["quarantined"] += len(quarantined)
+                    # the file is in the ledger now, so its bad records are set aside just this once
+                    for item in quarantined:
+                        item.update(file = entry["file"], content_hash = result["content_hash"],
+                                    report_date = result["report_date"].isoformat())
+                        quarantine.write(json.dumps(item) + "\n")
+                    quarantine.flush()
+                else:
+                    entry["status"] = "failed"
+                    entry["error"] = error
+                    summary["failed"] += 1
+                    log.error("Failed to load %s", path)
+                instrument.METRICS.count('files_total{{status="{0}"}}'.format(entry["status"]))
+                manifest.write(json.dumps(entry) + "\n")
+                manifest.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+    summary["seconds"] = time.time() - start
+    instrument.METRICS.count('files_total{status="unchanged"}', summary["unchanged"])
+    instrument.METRICS.count("records_quarantined_total", summary["quarantined"])
+    return summary
+
+if __name__ == "__main__":
+    main()
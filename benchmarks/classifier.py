@@ -0,0 +1,96 @@
+""" Compares the lines/sec of the old `startswith` chain in `read_record` with the
+    single-match classifier `parse_pdf.LINE_TYPE_RE`, over a corpus of report text files.
+
+    python benchmarks/classifier.py txt/
+"""
+import argparse
+import glob
+import json
+import os
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import parse_pdf
+
+def legacy_classify(line):
+    """ The classification done by the `if/elif` chain `read_record` used before `LINE_TYPE_RE` """
+    if line.strip() == '' or not [x for x in line if x in string.printable]:
+        return "blank"
+    elif line.startswith("Call Closed By") or line.startswith("Call Modified By") or \
+            line.startswith("Cleared By") or line.startswith("Con:") or \
+            line.startswith("Arrived By") or line.startswith("Dispatched By") \
+            or line.startswith("DOB") or line.startswith("Juvenile Arrest") or \
+            line.startswith("Enroute By") or line.startswith("Juvenile Protective Custody"):
+        return "ignored"
+    elif line.startswith("Additional Activity:"):
+        return "additional_activity"
+    elif line.startswith("Call Taker:"):
+        return "call_taker"
+    elif line.startswith("Location/Address:") or line.startswith("Location:") or line.startswith("Vicinity of:"):
+        return "location_address"
+    elif line.startswith("Lat:"):
+        return "lat_lon"
+    elif line.startswith("Location Change:"):
+        return "location_change"
+    elif line.startswith("Primary Id:"):
+        return "primary_id"
+    elif line.startswith("Jurisdiction:"):
+        return "jurisdiction"
+    elif line.startswith("ID:"):
+        return "officer"
+    elif line.startswith("Refer"):
+        return "refer"
+    return None
+
+def classify(line):
+    match = parse_pdf.LINE_TYPE_RE.match(line)
+    if match:
+        return match.lastgroup
+    elif not parse_pdf.PRINTABLE_RE.search(line):
+        return "blank"
+    return None
+
+def load_lines(sources):
+    lines = []
+    for source in sources:
+        paths = sorted(glob.glob(os.path.join(source, "*"))) if os.path.isdir(source) else glob.glob(source)
+        for path in paths:
+            with open(path, "r") as handle:
+                lines.extend(parse_pdf.read_lines(handle))
+    return lines
+
+def time_classifier(classifier, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            classifier(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sources", nargs="*", default=["txt"], help="Directories or globs of report text files.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each classifier; the best is reported.")
+    args = parser.parse_args()
+
+    lines = load_lines(args.sources)
+    if not lines:
+        parser.error("no report lines found in {0}".format(", ".join(args.sources)))
+
+    mismatches = sum(1 for line in lines if legacy_classify(line) != classify(line))
+    before = time_classifier(legacy_classify, lines, args.repeat)
+    after = time_classifier(classify, lines, args.repeat)
+    print(json.dumps({
+        "lines" : len(lines),
+        "mismatches" : mismatches,
+        "before_lines_per_sec" : round(before),
+        "after_lines_per_sec" : round(after),
+        "speedup" : round(after / before, 2),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
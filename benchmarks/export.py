@@ -0,0 +1,96 @@
+""" Times reading a year of incidents from an export in each format, against selecting
+    them from the database. Seeds a SQLite database with synthetic reports unless
+    --db-url names one already loaded.
+
+    python benchmarks/export.py --days 365 --incidents 300
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import db
+import export
+import models
+import parse_pdf
+import sinks
+import synthetic
+
+def seed(db_url, days, incidents):
+    sink = sinks.open_sink(db_url)
+    start = datetime.date(2015, 1, 1)
+    try:
+        for day in range(days):
+            report_date = start + datetime.timedelta(days=day)
+            lines = iter(synthetic.generate_report(report_date, incidents, day, day * incidents + 1))
+            sink.begin()
+            for record in parse_pdf.read_records(lines, parse_pdf.read_report_date(lines), sink.officers, sink.dispatchers):
+                sink.add(record)
+            sink.flush()
+            sink.commit()
+    finally:
+        sink.close()
+
+def best_of(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 2), result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db-url", default=None, help="A database to export instead of a seeded SQLite one.")
+    parser.add_argument("--days", type=int, default=365, help="Synthetic reports to seed, starting 2015-01-01.")
+    parser.add_argument("--incidents", type=int, default=300, help="Incidents in each synthetic report.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        db_url = args.db_url
+        if db_url is None:
+            db_url = "sqlite:///" + os.path.join(workdir, "bench.db")
+            seed(db_url, args.days, args.incidents)
+
+        connection = db.create_db_engine(db_url).connect()
+        incident = models.Incident.__table__
+        first = connection.execute(incident.select().with_only_columns([incident.c.dispatch_time])
+                                   .order_by(incident.c.dispatch_time).limit(1)).scalar()
+        start = datetime.date(first.year, 1, 1)
+        end = datetime.date(first.year + 1, 1, 1)
+        query = incident.select() \
+            .where(incident.c.dispatch_time >= datetime.datetime.combine(start, datetime.time())) \
+            .where(incident.c.dispatch_time < datetime.datetime.combine(end, datetime.time()))
+        select_ms, rows = best_of(lambda: connection.execute(query).fetchall(), args.repeat)
+
+        results = {"incidents" : len(rows), "select_ms" : select_ms}
+        for file_format in sorted(export.EXTENSIONS):
+            directory = os.path.join(workdir, file_format)
+            export_start = time.perf_counter()
+            export.export(connection, directory, file_format)
+            export_seconds = time.perf_counter() - export_start
+            read_ms, table = best_of(lambda: export.read_table(directory, "incident", start, end), args.repeat)
+            size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(os.path.join(directory, "incident"))
+                       for f in files)
+            results[file_format] = {"export_seconds" : round(export_seconds, 2), "read_ms" : read_ms,
+                                    "rows" : table.num_rows, "incident_bytes" : size}
+            try:
+                results[file_format]["to_pandas_ms"] = best_of(lambda: table.to_pandas(), args.repeat)[0]
+            except ImportError:
+                pass
+        connection.close()
+    finally:
+        shutil.rmtree(workdir)
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+""" Measures the latency of `query_service` under concurrent clients, reporting the p50
+    and p99 of each route. Without --url, a service is started in this process over a
+    SQLite database seeded with synthetic reports, or over --db-url if given.
+
+    python benchmarks/load_test.py --clients 16 --requests 200
+    python benchmarks/load_test.py --url http://localhost:8080 --start 2015-01-01 --days 365
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import parse_pdf
+import query_service
+import sinks
+import synthetic
+
+CATEGORIES = ["MOTOR VEHICLE STOP", "PARKING VIOLATION", "NOISE COMPLAINT", "ASSIST OTHER AGENCY",
+              "SUSPICIOUS ACTIVITY", "ANIMAL COMPLAINT"]
+
+def seed(db_url, start, days, incidents):
+    sink = sinks.open_sink(db_url)
+    try:
+        for day in range(days):
+            report_date = start + datetime.timedelta(days=day)
+            lines = iter(synthetic.generate_report(report_date, incidents, day, day * incidents + 1))
+            sink.begin()
+            for record in parse_pdf.read_records(lines, parse_pdf.read_report_date(lines), sink.officers, sink.dispatchers):
+                sink.add(record)
+            sink.flush()
+            sink.refresh_rollups([report_date])
+            sink.commit()
+    finally:
+        sink.close()
+
+def make_request(rand, start, days):
+    """ A random query as (route, params), drawn from a small enough space that some repeat """
+    first = start + datetime.timedelta(days=rand.randrange(days))
+    last = first + datetime.timedelta(days=rand.choice([1, 7, 30]))
+    kind = rand.random()
+    params = {"start" : first.isoformat(), "end" : last.isoformat()}
+    if kind < 0.2:
+        return ("/response_times", params)
+    if kind < 0.4:
+        params["category"] = rand.choice(CATEGORIES) + " "
+    elif kind < 0.6:
+        params["officer"] = str(rand.randint(1, 80))
+    elif kind < 0.8:
+        lat, lon = 42.90 + rand.random() * 0.05, -72.31 + rand.random() * 0.06
+        params["bbox"] = "{0:.2f},{1:.2f},{2:.2f},{3:.2f}".format(lat, lon, lat + 0.01, lon + 0.01)
+    return ("/incidents", params)
+
+def run_client(url, seed_value, count, start, days):
+    """ Issues `count` requests, following a page's `next` cursor now and then.
+        Returns (route, seconds, cache hit, status) for each.
+    """
+    rand = random.Random(seed_value)
+    session = requests.Session()
+    results = []
+    while len(results) < count:
+        route, params = make_request(rand, start, days)
+        began = time.perf_counter()
+        response = session.get(url + route, params=params)
+        results.append((route, time.perf_counter() - began, response.headers.get("X-Cache") == "hit",
+                        response.status_code))
+        if route == "/incidents" and response.status_code == 200 and rand.random() < 0.3:
+            cursor = response.json()["next"]
+            if cursor is not None:
+                params["after"] = cursor
+                began = time.perf_counter()
+                response = session.get(url + route, params=params)
+                results.append(("/incidents?after", time.perf_counter() - began,
+                                response.headers.get("X-Cache") == "hit", response.status_code))
+    return results
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+def summarize(results):
+    seconds = [r[1] for r in results]
+    return {
+        "requests" : len(results),
+        "errors" : sum(1 for r in results if r[3] != 200),
+        "cache_hit_ratio" : round(sum(1 for r in results if r[2]) / float(len(results)), 3),
+        "p50_ms" : round(percentile(seconds, 0.5) * 1000, 2),
+        "p99_ms" : round(percentile(seconds, 0.99) * 1000, 2),
+        "max_ms" : round(max(seconds) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="A running query service to test instead of one started here.")
+    parser.add_argument("--db-url", default=None, help="A loaded database to serve instead of a seeded SQLite one.")
+    parser.add_argument("--start", default="2015-01-01", help="The first report date to query, as YYYY-MM-DD.")
+    parser.add_argument("--days", type=int, default=90, help="Report dates to seed and query.")
+    parser.add_argument("--incidents", type=int, default=300, help="Incidents in each seeded report.")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent clients.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests made by each client.")
+    parser.add_argument("--pool-size", type=int, default=query_service.POOL_SIZE)
+    args = parser.parse_args()
+
+    start = datetime.datetime.strptime(args.start, "%Y-%m-%d").date()
+    workdir = tempfile.mkdtemp()
+    server = None
+    try:
+        url = args.url
+        if url is None:
+            db_url = args.db_url
+            if db_url is None:
+                db_url = "sqlite:///" + os.path.join(workdir, "load_test.db")
+                seed(db_url, start, args.days, args.incidents)
+            service = query_service.QueryService(query_service.create_engine(db_url, args.pool_size))
+            server = query_service.make_server(service, "localhost", 0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = "http://localhost:{0}".format(server.server_address[1])
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            futures = [pool.submit(run_client, url, i, args.requests, start, args.days) for i in range(args.clients)]
+            results = [r for future in futures for r in future.result()]
+        elapsed = time.perf_counter() - began
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(workdir)
+
+    routes = sorted(set(r[0] for r in results))
+    print(json.dumps({
+        "clients" : args.clients,
+        "requests_per_sec" : round(len(results) / elapsed, 1),
+        "overall" : summarize(results),
+        "routes" : dict((route, summarize([r for r in results if r[0] == route])) for route in routes),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
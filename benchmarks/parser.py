@@ -0,0 +1,166 @@
+""" Measures parser throughput over synthetic reports and any real report text files,
+    writing the results as JSON. Runs offline: rows are staged with an in-memory sink
+    in place of Postgres.
+
+    python benchmarks/parser.py --days 5 --incidents 1000 --txt txt/ --out parser.json
+"""
+import argparse
+import datetime
+import glob
+import itertools
+import json
+import os
+import pickle
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import bulk_load
+import identity
+import normalize
+import parse_pdf
+import records
+import synthetic
+from sqlalchemy.orm import sessionmaker
+
+class MemoryLoader(bulk_load.BulkLoader):
+    """ A bulk loader which numbers rows itself instead of asking Postgres """
+
+    def __init__(self, officers, dispatchers):
+        bulk_load.BulkLoader.__init__(self, None, officers, dispatchers)
+        self.ids = itertools.count(1)
+
+    def reserve_ids(self, table, count):
+        return [next(self.ids) for _ in range(count)]
+
+    def assign_ids(self, table, people):
+        return self.reserve_people_ids(table, people)
+
+def parse_report(lines, officers, dispatchers):
+    lines = iter(lines)
+    report_date = parse_pdf.read_report_date(lines)
+    return list(parse_pdf.read_records(lines, report_date, officers, dispatchers))
+
+def run_stages(reports):
+    """ Times each stage of the ingest over `reports`, a list of lists of lines """
+    timings = {}
+    officers = identity.officer_cache()
+    dispatchers = identity.dispatcher_cache()
+
+    start = time.perf_counter()
+    for lines in reports:
+        lines = iter(lines)
+        parse_pdf.read_report_date(lines)
+        for _ in parse_pdf.split_records(lines):
+            pass
+    timings["split"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parsed = []
+    for lines in reports:
+        parsed.extend(parse_report(lines, officers, dispatchers))
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pickled = pickle.dumps(parsed, pickle.HIGHEST_PROTOCOL)
+    pickle.loads(pickled)
+    timings["pickle"] = time.perf_counter() - start
+
+    # what building models for every record would cost, for code that wants a session
+    start = time.perf_counter()
+    session = sessionmaker()()
+    officer_models = {}
+    dispatcher_models = {}
+    for record in parsed:
+        session.add_all(records.orm_rows(record, officer_models, dispatcher_models))
+    timings["orm_build"] = time.perf_counter() - start
+    session.expunge_all()
+
+    # the rows a flush would write, built in memory; nothing is written
+    start = time.perf_counter()
+    loader = MemoryLoader(officers, dispatchers)
+    for record in parsed:
+        loader.add(record)
+    rows = loader.build_rows()
+    timings["build_rows"] = time.perf_counter() - start
+
+    normalize.clean_query.cache_clear()
+    normalize.normalize_location.cache_clear()
+    start = time.perf_counter()
+    normalize.normalize_locations(normalize.canonical_locations([record.incident.location for record in parsed]))
+    timings["normalize"] = time.perf_counter() - start
+
+    return timings, parsed, rows, len(pickled)
+
+def peak_parse_memory(reports):
+    """ Returns the most memory traced while parsing `reports` """
+    tracemalloc.start()
+    try:
+        officers = identity.officer_cache()
+        dispatchers = identity.dispatcher_cache()
+        for lines in reports:
+            for _ in parse_report(lines, officers, dispatchers):
+                pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchmark(name, reports):
+    timings, parsed, rows, pickled_bytes = run_stages(reports)
+    peak = peak_parse_memory(reports)
+    line_count = sum(len(lines) for lines in reports)
+    parse_seconds = timings["parse"]
+    return {
+        "corpus" : name,
+        "reports" : len(reports),
+        "lines" : line_count,
+        "records" : len(parsed),
+        "rows" : dict((table, len(table_rows)) for table, table_rows in rows.items()),
+        "seconds" : dict((stage, round(seconds, 4)) for stage, seconds in timings.items()),
+        "records_per_sec" : round(len(parsed) / parse_seconds) if parse_seconds else None,
+        "lines_per_sec" : round(line_count / parse_seconds) if parse_seconds else None,
+        "peak_parse_bytes" : peak,
+        "pickled_bytes_per_record" : round(pickled_bytes / float(len(parsed))) if parsed else None,
+    }
+
+def synthetic_reports(days, incidents, seed):
+    start = datetime.date(2015, 1, 1)
+    return [synthetic.generate_report(start + datetime.timedelta(days=day), incidents, seed + day, day * incidents + 1)
+            for day in range(days)]
+
+def real_reports(sources):
+    reports = []
+    for source in sources:
+        paths = sorted(glob.glob(os.path.join(source, "*.txt"))) if os.path.isdir(source) else sorted(glob.glob(source))
+        for path in paths:
+            with open(path, "r") as handle:
+                reports.append(list(parse_pdf.read_lines(handle)))
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=5, help="The number of synthetic reports.")
+    parser.add_argument("--incidents", type=int, default=1000, help="Incidents in each synthetic report.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--txt", nargs="*", default=["txt"], help="Directories or globs of real report text files.")
+    parser.add_argument("--out", default=None, help="A file to write the JSON results to, instead of stdout.")
+    args = parser.parse_args()
+
+    results = [benchmark("synthetic", synthetic_reports(args.days, args.incidents, args.seed))]
+    reports = real_reports(args.txt)
+    if reports:
+        results.append(benchmark("real", reports))
+
+    output = json.dumps({"python" : sys.version.split()[0],
+                         "max_rss_kb" : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                         "results" : results}, indent=2)
+    if args.out:
+        with open(args.out, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+""" Times the queries the importer and geocoder lean on, with and without the indexes added
+    by migration 003, on a Postgres database seeded with synthetic reports. The indexes
+    are dropped inside a transaction which is rolled back afterwards, but that locks the
+    tables while it runs, so point this at a scratch database.
+
+    python migrate.py --create --db-url postgresql:///keene_bench
+    python benchmarks/queries.py --db-url postgresql:///keene_bench --seed-days 365
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import parse_pdf
+import sinks
+import synthetic
+
+# the migration 003 indexes, as (statement dropping the constraint, if any, index name)
+INDEXES = [
+    ("alter table officer drop constraint if exists officer_number_key", "officer_number_key"),
+    ("alter table dispatcher drop constraint if exists dispatcher_number_key", "dispatcher_number_key"),
+    ("alter table incident drop constraint if exists incident_report_id_key", "incident_report_id_key"),
+    (None, "responding_officer_incident_id_idx"),
+    (None, "responding_officer_officer_id_idx"),
+    (None, "location_change_incident_id_idx"),
+    (None, "arrest_incident_id_idx"),
+    (None, "summons_incident_id_idx"),
+    (None, "protective_custody_incident_id_idx"),
+    (None, "incident_call_taker_id_idx"),
+    (None, "incident_primary_officer_id_idx"),
+    (None, "incident_ungeocoded_idx"),
+]
+
+QUERIES = {
+    "officer_by_number" : "select id from officer where number = %(number)s",
+    "incident_by_report_id" : "select id from incident where report_id = %(report_id)s",
+    "geocode_backlog" : "select id, location from incident where latitude is null and location is not null",
+    "backlog_locations" : "select distinct location from incident where latitude is null",
+    "children_of_report_date" : "select count(*) from responding_officer where incident_id in "
+                                "(select id from incident where dispatch_time >= %(start)s and dispatch_time < %(end)s)",
+    "responses_of_officer" : "select count(*) from responding_officer where officer_id = %(officer_id)s",
+}
+
+def seed(db_url, days, incidents, geocoded_fraction):
+    """ Loads `days` synthetic reports, then gives coordinates to all but
+        `1 - geocoded_fraction` of the incidents so the geocoder has a backlog
+    """
+    sink = sinks.open_sink(db_url)
+    start = datetime.date(2015, 1, 1)
+    try:
+        for day in range(days):
+            report_date = start + datetime.timedelta(days=day)
+            lines = iter(synthetic.generate_report(report_date, incidents, day, day * incidents + 1))
+            sink.begin()
+            sink.replace_report_date(report_date)
+            for record in parse_pdf.read_records(lines, parse_pdf.read_report_date(lines), sink.officers, sink.dispatchers):
+                sink.add(record)
+            sink.flush()
+            sink.commit()
+        modulus = max(2, int(round(1 / max(1 - geocoded_fraction, 0.0001))))
+        sink.connection.execute("update incident set latitude = 42.93, longitude = -72.28 "
+                                "where latitude is null and id % {0} <> 0".format(modulus))
+    finally:
+        sink.close()
+
+def explain(cursor, sql, params):
+    """ Runs a query under EXPLAIN ANALYZE, returning its execution time and the scans it used """
+    cursor.execute("explain (analyze, format json) " + sql, params)
+    plan = cursor.fetchone()[0][0]
+    scans = []
+    nodes = [plan["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"].endswith("Scan"):
+            scans.append("{0} on {1}".format(node["Node Type"], node.get("Index Name") or node.get("Relation Name")))
+        nodes.extend(node.get("Plans", []))
+    return plan["Execution Time"], scans
+
+def run_queries(cursor, params, repeat):
+    results = {}
+    for name, sql in sorted(QUERIES.items()):
+        explain(cursor, sql, params) # warm the cache
+        times = []
+        for _ in range(repeat):
+            ms, scans = explain(cursor, sql, params)
+            times.append(ms)
+        results[name] = {"ms" : round(sorted(times)[len(times) // 2], 3), "scans" : scans}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db-url", required=True, help="A scratch Postgres database, migrated to the latest schema.")
+    parser.add_argument("--seed-days", type=int, default=0, help="Load this many synthetic reports first.")
+    parser.add_argument("--incidents", type=int, default=300, help="Incidents in each synthetic report.")
+    parser.add_argument("--geocoded", type=float, default=0.9, help="The fraction of seeded incidents to give coordinates.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.seed_days:
+        seed(args.db_url, args.seed_days, args.incidents, args.geocoded)
+
+    sink = sinks.open_sink(args.db_url)
+    connection = sink.connection.connection
+    cursor = connection.cursor()
+    try:
+        cursor.execute("analyze")
+        cursor.execute("select number from officer order by id desc limit 1")
+        number = cursor.fetchone()[0]
+        cursor.execute("select id from officer where number = %s", (number,))
+        officer_id = cursor.fetchone()[0]
+        cursor.execute("select report_id, dispatch_time from incident order by id desc limit 1")
+        report_id, dispatch_time = cursor.fetchone()
+        start = datetime.datetime.combine(dispatch_time.date(), datetime.time())
+        params = {"number" : number, "officer_id" : officer_id, "report_id" : report_id,
+                  "start" : start, "end" : start + datetime.timedelta(days=1)}
+        connection.commit()
+
+        after = run_queries(cursor, params, args.repeat)
+        for drop_constraint, index in INDEXES:
+            if drop_constraint:
+                cursor.execute(drop_constraint)
+            cursor.execute("drop index if exists {0}".format(index))
+        before = run_queries(cursor, params, args.repeat)
+        connection.rollback()
+
+        cursor.execute("select count(*), count(latitude) from incident")
+        incidents, geocoded = cursor.fetchone()
+    finally:
+        cursor.close()
+        sink.close()
+
+    print(json.dumps({
+        "incidents" : incidents,
+        "geocoded" : geocoded,
+        "queries" : dict((name, {"before" : before[name], "after" : after[name],
+                                 "speedup" : round(before[name]["ms"] / after[name]["ms"], 1) if after[name]["ms"] else None})
+                         for name in QUERIES),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+""" Times building a `spatial.SpatialIndex` over synthetic incidents scattered around Keene,
+    and radius, bounding box and nearest neighbor queries against it, compared with a
+    scan of every point. With --db-url the same queries are also run in that database.
+
+    python benchmarks/spatial.py --points 1000000
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import db
+import spatial
+
+KEENE = (42.9337, -72.2781)
+
+def generate_points(count, seed=0):
+    """ Returns (id, latitude, longitude, dispatch time) tuples within about 8km of downtown,
+        bunched toward the center like real incidents
+    """
+    rng = random.Random(seed)
+    first = datetime.datetime(2012, 1, 1)
+    points = []
+    for i in range(1, count + 1):
+        points.append((i, KEENE[0] + rng.gauss(0, 0.02), KEENE[1] + rng.gauss(0, 0.025),
+                       first + datetime.timedelta(seconds=rng.randrange(5 * 365 * 86400))))
+    return points
+
+def timed(function, queries):
+    """ Runs `function` on each of `queries`, returning the mean microseconds per query and the results """
+    start = time.perf_counter()
+    results = [function(*q) for q in queries]
+    return round((time.perf_counter() - start) / len(queries) * 1e6, 1), results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius", type=float, default=250, help="Meters.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--scan-queries", type=int, default=5, help="Queries to answer with a full scan for comparison.")
+    parser.add_argument("--db-url", help="Also run the queries in this database.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    points = generate_points(args.points, args.seed)
+    start = time.perf_counter()
+    index = spatial.SpatialIndex()
+    for point in points:
+        index.add(*point)
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(args.seed + 1)
+    centers = [(KEENE[0] + rng.gauss(0, 0.02), KEENE[1] + rng.gauss(0, 0.025)) for _ in range(args.queries)]
+    window = (datetime.datetime(2014, 1, 1), datetime.datetime(2015, 1, 1))
+
+    def scan(lat, lon):
+        return sorted((d, p[0]) for d, p in ((spatial.distance(lat, lon, p[1], p[2]), p) for p in points)
+                      if d <= args.radius)
+
+    results = {"points" : args.points, "cells" : len(index.cells), "build_seconds" : round(build_seconds, 2)}
+    us, radius_results = timed(lambda lat, lon: index.within_radius(lat, lon, args.radius), centers)
+    results["radius_us"] = us
+    results["radius_mean_hits"] = round(sum(len(r) for r in radius_results) / float(len(radius_results)), 1)
+    results["radius_window_us"] = timed(lambda lat, lon: index.within_radius(lat, lon, args.radius, *window), centers)[0]
+    results["box_us"] = timed(lambda lat, lon: index.within_box(*spatial.bounding_box(lat, lon, args.radius)), centers)[0]
+    results["nearest_us"] = timed(lambda lat, lon: index.nearest(lat, lon, args.k), centers)[0]
+    results["nearest_window_us"] = timed(lambda lat, lon: index.nearest(lat, lon, args.k, *window), centers)[0]
+
+    scanned = centers[:args.scan_queries]
+    us, scan_results = timed(scan, scanned)
+    results["scan_radius_us"] = us
+    results["scan_agrees"] = scan_results == radius_results[:len(scanned)]
+
+    if args.db_url:
+        connection = db.create_db_engine(args.db_url).connect()
+        results["db_radius_us"] = timed(lambda lat, lon: spatial.query_radius(connection, lat, lon, args.radius), centers)[0]
+        results["db_nearest_us"] = timed(lambda lat, lon: spatial.query_nearest(connection, lat, lon, args.k), centers)[0]
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
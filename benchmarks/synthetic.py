@@ -0,0 +1,117 @@
+""" Generates synthetic daily logs in the layout of the text `pdftotext -raw` produces
+    from the Keene police logs, for benchmarking the parser without the real archive.
+
+    python benchmarks/synthetic.py --days 30 --incidents 400 --out synthetic_txt/
+"""
+import argparse
+import datetime
+import os
+import random
+
+SOURCES = ["Phone", "Officer", "Walk-In", "911", "Radio"]
+CATEGORIES = ["SUSPICIOUS ACTIVITY", "MOTOR VEHICLE STOP", "ALARM", "ASSIST OTHER AGENCY",
+              "NOISE COMPLAINT", "PARKING VIOLATION", "BUILDING CHECK", "ANIMAL COMPLAINT"]
+OUTCOMES = ["Services Rendered", "Citation Issued", "Checked/Secured", "Report Taken",
+            "Gone On Arrival", "Warning Issued", "Unfounded"]
+STREETS = ["MAIN ST", "COURT ST", "WASHINGTON ST", "WINCHESTER ST", "WEST ST", "MARLBORO ST",
+           "ROXBURY ST", "ELM ST", "SCHOOL ST", "GILBO AVE", "KEY RD", "PARK AVE", "ISLAND ST"]
+LAST_NAMES = ["SMITH", "JONES", "BROWN", "DOE", "ROE", "ADAMS", "BAKER", "CLARK", "LEWIS", "O'BRIEN"]
+FIRST_NAMES = ["JOHN", "JANE", "AMY", "BOB", "RICK", "SUE", "TOM", "ANN", "MARK", "LISA"]
+CHARGES = ["Theft", "Criminal Mischief", "Simple Assault", "Disorderly Conduct",
+           "Driving After Revocation", "Possession of Controlled Drug"]
+
+def person(rand):
+    return "{0}, {1}".format(rand.choice(LAST_NAMES), rand.choice(FIRST_NAMES))
+
+def clock(report_date, moment):
+    """ Formats a time the way the logs do: HH:MM:SS on the day of the report,
+        MM/DD/YYYY @ HH:MM:SS after it
+    """
+    if moment.date() == report_date:
+        return moment.strftime("%H:%M:%S")
+    return moment.strftime("%m/%d/%Y @ %H:%M:%S")
+
+def location(rand):
+    kind = rand.random()
+    if kind < 0.5:
+        return ["Location/Address: [KEE {0}] {1} {2}".format(rand.randint(1, 999), rand.randint(1, 400), rand.choice(STREETS))]
+    elif kind < 0.7:
+        return ["Location: {0} @ 0 {1}".format(rand.choice(STREETS), rand.choice(STREETS))]
+    elif kind < 0.85:
+        return ["Vicinity of: {0}".format(rand.choice(STREETS))]
+    # the address wraps onto a second line
+    return ["Location/Address: [KEE {0}] {1} {2} - CHESHIRE".format(rand.randint(1, 999), rand.randint(1, 400), rand.choice(STREETS)),
+            "MEDICAL CENTER"]
+
+def refer(rand, year, number):
+    kind, tag = rand.choice([("Arrest", "Arrest:"), ("Summons", "Summons:"), ("P/C", "P/C:")])
+    suffix = {"Arrest" : "AR", "Summons" : "SU", "P/C" : "PC"}[kind]
+    lines = [
+        "Refer To {0}: {1:02d}-{2}-{3}".format(kind, year, number, suffix),
+        "{0} {1}".format(tag, person(rand)),
+        "Address: {0} {1} Keene, NH".format(rand.randint(1, 400), rand.choice(STREETS).title()),
+        "Age: {0}".format(rand.randint(17, 80)),
+        "Charges: {0}".format(rand.choice(CHARGES)),
+    ]
+    if rand.random() < 0.3:
+        lines.append(rand.choice(CHARGES))
+    return lines
+
+def generate_report(report_date, incidents, seed=0, first_number=1):
+    """ Returns the lines of a synthetic report for `report_date` with `incidents` records """
+    rand = random.Random(seed)
+    year = report_date.year % 100
+    lines = ["For Date: {0} - {1}".format(report_date.strftime("%m/%d/%Y"), report_date.strftime("%A")),
+             "Call Number Time Call Reason Action"]
+
+    start = datetime.datetime.combine(report_date, datetime.time())
+    minutes = sorted(rand.randint(0, 24 * 60 - 1) for _ in range(incidents))
+    for i, minute in enumerate(minutes):
+        dispatched = start + datetime.timedelta(minutes=minute)
+        lines.append("{0:02d}-{1} {2} {3} - {4} {5}".format(year, first_number + i, dispatched.strftime("%H%M"),
+            rand.choice(SOURCES), rand.choice(CATEGORIES), rand.choice(OUTCOMES)))
+        lines.append("Call Taker: {0} - {1}".format(rand.randint(100, 130), person(rand)))
+        lines.extend(location(rand))
+        if rand.random() < 0.2:
+            lines.append("Lat: 42.{0:06d} Lon: -72.{1:06d}".format(rand.randint(900000, 960000), rand.randint(250000, 310000)))
+        if rand.random() < 0.6:
+            lines.append("Primary Id: {0} - {1}".format(rand.randint(1, 80), person(rand)))
+
+        for _ in range(rand.randint(0, 3)):
+            lines.append("ID: {0} - {1}".format(rand.randint(1, 80), person(rand)))
+            disp = dispatched + datetime.timedelta(seconds=rand.randint(0, 300))
+            arvd = disp + datetime.timedelta(seconds=rand.randint(60, 900))
+            clrd = arvd + datetime.timedelta(seconds=rand.randint(60, 7200))
+            lines.append("Disp-{0} Arvd-{1} Clrd-{2}".format(clock(report_date, disp),
+                clock(report_date, arvd), clock(report_date, clrd)))
+
+        if rand.random() < 0.05:
+            lines.append("Location Change: {0} [Modified: {1}]".format(rand.choice(STREETS),
+                dispatched.strftime("%m/%d/%Y%H%M")))
+        if rand.random() < 0.1:
+            lines.extend(refer(rand, year, first_number + i))
+        lines.append("Jurisdiction: Keene")
+        if rand.random() < 0.5:
+            lines.append("Call Closed By: {0}".format(person(rand)))
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=30, help="The number of daily reports to write.")
+    parser.add_argument("--incidents", type=int, default=400, help="The number of incidents in each report.")
+    parser.add_argument("--start", default="2015-01-01", help="The date of the first report, as YYYY-MM-DD.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="synthetic_txt", help="The directory to write the reports to.")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+    start = datetime.datetime.strptime(args.start, "%Y-%m-%d").date()
+    for day in range(args.days):
+        report_date = start + datetime.timedelta(days=day)
+        lines = generate_report(report_date, args.incidents, args.seed + day, day * args.incidents + 1)
+        with open(os.path.join(args.out, report_date.strftime("%Y-%m-%d.txt")), "w") as handle:
+            handle.write("\n".join(lines) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+""" Compares the strptime parsing `read_record` used for the Disp/Arvd/Clrd times, record
+    header times and location change dates with the fast parsers of `timeparse`, over the
+    timestamps of synthetic reports and any real report text files. The new parsers are
+    timed with their memos empty and again once they're warm.
+
+    python benchmarks/timestamps.py --days 30 --txt txt/
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import parse_pdf
+import synthetic
+import timeparse
+
+def legacy_parse(kind, value, day):
+    """ The strptime parsing done before `timeparse` """
+    if kind == "clock":
+        if len(value) == 8:
+            return datetime.datetime.combine(day, datetime.datetime.strptime(value, "%H:%M:%S").time())
+        return datetime.datetime.strptime(value, "%m/%d/%Y @ %H:%M:%S")
+    elif kind == "header":
+        return datetime.datetime.combine(day, datetime.datetime.strptime(value, "%H%M").time())
+    return datetime.datetime.strptime(value, "%m/%d/%Y%H%M")
+
+def fast_parse(kind, value, day):
+    if kind == "clock":
+        if len(value) == 8:
+            return timeparse.on_day(day, value)
+        return timeparse.parse_stamp(value)
+    elif kind == "header":
+        return datetime.datetime.combine(day, timeparse.parse_hhmm(value))
+    return timeparse.parse_compact_stamp(value)
+
+def clear_memos():
+    for parser in (timeparse.parse_clock, timeparse.parse_hhmm, timeparse.parse_stamp,
+                   timeparse.parse_compact_stamp):
+        parser.cache_clear()
+
+def find_timestamps(reports):
+    """ Returns the (kind, value, report date) of every timestamp in `reports`, lists of lines """
+    timestamps = []
+    for lines in reports:
+        lines = iter(lines)
+        day = parse_pdf.read_report_date(lines).date()
+        for line in lines:
+            header = parse_pdf.HEADER_RE.match(line)
+            modified = parse_pdf.MODIFIED_RE.search(line)
+            arrival = parse_pdf.ARRIVAL_RE.match(line) if line.startswith(("Disp-", "Arvd-", "Clrd-")) else None
+            if header:
+                timestamps.append(("header", header.group("time"), day))
+            elif modified:
+                timestamps.append(("modified", modified.group("moddate").strip(), day))
+            elif arrival:
+                timestamps.extend(("clock", arrival.group(name), day) for name in ("disptime", "arvtime", "clrdtime")
+                                  if arrival.group(name))
+    return timestamps
+
+def time_parser(parse, timestamps, repeat, before_each=None):
+    best = None
+    for _ in range(repeat):
+        if before_each is not None:
+            before_each()
+        start = time.perf_counter()
+        for kind, value, day in timestamps:
+            parse(kind, value, day)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(timestamps) / best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=30, help="The number of synthetic reports.")
+    parser.add_argument("--incidents", type=int, default=300, help="Incidents in each synthetic report.")
+    parser.add_argument("--txt", nargs="*", default=[], help="Directories or globs of real report text files.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each parser; the best is reported.")
+    args = parser.parse_args()
+
+    start = datetime.date(2015, 1, 1)
+    reports = [synthetic.generate_report(start + datetime.timedelta(days=day), args.incidents, day, day * args.incidents + 1)
+               for day in range(args.days)]
+    for source in args.txt:
+        paths = sorted(glob.glob(os.path.join(source, "*.txt"))) if os.path.isdir(source) else sorted(glob.glob(source))
+        for path in paths:
+            with open(path, "r") as handle:
+                reports.append(list(parse_pdf.read_lines(handle)))
+
+    timestamps = find_timestamps(reports)
+    mismatches = sum(1 for kind, value, day in timestamps if legacy_parse(kind, value, day) != fast_parse(kind, value, day))
+    before = time_parser(legacy_parse, timestamps, args.repeat)
+    cold = time_parser(fast_parse, timestamps, args.repeat, clear_memos)
+    warm = time_parser(fast_parse, timestamps, args.repeat)
+    print(json.dumps({
+        "timestamps" : len(timestamps),
+        "distinct_values" : len(set((kind, value) for kind, value, day in timestamps)),
+        "mismatches" : mismatches,
+        "strptime_per_sec" : round(before),
+        "cold_per_sec" : round(cold),
+        "warm_per_sec" : round(warm),
+        "cold_speedup" : round(cold / before, 2),
+        "warm_speedup" : round(warm / before, 2),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
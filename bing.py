@@ -0,0 +1,302 @@
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import instrument
+import io
+import os
+import random
+import threading
+import time
+import requests
+import normalize
+
+DATAFLOW_URL = "http://spatial.virtualearth.net/REST/v1/Dataflows/Geocode"
+LOCATIONS_URL = "http://dev.virtualearth.net/REST/v1/Locations"
+
+# the most addresses a single Dataflow job may hold
+BATCH_LIMIT = 200000
+
+# requests per second allowed by our key, and the burst we allow ourselves
+RATE_LIMIT = 5
+BURST = 5
+
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5
+# seconds to wait to connect, and then between bytes, before retrying a request
+TIMEOUT = 30
+RETRY_STATUSES = set([429, 500, 502, 503, 504])
+
+DATAFLOW_HEADER = "Bing Spatial Data Services|2.0"
+REQUEST_FIELDS = ["Id", "GeocodeRequest/Culture", "GeocodeRequest/Address/AddressLine",
+                  "GeocodeRequest/Address/AdminDistrict", "GeocodeRequest/Address/CountryRegion",
+                  "GeocodeRequest/Address/PostalCode", "GeocodeRequest/Address/PostalTown"]
+
+class GeocodeError(Exception):
+    pass
+
+class AuthenticationError(Exception):
+    pass
+
+class TokenBucket(object):
+    """ Limits callers of `acquire` to `rate` per second on average,
+        allowing bursts of up to `capacity`. Safe to share between threads.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+class ClientStats(object):
+    """ Counts the requests made by a client and how long they took """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latencies = []
+
+    def record(self, latency, retried, failed, timed_out=False):
+        """ Records an attempt at a request. A failed one got an error status, or no
+            response at all if the connection failed or `timed_out`.
+        """
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            instrument.METRICS.observe("bing_request_seconds", latency)
+            if failed:
+                instrument.METRICS.count("bing_request_errors_total")
+            if timed_out:
+                instrument.METRICS.count("bing_request_timeouts_total")
+            if retried:
+                self.retries += 1
+            if failed:
+                self.errors += 1
+            if timed_out:
+                self.timeouts += 1
+
+    def summary(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            elapsed = time.time() - self.started
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 4)
+
+        return {
+            "requests" : self.requests,
+            "retries" : self.retries,
+            "errors" : self.errors,
+            "timeouts" : self.timeouts,
+            "requests_per_sec" : round(self.requests / elapsed, 2) if elapsed else None,
+            "latency_p50" : percentile(0.5),
+            "latency_p90" : percentile(0.9),
+            "latency_p99" : percentile(0.99),
+        }
+
+class BingClient(object):
+    """ A client for the Bing Maps Locations and Dataflow geocoding APIs.
+        Requests share a pool of keep-alive connections, are held to `rate`
+        per second and retried with jittered backoff when the service is busy,
+        unreachable or takes longer than `timeout` seconds to answer.
+        The service URLs can be pointed at a local stand-in server.
+    """
+
+    def __init__(self, key=None, dataflow_url=DATAFLOW_URL, locations_url=LOCATIONS_URL, session=None,
+                 rate=RATE_LIMIT, burst=BURST, pool_size=10, timeout=TIMEOUT):
+        self.key = key or os.environ.get("BING_API_KEY")
+        if not self.key:
+            raise AuthenticationError("Set BING_API_KEY to geocode with Bing")
+        self.dataflow_url = dataflow_url
+        self.locations_url = locations_url
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.stats = ClientStats()
+
+    def request(self, method, url, **kwargs):
+        """ Makes a request within the rate limit, retrying 429 and 5xx responses, failed
+            connections and timeouts after a jittered exponential backoff, or the wait
+            asked for by Retry-After. Every attempt is recorded in `stats`.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(MAX_RETRIES + 1):
+            self.bucket.acquire()
+            start = time.time()
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                self.stats.record(time.time() - start, attempt > 0, True, isinstance(e, requests.Timeout))
+                if attempt == MAX_RETRIES:
+                    raise
+                r = None
+            else:
+                self.stats.record(time.time() - start, attempt > 0, r.status_code >= 400)
+                if r.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    return r
+
+            delay = random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+            if r is not None and r.headers.get("Retry-After", "").isdigit():
+                delay = max(delay, int(r.headers["Retry-After"]))
+            time.sleep(delay)
+
+    def submit_job(self, queries):
+        """ Starts a Dataflow job geocoding `queries`, a list of (id, address) pairs,
+            and returns the id of the job
+        """
+        if len(queries) > BATCH_LIMIT:
+            raise ValueError("A Dataflow job can hold at most {0} addresses".format(BATCH_LIMIT))
+        content = io.StringIO()
+        content.write(DATAFLOW_HEADER + "\n")
+        writer = csv.DictWriter(content, fieldnames=REQUEST_FIELDS, delimiter="|", lineterminator="\n")
+        writer.writeheader()
+        for query_id, address in queries:
+            writer.writerow({
+                "Id" : str(query_id),
+                "GeocodeRequest/Culture" : "en-US",
+                "GeocodeRequest/Address/AddressLine" : address,
+                "GeocodeRequest/Address/AdminDistrict" : "NH",
+                "GeocodeRequest/Address/CountryRegion" : "US",
+                "GeocodeRequest/Address/PostalCode" : "03431",
+                "GeocodeRequest/Address/PostalTown" : "Keene"
+            })
+
+        r = self.request("POST", self.dataflow_url,
+                params={"input" : "pipe", "output" : "json", "key" : self.key},
+                data=content.getvalue().encode("utf-8"),
+                headers={"Content-Type" : "text/plain; charset=utf-8"})
+        if r.status_code != 201:
+            raise GeocodeError("Bad status code {0} from {1}".format(r.status_code, self.dataflow_url))
+        return r.json()["resourceSets"][0]["resources"][0]["id"]
+
+    def job_status(self, job_id):
+        """ Returns the status of a Dataflow job ("Pending", "Completed" or "Aborted")
+            and its links keyed by role, such as "succeeded" and "failed"
+        """
+        r = self.request("GET", "{0}/{1}".format(self.dataflow_url, job_id),
+                params={"output" : "json", "key" : self.key})
+        if r.status_code != 200:
+            raise GeocodeError("Bad status code {0} checking job {1}".format(r.status_code, job_id))
+        resource = r.json()["resourceSets"][0]["resources"][0]
+        links = dict((link["role"], link["url"]) for link in resource.get("links", []))
+        return (resource["status"], links)
+
+    def download(self, url):
+        """ Yields each row of the results of a Dataflow job at `url` as a dict """
+        r = self.request("GET", url, params={"key" : self.key}, stream=True)
+        if r.status_code != 200:
+            raise GeocodeError("Bad status code {0} downloading {1}".format(r.status_code, url))
+        r.encoding = r.encoding or "utf-8"
+        lines = r.iter_lines(decode_unicode=True)
+        for line in lines:
+            if line.strip():
+                break # the first line names the schema version
+        for row in csv.DictReader(lines, delimiter="|"):
+            yield row
+
+    def geocode(self, query_text):
+        """ Geocodes a single address, trying a structured query and then an unstructured one.
+            Returns the formatted address, the (latitude, longitude) and the confidence.
+        """
+        try:
+            return self.run_structured_query(query_text)
+        except GeocodeError:
+            return self.run_unstructured_query(query_text)
+
+    def run_structured_query(self, query_text):
+        r = self.request("GET", "{0}/US/NH/03431/Keene/{1}".format(self.locations_url, query_text),
+                params = {
+                    "includeNeighborhood" : 1,
+                    "key" : self.key
+                })
+        return handle_result(query_text, r)
+
+    def run_unstructured_query(self, query_text):
+        r = self.request("GET", self.locations_url + "/",
+                params = {
+                    "query" : query_text + " Keene, NH",
+                    "includeNeighborhood" : 1,
+                    "key" : self.key
+                })
+        return handle_result(query_text, r)
+
+class ConcurrentGeocoder(object):
+    """ Runs single-address lookups through a `BingClient` on a pool of threads.
+        Lookups of the same normalized address while one is in flight share its result.
+    """
+
+    def __init__(self, client, workers=4):
+        self.client = client
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.in_flight = {}
+        self.lock = threading.RLock()
+
+    def submit(self, query_text):
+        """ Returns a future for the result of `BingClient.geocode` on `query_text` """
+        key = normalize.address_key(query_text)
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is None:
+                future = self.pool.submit(self.client.geocode, query_text)
+                self.in_flight[key] = future
+                future.add_done_callback(lambda f: self.forget(key))
+        return future
+
+    def forget(self, key):
+        with self.lock:
+            self.in_flight.pop(key, None)
+
+    def close(self):
+        self.pool.shutdown()
+
+def handle_result(query_text, r):
+    if r.status_code != 200:
+        raise GeocodeError("Failed to geocode in a with query {0}".format(query_text))
+
+    resources = r.json()["resourceSets"][0]["resources"]
+    if resources:
+        resource = resources[0]
+    else:
+        raise GeocodeError("No matches found for {0}".format(query_text))
+
+    if set(["Good"]) != set(resource["matchCodes"]):
+        raise GeocodeError("Bad match quality for {0}".format(query_text))
+
+    return (resource["address"]["formattedAddress"], resource["point"]["coordinates"], resource.get("confidence"))
+
+def read_dataflow_row(row):
+    """ Returns the formatted address, (latitude, longitude) and confidence from a row of
+        Dataflow results, or None if the address wasn't matched well
+    """
+    latitude = row.get("GeocodeResponse/Point/Latitude")
+    longitude = row.get("GeocodeResponse/Point/Longitude")
+    match_codes = set(c.strip() for c in (row.get("GeocodeResponse/MatchCodes") or "").split(",") if c.strip())
+    if not latitude or not longitude or match_codes != set(["Good"]):
+        return None
+    return (row.get("GeocodeResponse/Address/FormattedAddress"), (float(latitude), float(longitude)),
+            row.get("GeocodeResponse/Confidence"))
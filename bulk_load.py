@@ -0,0 +1,236 @@
+import csv
+import io
+import psycopg2.extras
+import normalize
+
+class BulkLoader(object):
+    """ Stages parsed records in memory and writes them to Postgres with a
+        single COPY per table. Ids are drawn from each table's sequence up
+        front, one round trip per table, so the foreign keys of the child
+        rows can be filled in before anything is sent to the server.
+
+        Records from any number of files can be staged before calling `flush`.
+        Everything flushed since the last `commit` is remembered until then, so
+        that `rollback` can forget the ids it was given.
+    """
+
+    COLUMNS = {
+        "dispatcher" : ["id", "number", "first_name", "last_name"],
+        "officer" : ["id", "number", "last_name", "first_name"],
+        "incident" : ["id", "report_id", "dispatch_time", "dispatch_source", "category", "outcome",
+                      "call_taker_id", "primary_officer_id", "location", "latitude", "longitude",
+                      "jurisdiction", "aux_event_type", "aux_event_key"],
+        "responding_officer" : ["id", "incident_id", "officer_id", "dispatch_time", "arrival_time", "cleared_time"],
+        "location_change" : ["id", "incident_id", "location", "change_date"],
+        "arrest" : ["id", "incident_id", "first_name", "last_name", "age_at_arrest", "charges", "address"],
+        "summons" : ["id", "incident_id", "first_name", "last_name", "age_at_summons", "charges", "address"],
+        "protective_custody" : ["id", "incident_id", "first_name", "last_name", "address", "age_at_custody", "charges"],
+    }
+
+    # parents come before the rows which reference them
+    TABLE_ORDER = ["dispatcher", "officer", "incident", "responding_officer",
+                   "location_change", "arrest", "summons", "protective_custody"]
+
+    def __init__(self, connection, officers, dispatchers):
+        """ `connection` is a SQLAlchemy connection to Postgres, and `officers` and
+            `dispatchers` are the `identity.IdentityCache` instances the records were parsed with
+        """
+        self.connection = connection
+        self.officers = officers
+        self.dispatchers = dispatchers
+        self.records = []
+        self.assigned = []
+
+    def add(self, record):
+        """ Stages a `parse_pdf.Record` to be written on the next flush """
+        self.records.append(record)
+
+    def flush(self):
+        """ Writes every staged record, returning the number of rows written to each table.
+            An incident whose report_id is already in the table is skipped along with its
+            child rows, so loading the same report twice changes nothing.
+        """
+        rows = self.build_rows()
+        for table in self.TABLE_ORDER:
+            if table == "incident":
+                written = self.write_incidents(rows[table])
+                if len(written) < len(rows[table]):
+                    rows = self.only_incidents(rows, written)
+            elif rows[table]:
+                self.write_rows(table, self.COLUMNS[table], rows[table])
+        self.records = []
+        return dict((table, len(table_rows)) for table, table_rows in rows.items())
+
+    def commit(self):
+        """ Called once the transaction holding the flushed rows has been committed """
+        self.assigned = []
+
+    def rollback(self):
+        """ Drops the staged records after the transaction is rolled back, forgetting the
+            ids handed to new people since the last commit so they're written again
+            by the next flush
+        """
+        for person in self.assigned:
+            person.id = None
+        self.records = []
+        self.assigned = []
+
+    def build_rows(self):
+        """ Assigns ids to the staged records and the people created while parsing
+            them, returning the tuples to write keyed by table name
+        """
+        rows = dict((table, []) for table in self.TABLE_ORDER)
+
+        # records parsed elsewhere may name people this loader hasn't seen yet
+        for record in self.records:
+            for cache, person in self.people(record):
+                cache.get_or_create(person.number, person.first_name, person.last_name)
+
+        for table, cache in (("dispatcher", self.dispatchers), ("officer", self.officers)):
+            new_people = [p for p in cache.by_number.values() if p.id is None]
+            rows[table] = self.assign_ids(table, new_people)
+            self.assigned.extend(new_people)
+
+        # a report sometimes lists an incident twice; only the first is kept. Incidents
+        # loaded before are left to `write_incidents`, since the table may have changed
+        # since, say by `replace_report_date`.
+        records = []
+        report_ids = set()
+        for record in self.records:
+            report_id = record.incident.report_id
+            if report_id is not None:
+                if report_id in report_ids:
+                    continue
+                report_ids.add(report_id)
+            records.append(record)
+
+        # spelled the same way however the report spaced or wrapped them, all at once
+        locations = normalize.canonical_locations([record.incident.location for record in records])
+        incident_ids = self.reserve_ids("incident", len(records))
+        children = {
+            "responding_officer" : [],
+            "location_change" : [],
+            "arrest" : [],
+            "summons" : [],
+            "protective_custody" : [],
+        }
+        for record, incident_id, location in zip(records, incident_ids, locations):
+            incident = record.incident
+            rows["incident"].append((incident_id, incident.report_id, incident.dispatch_time,
+                incident.dispatch_source, incident.category, incident.outcome,
+                self.person_id(self.dispatchers, incident.call_taker),
+                self.person_id(self.officers, incident.primary_officer),
+                location, incident.latitude, incident.longitude,
+                incident.jurisdiction, incident.aux_event_type, incident.aux_event_key))
+
+            for response in record.responding_officers:
+                children["responding_officer"].append((incident_id, self.person_id(self.officers, response.officer),
+                    response.dispatch_time, response.arrival_time, response.cleared_time))
+            for change in record.location_changes:
+                children["location_change"].append((incident_id, change.location, change.change_date))
+            for arrest in record.arrests:
+                children["arrest"].append((incident_id, arrest.first_name, arrest.last_name,
+                    arrest.age_at_arrest, arrest.charges, arrest.address))
+            for summons in record.summons:
+                children["summons"].append((incident_id, summons.first_name, summons.last_name,
+                    summons.age_at_summons, summons.charges, summons.address))
+            for custody in record.custodies:
+                children["protective_custody"].append((incident_id, custody.first_name, custody.last_name,
+                    custody.address, custody.age_at_custody, custody.charges))
+
+        for table, table_rows in children.items():
+            ids = self.reserve_ids(table, len(table_rows))
+            rows[table] = [(row_id,) + row for row_id, row in zip(ids, table_rows)]
+        return rows
+
+    def assign_ids(self, table, people):
+        """ Gives ids to people new to this loader and returns the rows to write for them.
+            They're upserted on their badge number straight away, so someone added by
+            another import since the cache was loaded keeps the id they already have.
+        """
+        if not people:
+            return []
+        columns = [c for c in self.COLUMNS[table] if c != "id"]
+        cursor = self.connection.connection.cursor()
+        try:
+            ids = dict((number, person_id) for person_id, number in psycopg2.extras.execute_values(cursor,
+                "insert into {0} ({1}) values %s on conflict (number) do update set number = excluded.number "
+                "returning id, number".format(table, ", ".join(columns)),
+                [tuple(getattr(p, c) for c in columns) for p in people], fetch=True))
+        finally:
+            cursor.close()
+        for person in people:
+            person.id = ids[person.number]
+        return []
+
+    def reserve_people_ids(self, table, people):
+        """ Gives ids to new people from the table's ids, returning their rows to be written with the rest """
+        for person, new_id in zip(people, self.reserve_ids(table, len(people))):
+            person.id = new_id
+        return [tuple(getattr(p, c) for c in self.COLUMNS[table]) for p in people]
+
+    def people(self, record):
+        """ Yields each officer and dispatcher referenced by `record`, paired with its cache """
+        if record.incident.call_taker is not None:
+            yield (self.dispatchers, record.incident.call_taker)
+        if record.incident.primary_officer is not None:
+            yield (self.officers, record.incident.primary_officer)
+        for response in record.responding_officers:
+            yield (self.officers, response.officer)
+
+    def person_id(self, cache, person):
+        """ Maps an officer or dispatcher to the id of the canonical entry in `cache` """
+        if person is None:
+            return None
+        return cache.by_number[person.number].id
+
+    def write_incidents(self, rows):
+        """ Writes incident rows, skipping those whose report_id was loaded before, and returns
+            the ids of those written. The rows are copied to a temporary table first, then
+            moved into `incident` with ON CONFLICT DO NOTHING.
+        """
+        if not rows:
+            return set()
+        columns = ", ".join(self.COLUMNS["incident"])
+        cursor = self.connection.connection.cursor()
+        try:
+            cursor.execute("create temporary table if not exists incident_staging (like incident including defaults)")
+            copy_rows(cursor, "incident_staging", self.COLUMNS["incident"], rows)
+            cursor.execute("insert into incident ({0}) select {0} from incident_staging "
+                           "on conflict (report_id) do nothing returning id".format(columns))
+            written = set(row[0] for row in cursor.fetchall())
+            cursor.execute("truncate incident_staging")
+        finally:
+            cursor.close()
+        return written
+
+    def only_incidents(self, rows, incident_ids):
+        """ Keeps just the incident rows in `incident_ids`, and the child rows which reference them """
+        rows = dict(rows)
+        rows["incident"] = [row for row in rows["incident"] if row[0] in incident_ids]
+        for table in self.TABLE_ORDER[self.TABLE_ORDER.index("incident") + 1:]:
+            rows[table] = [row for row in rows[table] if row[1] in incident_ids]
+        return rows
+
+    def write_rows(self, table, columns, rows):
+        """ Writes `rows`, tuples of the values of `columns`, to `table` """
+        cursor = self.connection.connection.cursor()
+        try:
+            copy_rows(cursor, table, columns, rows)
+        finally:
+            cursor.close()
+
+    def reserve_ids(self, table, count):
+        """ Draws `count` ids from the sequence backing `table` in a single query """
+        if count == 0:
+            return []
+        result = self.connection.execute("select nextval('{0}_id_seq') from generate_series(1, %s)".format(table), count)
+        return [row[0] for row in result]
+
+def copy_rows(cursor, table, columns, rows):
+    """ Sends `rows` to `table` with COPY, using CSV so that None becomes NULL """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerows(rows)
+    buf.seek(0)
+    cursor.copy_expert("copy {0} ({1}) from stdin with (format csv)".format(table, ", ".join(columns)), buf)
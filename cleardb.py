@@ -1,9 +1,7 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-import sqlalchemy.dialects.postgresql
-import psycopg2
+import db
 
-engine = create_engine("postgresql+psycopg2:///keene_police").connect()
+engine = db.create_db_engine().connect()
+engine.execute("delete from response_rollup")
 engine.execute("delete from arrest")
 engine.execute("delete from summons")
 engine.execute("delete from protective_custody")
@@ -12,3 +10,4 @@ engine.execute("delete from location_change")
 engine.execute("delete from incident")
 engine.execute("delete from dispatcher")
 engine.execute("delete from officer")
+engine.execute("delete from ingest_ledger")
@@ -0,0 +1,15 @@
+import os
+import instrument
+from sqlalchemy import create_engine
+
+DEFAULT_URL = "postgresql+psycopg2:///keene_police_logs"
+
+def database_url(url=None):
+    """ The connection URL to use: `url` if given, then the KEENE_DB_URL
+        environment variable, then the local Postgres database
+    """
+    return url or os.environ.get("KEENE_DB_URL") or DEFAULT_URL
+
+def create_db_engine(url=None, **options):
+    """ Creates an engine for `url`, passing `options` on to `sqlalchemy.create_engine` """
+    return instrument.watch_engine(create_engine(database_url(url), **options))
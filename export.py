@@ -0,0 +1,244 @@
+import argparse
+import datetime
+import decimal
+import json
+import os
+import db
+import models
+from sqlalchemy import func, select
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# tables written by the month their incidents were dispatched in, and those small enough to write whole
+INCIDENT_TABLES = ["incident", "responding_officer", "location_change", "arrest", "summons", "protective_custody"]
+PEOPLE_TABLES = ["officer", "dispatcher"]
+
+# columns with few distinct values, which are stored once per file and referred to by index
+DICTIONARY_COLUMNS = set(["category", "outcome", "dispatch_source", "jurisdiction", "aux_event_type"])
+
+EXTENSIONS = {"parquet" : "parquet", "arrow" : "arrow"}
+STATE_FILE = "_export.json"
+
+def arrow_type(column, dictionary=True):
+    """ The Arrow type the `models` column `column` is exported as. Without `dictionary`,
+        the columns of `DICTIONARY_COLUMNS` are plain strings.
+    """
+    if dictionary and column.name in DICTIONARY_COLUMNS:
+        return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+    return {
+        int : pyarrow.int64(),
+        str : pyarrow.string(),
+        bool : pyarrow.bool_(),
+        float : pyarrow.float64(),
+        decimal.Decimal : pyarrow.float64(),
+        datetime.datetime : pyarrow.timestamp("us"),
+        datetime.date : pyarrow.date32(),
+    }[column.type.python_type]
+
+def to_arrow(table, rows):
+    """ Builds a `pyarrow.Table` from `rows`, tuples of the values of each column of `table` """
+    arrays = []
+    fields = []
+    for i, column in enumerate(table.columns):
+        kind = arrow_type(column)
+        values = [row[i] for row in rows]
+        if column.type.python_type is decimal.Decimal:
+            values = [float(v) if v is not None else None for v in values]
+        if column.name in DICTIONARY_COLUMNS:
+            array = pyarrow.array(values, pyarrow.string()).dictionary_encode()
+        else:
+            array = pyarrow.array(values, kind)
+        arrays.append(array)
+        fields.append(pyarrow.field(column.name, kind))
+    return pyarrow.Table.from_arrays(arrays, schema=pyarrow.schema(fields))
+
+def write_file(path, arrow_table, file_format):
+    """ Writes `arrow_table` to `path`, replacing it only once it's complete """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    if file_format == "parquet":
+        pyarrow.parquet.write_table(arrow_table, path + ".tmp")
+    else:
+        with pyarrow.OSFile(path + ".tmp", "wb") as handle:
+            with pyarrow.ipc.new_file(handle, arrow_table.schema) as writer:
+                writer.write_table(arrow_table)
+    os.replace(path + ".tmp", path)
+
+def read_file(path):
+    """ Reads an exported file. Arrow files are memory mapped, so their columns aren't copied. """
+    if path.endswith(".parquet"):
+        return pyarrow.parquet.read_table(path)
+    return pyarrow.ipc.open_file(pyarrow.memory_map(path, "r")).read_all()
+
+def month_path(directory, table, year, month, file_format):
+    return os.path.join(directory, table, "year={0:04d}".format(year), "month={0:02d}".format(month),
+                        "data.{0}".format(EXTENSIONS[file_format]))
+
+def month_range(year, month):
+    start = datetime.datetime(year, month, 1)
+    end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+    return (start, end)
+
+def months_between(first, last):
+    """ Every (year, month) from the month of `first` to the month of `last`, inclusive """
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = year + month // 12, month % 12 + 1
+    return months
+
+def export_month(connection, directory, year, month, file_format):
+    """ Writes every incident dispatched in a month, and the rows that hang off of them,
+        to that month's partition of each table. Returns the number of incidents.
+    """
+    start, end = month_range(year, month)
+    incident = models.Incident.__table__
+    incident_ids = select([incident.c.id]) \
+        .where(incident.c.dispatch_time >= start) \
+        .where(incident.c.dispatch_time < end)
+
+    incident_count = 0
+    for name in INCIDENT_TABLES:
+        table = models.metadata.tables[name]
+        if name == "incident":
+            query = table.select().where(table.c.dispatch_time >= start).where(table.c.dispatch_time < end)
+        else:
+            query = table.select().where(table.c.incident_id.in_(incident_ids))
+        rows = connection.execute(query.order_by(table.c.id)).fetchall()
+        path = month_path(directory, name, year, month, file_format)
+        if rows:
+            write_file(path, to_arrow(table, rows), file_format)
+        elif os.path.exists(path):
+            os.remove(path)
+        if name == "incident":
+            incident_count = len(rows)
+    return incident_count
+
+def export(connection, directory, file_format="parquet", full=False):
+    """ Exports the database to `directory`, one partition per month for the tables of
+        `INCIDENT_TABLES`. After the first run, only the months of the report dates the
+        ingest ledger says were loaded since the last run, and of incidents added or
+        geocoded since, are written again, unless `full` is set. Officers and dispatchers
+        are rewritten whole every time. Returns the months written and the number of
+        incidents in them.
+    """
+    if pyarrow is None:
+        raise ValueError("Exporting requires pyarrow")
+    if file_format not in EXTENSIONS:
+        raise ValueError("Unknown export format {0}".format(file_format))
+
+    state_path = os.path.join(directory, STATE_FILE)
+    state = None
+    if os.path.exists(state_path):
+        with open(state_path, "r") as handle:
+            state = json.load(handle)
+        if state["format"] != file_format:
+            raise ValueError("{0} holds an export in {1} format".format(directory, state["format"]))
+
+    ingest = models.IngestLedger.__table__
+    incident = models.Incident.__table__
+    # read before exporting, so anything loaded meanwhile is exported again next time
+    loaded_through = connection.execute(select([func.max(ingest.c.loaded_at)])).scalar()
+    last_incident_id = connection.execute(select([func.max(incident.c.id)])).scalar()
+    geocoded_through = connection.execute(select([func.max(incident.c.geocoded_at)])).scalar()
+
+    if state is None or full:
+        first, last = connection.execute(select([func.min(incident.c.dispatch_time),
+                                                 func.max(incident.c.dispatch_time)])).first()
+        months = months_between(first, last) if first is not None else []
+    else:
+        months = set()
+        # files the ledger says were loaded since, which may have replaced a report date
+        if state["loaded_through"] is not None:
+            since = datetime.datetime.strptime(state["loaded_through"], "%Y-%m-%dT%H:%M:%S.%f")
+            report_dates = connection.execute(select([ingest.c.report_date])
+                .where(ingest.c.loaded_at > since).where(ingest.c.report_date != None).distinct())
+            months.update((row[0].year, row[0].month) for row in report_dates)
+        # and incidents added since, such as by parse_pdf.py, which doesn't keep the ledger
+        new_incidents = select([incident.c.dispatch_time]).where(incident.c.dispatch_time != None)
+        if state["last_incident_id"] is not None:
+            new_incidents = new_incidents.where(incident.c.id > state["last_incident_id"])
+        months.update((row[0].year, row[0].month) for row in connection.execute(new_incidents))
+        # and incidents geocoded since, whose coordinates have changed
+        geocoded = select([incident.c.dispatch_time]).where(incident.c.dispatch_time != None) \
+            .where(incident.c.geocoded_at != None)
+        if state.get("geocoded_through") is not None:
+            geocoded = geocoded.where(incident.c.geocoded_at >
+                                      datetime.datetime.strptime(state["geocoded_through"], "%Y-%m-%dT%H:%M:%S.%f"))
+        months.update((row[0].year, row[0].month) for row in connection.execute(geocoded))
+        months = sorted(months)
+
+    incident_count = 0
+    for year, month in months:
+        incident_count += export_month(connection, directory, year, month, file_format)
+
+    for name in PEOPLE_TABLES:
+        table = models.metadata.tables[name]
+        rows = connection.execute(table.select().order_by(table.c.id)).fetchall()
+        write_file(os.path.join(directory, "{0}.{1}".format(name, EXTENSIONS[file_format])),
+                   to_arrow(table, rows), file_format)
+
+    with open(state_path + ".tmp", "w") as handle:
+        json.dump({"format" : file_format,
+                   "loaded_through" : loaded_through.strftime("%Y-%m-%dT%H:%M:%S.%f") if loaded_through else None,
+                   "last_incident_id" : last_incident_id,
+                   "geocoded_through" : geocoded_through.strftime("%Y-%m-%dT%H:%M:%S.%f") if geocoded_through else None,
+                   "exported_at" : datetime.datetime.now().isoformat()}, handle, indent=2)
+    os.replace(state_path + ".tmp", state_path)
+    return (months, incident_count)
+
+def read_table(directory, table, start=None, end=None):
+    """ Reads an exported table as a single `pyarrow.Table`. For the tables of `INCIDENT_TABLES`,
+        only the months from that of the date `start` up to, but not including, that of
+        `end` are read when they're given. `to_pandas` on the result gives a dataframe
+        with the dictionary columns as categoricals.
+    """
+    if pyarrow is None:
+        raise ValueError("Reading an export requires pyarrow")
+    if table in PEOPLE_TABLES:
+        paths = [os.path.join(directory, "{0}.{1}".format(table, extension)) for extension in EXTENSIONS.values()]
+        return read_file([p for p in paths if os.path.exists(p)][0])
+
+    parts = []
+    table_dir = os.path.join(directory, table)
+    for year_dir in sorted(os.listdir(table_dir)) if os.path.isdir(table_dir) else []:
+        for month_dir in sorted(os.listdir(os.path.join(table_dir, year_dir))):
+            month = (int(year_dir.split("=")[1]), int(month_dir.split("=")[1]))
+            if (start is not None and month < (start.year, start.month)) or \
+                    (end is not None and month >= (end.year, end.month)):
+                continue
+            for filename in os.listdir(os.path.join(table_dir, year_dir, month_dir)):
+                if not filename.endswith(".tmp"):
+                    parts.append(read_file(os.path.join(table_dir, year_dir, month_dir, filename)))
+    if not parts:
+        return to_arrow(models.metadata.tables[table], [])
+    return pyarrow.concat_tables(parts)
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports the incident history to columnar files for analysis, "
+                                                 "partitioned by the month incidents were dispatched in.")
+    parser.add_argument("--out", default="export", help="The directory to export to.")
+    parser.add_argument("--format", default="parquet", choices=sorted(EXTENSIONS),
+            help="Parquet, or Arrow IPC files which can be memory mapped.")
+    parser.add_argument("--full", action="store_true",
+            help="Export every month, rather than just those loaded since the last export.")
+    parser.add_argument("--db-url", default=None,
+            help="The database to export. Defaults to $KEENE_DB_URL, then the local keene_police_logs database.")
+    args = parser.parse_args()
+
+    connection = db.create_db_engine(args.db_url).connect()
+    try:
+        months, incident_count = export(connection, args.out, args.format, args.full)
+    finally:
+        connection.close()
+    print("Exported {0} incidents in {1} months to {2}".format(incident_count, len(months), args.out))
+
+if __name__ == "__main__":
+    main()
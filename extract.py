@@ -0,0 +1,42 @@
+import io
+import os
+import subprocess
+
+try:
+    import pdftotext
+except ImportError:
+    pdftotext = None
+
+def extract_text(path):
+    """ Returns the text of the PDF at `path` in pdftotext's raw layout, the layout
+        the parser expects. Uses the poppler bindings when they're installed and
+        otherwise pipes the output of the pdftotext command, so no text file is written.
+    """
+    if pdftotext is not None:
+        with open(path, "rb") as handle:
+            return "\n".join(pdftotext.PDF(handle, raw=True))
+    output = subprocess.check_output(["pdftotext", "-raw", "-enc", "UTF-8", path, "-"])
+    return output.decode("utf-8", "replace")
+
+def extract_lines(path, content_hash=None, cache_dir=None):
+    """ Returns a file-like object over the text of the PDF at `path`, ready for
+        `parse_pdf.read_lines`. When `cache_dir` is given, the text is cached there
+        under `content_hash`, the digest of the PDF, so that parsing the same
+        PDF again doesn't extract it again.
+    """
+    if cache_dir is None or content_hash is None:
+        return io.StringIO(extract_text(path))
+
+    cache_path = os.path.join(cache_dir, content_hash + ".txt")
+    if os.path.exists(cache_path):
+        return io.open(cache_path, "r", encoding="utf-8")
+
+    text = extract_text(path)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    # several workers may extract the same PDF, so write under a unique name first
+    tmp_path = "{0}.{1}.tmp".format(cache_path, os.getpid())
+    with io.open(tmp_path, "w", encoding="utf-8") as handle:
+        handle.write(text)
+    os.replace(tmp_path, cache_path)
+    return io.StringIO(text)
@@ -0,0 +1,132 @@
+import argparse
+import csv
+import io
+import re
+
+# the street segment file has one row per segment of street centerline, giving the house
+# numbers on each side of the segment and the coordinates of its two ends
+SEGMENT_COLUMNS = ["street", "from_left", "to_left", "from_right", "to_right",
+                   "start_lat", "start_lon", "end_lat", "end_lon"]
+
+SUFFIXES = {
+    "STREET" : "ST", "AVENUE" : "AVE", "ROAD" : "RD", "DRIVE" : "DR", "LANE" : "LN",
+    "COURT" : "CT", "PLACE" : "PL", "TERRACE" : "TER", "CIRCLE" : "CIR", "HIGHWAY" : "HWY",
+    "BOULEVARD" : "BLVD", "PARKWAY" : "PKWY", "EXTENSION" : "EXT", "SQUARE" : "SQ",
+}
+DIRECTIONS = {"NORTH" : "N", "SOUTH" : "S", "EAST" : "E", "WEST" : "W"}
+
+NON_WORD_RE = re.compile(r"[^A-Z0-9& ]+")
+WHITESPACE_RE = re.compile(r"\s+")
+HOUSE_NUMBER_RE = re.compile(r"^(?P<number>[0-9]+)[A-Z]?\s+(?P<street>.+)$")
+
+def street_key(name):
+    """ Normalizes a street name so that "Main Street" and "MAIN ST." are the same street """
+    words = WHITESPACE_RE.sub(" ", NON_WORD_RE.sub(" ", name.upper())).strip().split(" ")
+    if len(words) > 1:
+        words[-1] = SUFFIXES.get(words[-1], words[-1])
+        words[0] = DIRECTIONS.get(words[0], words[0])
+    return " ".join(words)
+
+def parse_number(value):
+    value = (value or "").strip()
+    return int(value) if value else None
+
+class Segment(object):
+    __slots__ = ["name", "from_left", "to_left", "from_right", "to_right", "start", "end"]
+
+    def __init__(self, name, from_left, to_left, from_right, to_right, start, end):
+        self.name = name
+        self.from_left = from_left
+        self.to_left = to_left
+        self.from_right = from_right
+        self.to_right = to_right
+        self.start = start
+        self.end = end
+
+    def locate(self, number):
+        """ Interpolates the position of `number` along the segment, or returns None
+            if neither side of the segment holds it
+        """
+        for low, high in ((self.from_left, self.to_left), (self.from_right, self.to_right)):
+            if low is None or high is None or low % 2 != number % 2:
+                continue
+            if min(low, high) <= number <= max(low, high):
+                fraction = 0.5 if low == high else float(number - low) / (high - low)
+                return (self.start[0] + fraction * (self.end[0] - self.start[0]),
+                        self.start[1] + fraction * (self.end[1] - self.start[1]))
+        return None
+
+class Gazetteer(object):
+    """ A local geocoder over a file of Keene street segments. Street names are normalized
+        by `street_key`, house numbers are interpolated along the segment whose range holds
+        them, and intersections are the points where two streets' segments meet.
+    """
+
+    def __init__(self, segments):
+        self.streets = {}
+        self.names = {}
+        self.intersections = {}
+
+        ends = {}
+        for segment in segments:
+            key = street_key(segment.name)
+            self.streets.setdefault(key, []).append(segment)
+            self.names.setdefault(key, segment.name)
+            for point in (segment.start, segment.end):
+                ends.setdefault((round(point[0], 6), round(point[1], 6)), set()).add(key)
+
+        for point, keys in ends.items():
+            keys = sorted(keys)
+            for i in range(len(keys)):
+                for j in range(i + 1, len(keys)):
+                    self.intersections.setdefault(frozenset((keys[i], keys[j])), point)
+
+    @classmethod
+    def load(cls, path):
+        """ Loads the street segment CSV at `path`, whose header names `SEGMENT_COLUMNS` """
+        with io.open(path, "r", newline="") as handle:
+            return cls([Segment(row["street"],
+                                parse_number(row["from_left"]), parse_number(row["to_left"]),
+                                parse_number(row["from_right"]), parse_number(row["to_right"]),
+                                (float(row["start_lat"]), float(row["start_lon"])),
+                                (float(row["end_lat"]), float(row["end_lon"])))
+                        for row in csv.DictReader(handle)])
+
+    def lookup(self, query):
+        """ Geocodes the output of `normalize.clean_query`: a street address or an intersection
+            of the form "X & Y". Returns the formatted address, (latitude, longitude) and match
+            quality like `bing.BingClient.geocode`, or None if the gazetteer can't place the
+            query. A bare street name isn't placed, since any point on the street would be a guess.
+        """
+        if "&" in query:
+            streets = [street_key(s) for s in query.split("&")]
+            if len(streets) != 2:
+                return None
+            point = self.intersections.get(frozenset(streets))
+            if point is None:
+                return None
+            return ("{0} & {1}, Keene, NH 03431".format(self.names[streets[0]], self.names[streets[1]]),
+                    point, "Intersection")
+
+        match = HOUSE_NUMBER_RE.match(query.strip().upper())
+        if match:
+            key = street_key(match.group("street"))
+            number = int(match.group("number"))
+            for segment in self.streets.get(key, ()):
+                point = segment.locate(number)
+                if point is not None:
+                    return ("{0} {1}, Keene, NH 03431".format(number, self.names[key]), point, "Interpolated")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("segments", help="A CSV of street segments with the columns " + ", ".join(SEGMENT_COLUMNS))
+    parser.add_argument("queries", nargs="+", help="Addresses to geocode.")
+    args = parser.parse_args()
+
+    gazetteer = Gazetteer.load(args.segments)
+    for query in args.queries:
+        print("{0} -> {1}".format(query, gazetteer.lookup(query)))
+
+if __name__ == "__main__":
+    main()
@@ -1,176 +1,262 @@
-import requests
-from sqlalchemy import create_engine
+import argparse
+import datetime
+import logging
+from sqlalchemy import bindparam, func, or_, select
 from sqlalchemy.orm import sessionmaker
 import sqlalchemy.dialects.postgresql
 import psycopg2
+import psycopg2.extras
+import requests
 import models
-import os
-import re
-import csv
-import StringIO
+import bing
+import db
+import gazetteer
+import geocode_cache
+import instrument
+import normalize
 import time
 
-class GeocodeError(Exception):
-    pass
+from bing import GeocodeError
 
-class AuthenticationError(Exception):
-    pass
+UPDATE_BATCH_SIZE = 1000
 
+# failures only flag the incidents, keeping whatever formatted location they had, and
+# leave those flagged before alone so their `geocoded_at` doesn't move when nothing changed
+UPDATE_FROM_VALUES = """
+    update incident set
+        formatted_location = coalesce(v.formatted_location, incident.formatted_location),
+        latitude = v.latitude, longitude = v.longitude, geocode_failed = v.geocode_failed,
+        geocoded_at = v.geocoded_at
+    from (values %s) as v (location, formatted_location, latitude, longitude, geocode_failed, geocoded_at)
+    where incident.location = v.location and incident.latitude is null
+        and not (v.geocode_failed and incident.geocode_failed is true)
+"""
 
-TAGGED_LOCATION_RE = re.compile("\s*\[.+\]\s*")
-ADDRESS_WITH_NUMBER = re.compile("[1-9][0-9]*\s+")
-ADDRESS_WITH_ZERO_NUMBER = re.compile("^\s*0\s+(.+)")
+log = logging.getLogger(__name__)
 
 def main():
-    engine = create_engine("postgresql+psycopg2:///keene_police_logs").connect()
-    Session = sessionmaker(bind = engine)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", action="store_true",
+            help="First cache the coordinates of incidents whose reports included them.")
+    parser.add_argument("--dataflow-url", default=bing.DATAFLOW_URL, help="The Bing Dataflow geocoding service.")
+    parser.add_argument("--locations-url", default=bing.LOCATIONS_URL, help="The Bing Locations service.")
+    parser.add_argument("--fallback-workers", type=int, default=4,
+            help="Concurrent single-address queries for addresses the batch job couldn't match.")
+    parser.add_argument("--poll-interval", type=float, default=10, help="Seconds before first checking on a batch job.")
+    parser.add_argument("--rate", type=float, default=bing.RATE_LIMIT, help="The most Bing requests to make per second.")
+    parser.add_argument("--gazetteer", help="A CSV of Keene street segments to geocode from locally before asking Bing.")
+    parser.add_argument("--chunk-size", type=int, default=bing.BATCH_LIMIT,
+            help="Distinct locations to read from the backlog and geocode at a time.")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument.run(args):
+        geocode_backlog(args)
+
+def geocode_backlog(args):
+    """ Geocodes every incident without coordinates, chunk by chunk, with the options parsed by `main` """
+    engine = db.create_db_engine()
+    # cached entries stay usable after each chunk is committed, without reloading them
+    Session = sessionmaker(bind = engine.connect(), expire_on_commit = False)
     session = Session()
 
-    incidents_with_locations = session.query(models.Incident) \
-        .filter(models.Incident.latitude != None) \
-        .distinct(models.Incident.location, models.Incident.latitude, models.Incident.longitude).all()
-
-    location_dict = dict([(i.location, [i.latitude, i.longitude]) for i in incidents_with_locations])
-    recs_since_commit = 0
-
-    recs_to_geocode = []
-    for incident in session.query(models.Incident).filter(models.Incident.latitude == None):
-        cleaned_q = clean_query(incident.location)
-        print("----------------")
-        print("{0} -> {1}".format(incident.location, cleaned_q))
-
-        if incident.location in location_dict:
-            print("Found {0} in the location dictionary".format(incident.location))
-            loc = location_dict[incident.location]
-            print(loc)
-            incident.latitude = loc[0]
-            incident.longitude = loc[1]
-            continue
+    if args.seed:
+        log.info("Seeded %s cache entries", geocode_cache.seed_from_incidents(session.connection(), normalize.location_keys))
+        session.commit()
+
+    local = gazetteer.Gazetteer.load(args.gazetteer) if args.gazetteer else None
+    cache = geocode_cache.GeocodeCache(session)
+    client = None
+    for locations in stream_backlog(engine, args.chunk_size):
+        found, pending = resolve_locations(locations, cache, local)
+        log.info("%s locations: %s found locally or in the geocode cache, %s addresses to look up",
+                 len(locations), len(found), len(pending))
+
+        if pending:
+            if client is None:
+                client = bing.BingClient(dataflow_url=args.dataflow_url, locations_url=args.locations_url,
+                                         rate=args.rate, pool_size=args.fallback_workers)
+            entries = batch_geocode(client, cache, dict((key, query) for key, (query, group) in pending.items()),
+                                    args.fallback_workers, args.poll_interval)
+            # addresses whose lookup failed for now are left in the backlog for the next run
+            for key, (query, group) in pending.items():
+                if key in entries:
+                    found.extend((location, entries[key]) for location in group)
 
-        if cleaned_q in location_dict:
-            print("Found {0} in the location dictionary".format(cleaned_q))
-            loc = location_dict[cleaned_q]
-            print(loc)
-            incident.latitude = loc[0]
-            incident.longitude = loc[1]
+        update_incidents(session.connection(), found)
+        session.commit()
+
+    if client is not None:
+        log.info("Bing requests: %s", client.stats.summary())
+    log.info("Geocode cache: %s hits, %s misses", cache.hits, cache.misses)
+
+def stream_backlog(engine, chunk_size):
+    """ Yields the distinct locations of incidents which haven't been geocoded, in lists of up to
+        `chunk_size`. Postgres streams them from a server-side cursor on a connection of their own,
+        through the partial index on incidents without coordinates, so the backlog never has to
+        fit in memory and the chunks can be committed as they're geocoded.
+    """
+    incident = models.Incident.__table__
+    query = select([incident.c.location]) \
+        .where(incident.c.latitude == None) \
+        .where(incident.c.location != None) \
+        .distinct()
+    connection = engine.connect()
+    try:
+        result = connection.execution_options(stream_results=True).execute(query)
+        if engine.dialect.name == "postgresql":
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [row[0] for row in rows]
+        else:
+            # SQLite can't write while a read is still open, so its backlog is read up front
+            rows = result.fetchall()
+            for start in range(0, len(rows), chunk_size):
+                yield [row[0] for row in rows[start:start + chunk_size]]
+    finally:
+        connection.close()
+
+def resolve_locations(locations, cache, local=None):
+    """ Looks up each of `locations`. Returns a list of (location, cache entry) pairs for those whose
+        address the `local` gazetteer places or is cached, and a dict mapping the cache key of each
+        other address to its cleaned query and the locations which share it.
+    """
+    found = []
+    pending = {}
+    located = {}
+    for location, (cleaned_q, key) in zip(locations, normalize.normalize_locations(locations)):
+        if key in pending:
+            pending[key][1].append(location)
             continue
 
-        recs_to_geocode.append(cleaned_q)
-
-        if len(recs_to_geocode) >= 5:
-            session.commit()
-            batch_geocode(recs_to_geocode)
-            session.commit()
-            break
-        
-
-def batch_geocode(records):
-    content = StringIO.StringIO()
-    content.write("Bing Spatial Data Services|2.0\n")
-    writer = csv.DictWriter(content, fieldnames=["Id", "GeocodeRequest/Culture", "GeocodeRequest/Address/AddressLine", "GeocodeRequest/Address/AdminDistrict", "GeocodeRequest/Address/CountryRegion", "GeocodeRequest/Address/PostalCode", "GeocodeRequest/Address/PostalTown"], delimiter="|")
-    writer.writeheader()
-
-    for i, address in enumerate(records):
-        record = {
-            "Id" : str(i),
-            "GeocodeRequest/Culture" : "en-US",
-            "GeocodeRequest/Address/AddressLine" : address,
-            "GeocodeRequest/Address/AdminDistrict" : "NH",
-            "GeocodeRequest/Address/CountryRegion" : "US",
-            "GeocodeRequest/Address/PostalCode" : "03431",
-            "GeocodeRequest/Address/PostalTown" : "Keene"
-        }
-        writer.writerow(record)
-    post_content = content.getvalue()
-    print(post_content)
-    r = requests.post("http://spatial.virtualearth.net/REST/v1/Dataflows/Geocode", 
-            params={"input" : "pipe",
-                    "output" : "json",
-                    "key" : os.environ["BING_API_KEY"]
-            }, data=post_content)
-    result = r.json()
-    if result.status != 201:
-        raise ValueError("Bad status code from {0}".format(r.url))
-
-    result_url = [r["url"] for r in result["resourceSets"][0]["resources"]["links"] if r["role"] == "self"][0]
-    #time.sleep()
-
-    #r = requests.post("http://dev.virtualearth.net/REST/v1/Locations/US/NH/03431/Keene/{0}".format(query_text),
-
-def old():
-        try:
-            address, point = run_structured_query(cleaned_q)
-        except GeocodeError:
-            try:
-                address, point = run_unstructured_query(cleaned_q)
-            except GeocodeError:
-                print("{0} Failed!".format(cleaned_q))
-        recs_since_commit += 1
-
-        print(address)
-        print(point)
-        incident.formatted_location = address
-        incident.latitude = point[0]
-        incident.longitude = point[1]
-        location_dict[cleaned_q] = point
-        if recs_since_commit == 50:
-            session.commit()
-
-def clean_query(query_text):
-    q = TAGGED_LOCATION_RE.sub("", query_text)
-    elems = q.split(" - ")
-    q = elems[-1]
-    if "@" in q:
-        elems = q.split("@")
-        if ADDRESS_WITH_NUMBER.match(elems[0]):
-            return elems[0].strip()
-        elif ADDRESS_WITH_NUMBER.match(elems[1]):
-            return elems[1].strip()
+        entry = located.get(key)
+        if entry is None and local is not None:
+            entry = locate(local, key, cleaned_q)
+            if entry is not None:
+                located[key] = entry
+                instrument.METRICS.count("gazetteer_hits_total")
+        if entry is None:
+            entry = cache.get(key)
+        if entry is None:
+            pending[key] = (cleaned_q, [location])
         else:
-            for i in range(len(elems)):
-                elems[i] = ADDRESS_WITH_ZERO_NUMBER.sub(r"\1", elems[i]).strip()
-            q = " & ".join(elems)
-    return q
+            found.append((location, entry))
+    return (found, pending)
+
+def locate(local, key, query_text):
+    """ Looks `query_text` up in a gazetteer, returning an uncached entry or None if it missed """
+    result = local.lookup(query_text)
+    if result is None:
+        return None
+    address, point, quality = result
+    # local results are cheap to recompute, so they aren't written to the cache
+    return models.GeocodeCacheEntry(address_key = key, formatted_address = address, latitude = point[0],
+        longitude = point[1], match_quality = quality, source = "gazetteer", succeeded = True)
+
+def batch_geocode(client, cache, queries, fallback_workers=4, poll_interval=10, max_poll_interval=300, sleep=time.sleep):
+    """ Geocodes `queries`, a dict mapping cache keys to cleaned queries, with Bing Dataflow jobs of
+        up to `bing.BATCH_LIMIT` addresses. Addresses a job couldn't match are tried one at a time.
+        Every outcome is cached; returns the cache entries keyed by cache key.
+    """
+    entries = {}
+    keys = list(queries)
+    for start in range(0, len(keys), bing.BATCH_LIMIT):
+        chunk = keys[start:start + bing.BATCH_LIMIT]
+        job_id = client.submit_job([(i, queries[key]) for i, key in enumerate(chunk)])
+        log.info("Submitted Dataflow job %s with %s addresses", job_id, len(chunk))
+
+        links = wait_for_job(client, job_id, poll_interval, max_poll_interval, sleep)
+        if "succeeded" in links:
+            for row in client.download(links["succeeded"]):
+                result = bing.read_dataflow_row(row)
+                if result is not None:
+                    key = chunk[int(row["Id"])]
+                    address, point, quality = result
+                    entries[key] = cache.put(key, address, point[0], point[1], quality, "bing-dataflow")
 
-def handle_result(query_text, r):
-    if r.status_code != 200:
-        raise GeocodeError("Failed to geocode in a with query {0}".format(query_text))
+    failures = dict((key, queries[key]) for key in keys if key not in entries)
+    if failures:
+        log.info("Looking up %s addresses the batch couldn't match", len(failures))
+        entries.update(geocode_singly(client, cache, failures, fallback_workers))
+    return entries
 
+def wait_for_job(client, job_id, poll_interval, max_poll_interval, sleep=time.sleep):
+    """ Polls a Dataflow job, doubling the wait each time up to `max_poll_interval` seconds,
+        until it completes. Returns the links of the completed job keyed by role.
+    """
+    while True:
+        sleep(poll_interval)
+        status, links = client.job_status(job_id)
+        if status == "Completed":
+            return links
+        elif status == "Aborted":
+            raise GeocodeError("Dataflow job {0} was aborted".format(job_id))
+        poll_interval = min(poll_interval * 2, max_poll_interval)
+
+def geocode_singly(client, cache, queries, workers):
+    """ Geocodes each of `queries`, a dict mapping cache keys to cleaned queries, with concurrent
+        single-address requests. Returns the cache entries keyed by cache key. An address whose
+        lookup failed for want of an answer, rather than finding nothing, is left out and isn't
+        cached, so it's looked up again next time.
+    """
+    geocoder = bing.ConcurrentGeocoder(client, workers)
+    futures = [(key, geocoder.submit(query)) for key, query in queries.items()]
+    entries = {}
     try:
-        resources = r.json()["resourceSets"][0]["resources"]
-        if resources:
-            resource = resources[0]
-        else:
-            raise GeocodeError("No matches found for {0}".format(query_text))
-    except Exception as e:
-        print(r.json())
-        raise e
-
-    if set(["Good"]) != set(resource["matchCodes"]):
-        raise GeocodeError("Bad match quality for {0}".format(query_text))
-
-    return (resource["address"]["formattedAddress"], resource["point"]["coordinates"])
-    
-
-def run_structured_query(query_text):
-    r = requests.get("http://dev.virtualearth.net/REST/v1/Locations/US/NH/03431/Keene/{0}".format(query_text),
-            params = {
-                "includeNeighborhood" : 1,
-                "key" : os.environ["BING_API_KEY"]
-            })
-    return handle_result(query_text, r)
-
-def run_unstructured_query(query_text):
-    r = requests.get("http://dev.virtualearth.net/REST/v1/Locations/",
-            params = {
-                "query" : query_text + " Keene, NH",
-                "includeNeighborhood" : 1,
-                "key" : os.environ["BING_API_KEY"]
-            })
-    return handle_result(query_text, r)
+        # the session isn't thread safe, so results are cached from this thread
+        for key, future in futures:
+            try:
+                address, point, quality = future.result()
+            except GeocodeError:
+                log.warning("%s Failed!", queries[key])
+                entries[key] = cache.put_failure(key, "bing")
+                continue
+            except (requests.RequestException, ValueError) as e:
+                # out of retries, or a response that wasn't JSON
+                log.warning("%s couldn't be looked up: %s", queries[key], e)
+                instrument.METRICS.count("geocode_lookups_deferred_total")
+                continue
+            entries[key] = cache.put(key, address, point[0], point[1], quality, "bing")
+    finally:
+        geocoder.close()
+    return entries
+
+def update_incidents(connection, found):
+    """ Copies the geocoding results in `found`, (location, cache entry) pairs, to every
+        incident at each location still without coordinates, stamping them with
+        `geocoded_at`. A failure isn't copied to incidents it was copied to before, so
+        those which keep failing aren't stamped, and so exported, again. Postgres gets one `UPDATE ... FROM (VALUES ...)` per batch;
+        other databases an update per location.
+    """
+    now = datetime.datetime.now()
+    for start in range(0, len(found), UPDATE_BATCH_SIZE):
+        rows = []
+        for location, entry in found[start:start + UPDATE_BATCH_SIZE]:
+            if entry.succeeded:
+                rows.append((location, entry.formatted_address, entry.latitude, entry.longitude, False, now))
+            else:
+                rows.append((location, None, None, None, True, now))
 
+        if connection.dialect.name == "postgresql":
+            cursor = connection.connection.cursor()
+            try:
+                psycopg2.extras.execute_values(cursor, UPDATE_FROM_VALUES, rows,
+                                               template="(%s, %s, %s::numeric, %s::numeric, %s::boolean, %s::timestamp)")
+            finally:
+                cursor.close()
+        else:
+            incident = models.Incident.__table__
+            connection.execute(incident.update()
+                .where(incident.c.location == bindparam("b_location"))
+                .where(incident.c.latitude == None)
+                .where(or_(bindparam("b_failed") == False, incident.c.geocode_failed.isnot(True)))
+                .values(formatted_location = func.coalesce(bindparam("b_formatted_location"), incident.c.formatted_location),
+                        latitude = bindparam("b_latitude"), longitude = bindparam("b_longitude"),
+                        geocode_failed = bindparam("b_failed"), geocoded_at = bindparam("b_geocoded_at")),
+                [{"b_location" : row[0], "b_formatted_location" : row[1], "b_latitude" : row[2],
+                  "b_longitude" : row[3], "b_failed" : row[4], "b_geocoded_at" : row[5]} for row in rows])
 
 if __name__ == "__main__":
     main()
-
-
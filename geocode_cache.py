@@ -0,0 +1,104 @@
+import collections
+import datetime
+import instrument
+import models
+from sqlalchemy.dialects import postgresql
+
+# how long to wait before trying an address which couldn't be geocoded again
+NEGATIVE_TTL = datetime.timedelta(days=30)
+LRU_SIZE = 10000
+
+class GeocodeCache(object):
+    """ Geocoding results keyed by normalized address, kept in the `geocode_cache`
+        table behind an in-memory LRU. Failed lookups are cached too, and expire
+        after `negative_ttl` so that they're eventually tried again.
+    """
+
+    def __init__(self, db_session, lru_size=LRU_SIZE, negative_ttl=NEGATIVE_TTL):
+        self.db_session = db_session
+        self.lru_size = lru_size
+        self.negative_ttl = negative_ttl
+        self.lru = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ Returns the `models.GeocodeCacheEntry` for `key`, or None if the address
+            hasn't been looked up or its failure has expired
+        """
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            entry = self.lru[key]
+        else:
+            entry = self.db_session.query(models.GeocodeCacheEntry).get(key)
+            self.remember(key, entry)
+
+        if entry is not None and not entry.succeeded and \
+                entry.looked_up_at + self.negative_ttl < datetime.datetime.now():
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            instrument.METRICS.count("geocode_cache_misses_total")
+        else:
+            self.hits += 1
+            instrument.METRICS.count("geocode_cache_hits_total")
+        return entry
+
+    def put(self, key, formatted_address, latitude, longitude, match_quality, source):
+        """ Caches a successful lookup """
+        return self.store(models.GeocodeCacheEntry(address_key = key, formatted_address = formatted_address,
+            latitude = latitude, longitude = longitude, match_quality = match_quality,
+            source = source, succeeded = True, looked_up_at = datetime.datetime.now()))
+
+    def put_failure(self, key, source):
+        """ Caches a lookup which found nothing usable """
+        return self.store(models.GeocodeCacheEntry(address_key = key, source = source,
+            succeeded = False, looked_up_at = datetime.datetime.now()))
+
+    def store(self, entry):
+        """ Saves an entry, replacing any cached under the same key. Postgres gets a single
+            upsert; elsewhere the session looks the key up and merges.
+        """
+        if self.db_session.bind.dialect.name == "postgresql":
+            table = models.GeocodeCacheEntry.__table__
+            values = dict((c.name, getattr(entry, c.name)) for c in table.columns)
+            self.db_session.execute(postgresql.insert(table).values(**values)
+                .on_conflict_do_update(index_elements=[table.c.address_key], set_=values))
+        else:
+            entry = self.db_session.merge(entry)
+        self.remember(entry.address_key, entry)
+        return entry
+
+    def remember(self, key, entry):
+        self.lru[key] = entry
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+def seed_from_incidents(connection, keys_function):
+    """ Caches the coordinates of every incident whose report included them, keyed by
+        `keys_function`, which is given every such location at once and returns their
+        keys. Existing entries are kept. Returns the number of entries added.
+    """
+    incident = models.Incident.__table__
+    cache = models.GeocodeCacheEntry.__table__
+    known = set(row[0] for row in connection.execute(cache.select().with_only_columns([cache.c.address_key])))
+
+    rows = {}
+    query = incident.select() \
+        .with_only_columns([incident.c.location, incident.c.latitude, incident.c.longitude]) \
+        .where(incident.c.latitude != None) \
+        .where(incident.c.location != None) \
+        .distinct()
+    now = datetime.datetime.now()
+    located = connection.execute(query).fetchall()
+    keys = keys_function([row[0] for row in located])
+    for key, (location, latitude, longitude) in zip(keys, located):
+        if key not in known and key not in rows:
+            rows[key] = {"address_key" : key, "formatted_address" : None, "latitude" : latitude,
+                         "longitude" : longitude, "match_quality" : None, "source" : "report",
+                         "succeeded" : True, "looked_up_at" : now}
+    if rows:
+        connection.execute(cache.insert(), list(rows.values()))
+    return len(rows)
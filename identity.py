@@ -0,0 +1,43 @@
+import models
+import records
+from sqlalchemy import select
+
+class IdentityCache(object):
+    """ An identity map of officers or dispatchers keyed by badge number.
+        The whole table is loaded in a single query by `preload` and people
+        are added to the map as they're created, so parsing a report never
+        has to go back to the database to look someone up.
+
+        People are kept as `records.PersonRef` instances rather than models, so
+        the cache never touches a session; people created by the cache have no
+        id until a bulk loader writes them.
+    """
+
+    def __init__(self, model, db_session=None):
+        self.model = model
+        self.db_session = db_session
+        self.by_number = {}
+
+    def preload(self):
+        """ Loads every existing row of the table into the cache """
+        if self.db_session is not None:
+            table = self.model.__table__
+            query = select([table.c.id, table.c.number, table.c.first_name, table.c.last_name])
+            for person_id, number, first_name, last_name in self.db_session.execute(query):
+                self.by_number[number] = records.PersonRef(id = person_id, number = number,
+                                                           first_name = first_name, last_name = last_name)
+        return self
+
+    def get_or_create(self, number, first_name, last_name):
+        """ Returns the person with badge `number`, creating them if they aren't known yet """
+        person = self.by_number.get(number)
+        if person is None:
+            person = records.PersonRef(number = number, first_name = first_name, last_name = last_name)
+            self.by_number[number] = person
+        return person
+
+def officer_cache(db_session=None):
+    return IdentityCache(models.Officer, db_session).preload()
+
+def dispatcher_cache(db_session=None):
+    return IdentityCache(models.Dispatcher, db_session).preload()
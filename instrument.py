@@ -0,0 +1,191 @@
+import collections
+import contextlib
+import cProfile
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+class Metrics(object):
+    """ Counters, gauges and timers for a run, keyed by name. Names may carry Prometheus
+        labels, as in `parse_lines_total{type="officer"}`. The methods hold a lock, so
+        any thread may use them. Counters are a plain dict so that the parser's hot
+        loop can bump its own counters directly, which is safe only because no other
+        thread updates those names.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.counters = collections.defaultdict(float)
+        self.gauges = {}
+        self.timers = {}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        """ Adds a duration to the timer `name`, kept as [count, total, max] """
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def drain(self):
+        """ Returns the metrics recorded so far as a dict, and starts over. A worker
+            process sends this back to be merged into the parent's metrics.
+        """
+        with self.lock:
+            snapshot = self.snapshot()
+            self.counters.clear()
+            self.gauges.clear()
+            self.timers.clear()
+        return snapshot
+
+    def snapshot(self):
+        return {"counters" : dict(self.counters), "gauges" : dict(self.gauges),
+                "timers" : dict((k, list(v)) for k, v in self.timers.items())}
+
+    def merge(self, snapshot):
+        with self.lock:
+            for name, amount in snapshot["counters"].items():
+                self.counters[name] += amount
+            self.gauges.update(snapshot["gauges"])
+            for name, (count, total, longest) in snapshot["timers"].items():
+                timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+                timer[0] += count
+                timer[1] += total
+                timer[2] = max(timer[2], longest)
+
+    def report(self):
+        """ The run's metrics as a JSON-serializable dict """
+        with self.lock:
+            snapshot = self.snapshot()
+        return {
+            "started" : self.started,
+            "seconds" : round(time.time() - self.started, 3),
+            "counters" : dict(sorted(snapshot["counters"].items())),
+            "gauges" : dict(sorted(snapshot["gauges"].items())),
+            "timers" : dict((name, {"count" : count, "seconds" : round(total, 6), "max_seconds" : round(longest, 6)})
+                            for name, (count, total, longest) in sorted(snapshot["timers"].items())),
+        }
+
+    def prometheus(self):
+        """ The run's metrics in the Prometheus text exposition format, for a textfile collector """
+        with self.lock:
+            snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            base = name.split("{", 1)[0]
+            if base not in declared:
+                declared.add(base)
+                lines.append("# TYPE {0} {1}".format(base, kind))
+            return name
+
+        def with_suffix(name, suffix):
+            base, brace, labels = name.partition("{")
+            return base + suffix + brace + labels
+
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append("{0} {1}".format(declare(name, "counter"), value))
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append("{0} {1}".format(declare(name, "gauge"), value))
+        for name, (count, total, longest) in sorted(snapshot["timers"].items()):
+            declare(name, "summary")
+            lines.append("{0} {1}".format(with_suffix(name, "_count"), count))
+            lines.append("{0} {1}".format(with_suffix(name, "_sum"), total))
+        lines.append("# TYPE run_seconds gauge")
+        lines.append("run_seconds {0}".format(time.time() - self.started))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """ Writes the run report to `path`: Prometheus text if it ends in `.prom`, JSON otherwise """
+        with open(path, "w") as handle:
+            if path.endswith(".prom"):
+                handle.write(self.prometheus())
+            else:
+                json.dump(self.report(), handle, indent=2)
+
+METRICS = Metrics()
+
+def watch_engine(engine, metrics=METRICS):
+    """ Times every statement `engine` runs, as `db_query_seconds`. A connection runs one
+        statement at a time, so it holds a single start time, dropped if the statement fails.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(connection, cursor, statement, parameters, context, executemany):
+        connection.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(connection, cursor, statement, parameters, context, executemany):
+        started = connection.info.pop("query_started", None)
+        if started is not None:
+            metrics.observe("db_query_seconds", time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def failed(context):
+        if context.connection is not None:
+            context.connection.info.pop("query_started", None)
+    return engine
+
+def add_arguments(parser):
+    """ Adds the options read by `run` to an argparse parser """
+    parser.add_argument("--log-level", default="INFO", help="DEBUG shows every record as it's read.")
+    parser.add_argument("--metrics", default=None,
+            help="A file to write the run's counters and timers to: JSON, or Prometheus text if it ends in .prom.")
+    parser.add_argument("--profile", default=None, help="Profile the run with cProfile, writing the stats to this file.")
+    parser.add_argument("--trace-memory", action="store_true",
+            help="Trace allocations with tracemalloc, logging the peak and the largest allocation sites.")
+
+@contextlib.contextmanager
+def run(args, metrics=METRICS):
+    """ Sets up logging for a command line run, with profiling and memory tracing if asked
+        for, and writes the metrics report when the run finishes
+    """
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    profiler = cProfile.Profile() if args.profile else None
+    if args.trace_memory:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield metrics
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            log.info("Wrote profile to %s", args.profile)
+        if args.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            metrics.gauge("peak_traced_bytes", peak)
+            for stat in tracemalloc.take_snapshot().statistics("lineno")[:10]:
+                log.info("Allocated %s", stat)
+            tracemalloc.stop()
+        if args.metrics:
+            metrics.write(args.metrics)
+            log.info("Wrote metrics to %s", args.metrics)
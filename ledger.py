@@ -0,0 +1,80 @@
+import datetime
+import hashlib
+import os
+import models
+from sqlalchemy.dialects import postgresql
+
+CHUNK_SIZE = 1 << 16
+
+def file_digest(path):
+    """ Returns the SHA-256 hex digest of the contents of the file at `path` """
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class Ledger(object):
+    """ The record of which source files have been loaded, with the hash of their
+        contents and the version of the parser that read them. Every entry is
+        read in one query up front so that deciding whether a file needs to be
+        loaded again doesn't touch the database.
+    """
+
+    def __init__(self, db_session):
+        self.entries = dict((e.source_file, e) for e in db_session.query(models.IngestLedger))
+
+    def is_current(self, source_file, content_hash, parser_version):
+        """ True if `source_file` was loaded from the same contents by the same parser version """
+        entry = self.entries.get(source_file)
+        return entry is not None and entry.content_hash == content_hash and \
+                entry.parser_version == parser_version
+
+    def record(self, connection, source_file, content_hash, report_date, parser_version, rows):
+        """ Records that `source_file` was loaded, `rows` being the number of rows written
+            to each table. Should run in the same transaction as the load itself.
+        """
+        table = models.IngestLedger.__table__
+        values = {
+            "source_file" : source_file,
+            "content_hash" : content_hash,
+            "report_date" : report_date,
+            "parser_version" : parser_version,
+            "incident_count" : rows.get("incident", 0),
+            "responding_officer_count" : rows.get("responding_officer", 0),
+            "location_change_count" : rows.get("location_change", 0),
+            "arrest_count" : rows.get("arrest", 0),
+            "summons_count" : rows.get("summons", 0),
+            "protective_custody_count" : rows.get("protective_custody", 0),
+            "loaded_at" : datetime.datetime.now(),
+        }
+        if connection.dialect.name == "postgresql":
+            connection.execute(postgresql.insert(table).values(**values)
+                .on_conflict_do_update(index_elements=[table.c.source_file], set_=values))
+        else:
+            connection.execute(table.delete().where(table.c.source_file == source_file))
+            connection.execute(table.insert().values(**values))
+        self.entries[source_file] = models.IngestLedger(**values)
+
+def replace_report_date(connection, report_date):
+    """ Deletes every incident dispatched on `report_date`, along with its child rows,
+        so that the report for that day can be loaded again. Should run in the same
+        transaction as the load which replaces them.
+    """
+    start = datetime.datetime.combine(report_date, datetime.time())
+    end = start + datetime.timedelta(days=1)
+    incident = models.Incident.__table__
+    incident_ids = incident.select() \
+        .with_only_columns([incident.c.id]) \
+        .where(incident.c.dispatch_time >= start) \
+        .where(incident.c.dispatch_time < end)
+
+    for model in (models.RespondingOfficer, models.LocationChange, models.Arrest,
+                  models.Summon, models.ProtectiveCustody):
+        table = model.__table__
+        connection.execute(table.delete().where(table.c.incident_id.in_(incident_ids)))
+    connection.execute(incident.delete().where(incident.c.id.in_(incident_ids)))
+
+def source_name(path):
+    """ The name a source file is recorded under in the ledger """
+    return os.path.basename(path)
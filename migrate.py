@@ -0,0 +1,81 @@
+import argparse
+import datetime
+import os
+import re
+import db
+import models
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema")
+MIGRATIONS_DIR = os.path.join(SCHEMA_DIR, "migrations")
+
+MIGRATION_RE = re.compile(r"^(?P<version>[0-9]+)_(?P<name>\w+)\.sql$")
+
+def find_migrations(directory=MIGRATIONS_DIR):
+    """ Returns the (version, name, path) of each migration in `directory`, oldest first.
+        Migrations are SQL files named like `003_ingest_indexes.sql`.
+    """
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_RE.match(filename)
+        if match:
+            migrations.append((int(match.group("version")), match.group("name"), os.path.join(directory, filename)))
+    return sorted(migrations)
+
+def applied_versions(connection):
+    table = models.SchemaMigration.__table__
+    table.create(connection, checkfirst=True)
+    return set(row[0] for row in connection.execute(table.select().with_only_columns([table.c.version])))
+
+def run_script(connection, path):
+    """ Runs the statements in a SQL file through the raw cursor, so that
+        dollar quoting and percent signs reach Postgres untouched
+    """
+    with open(path, "r") as handle:
+        script = handle.read()
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(script)
+    finally:
+        cursor.close()
+
+def migrate(connection, migrations=None):
+    """ Applies each migration that hasn't been yet, each in its own transaction,
+        returning the versions applied
+    """
+    if connection.dialect.name != "postgresql":
+        raise ValueError("Migrations are written for Postgres; other databases are created from the models")
+    table = models.SchemaMigration.__table__
+    done = applied_versions(connection)
+    applied = []
+    for version, name, path in migrations if migrations is not None else find_migrations():
+        if version in done:
+            continue
+        with connection.begin():
+            run_script(connection, path)
+            connection.execute(table.insert().values(version = version, name = name,
+                                                     applied_at = datetime.datetime.now()))
+        print("Applied migration {0:03d} {1}".format(version, name))
+        applied.append(version)
+    return applied
+
+def main():
+    parser = argparse.ArgumentParser(description="Brings the database schema up to date.")
+    parser.add_argument("--create", action="store_true",
+            help="Create the tables from schema/create_tables.sql first, for a new database.")
+    parser.add_argument("--db-url", default=None,
+            help="The database to migrate. Defaults to $KEENE_DB_URL, then the local keene_police_logs database.")
+    args = parser.parse_args()
+
+    connection = db.create_db_engine(args.db_url).connect()
+    try:
+        if args.create:
+            with connection.begin():
+                run_script(connection, os.path.join(SCHEMA_DIR, "create_tables.sql"))
+        applied = migrate(connection)
+        if not applied:
+            print("The schema is up to date")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
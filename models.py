@@ -1,5 +1,5 @@
 # coding: utf-8
-from sqlalchemy import Column, Date, DateTime, ForeignKey, Integer, Numeric, String, text, Boolean
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Index, Integer, Numeric, Sequence, String, Boolean, Float, Text, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -9,7 +9,7 @@ metadata = Base.metadata
 class Arrest(Base):
     __tablename__ = u'arrest'
 
-    id = Column(Integer, primary_key=True, server_default=text("nextval('arrest_id_seq'::regclass)"))
+    id = Column(Integer, Sequence('arrest_id_seq'), primary_key=True)
     incident_id = Column(ForeignKey(u'incident.id'), nullable=False)
     first_name = Column(String(100))
     last_name = Column(String(100))
@@ -19,12 +19,14 @@ class Arrest(Base):
 
     incident = relationship(u'Incident')
 
+    __table_args__ = (Index(u'arrest_incident_id_idx', u'incident_id'),)
+
 
 class Dispatcher(Base):
     __tablename__ = u'dispatcher'
 
-    id = Column(Integer, primary_key=True, server_default=text("nextval('dispatcher_id_seq'::regclass)"))
-    number = Column(Integer)
+    id = Column(Integer, Sequence('dispatcher_id_seq'), primary_key=True)
+    number = Column(Integer, unique=True)
     first_name = Column(String(50))
     last_name = Column(String(50))
 
@@ -32,8 +34,8 @@ class Dispatcher(Base):
 class Incident(Base):
     __tablename__ = u'incident'
 
-    id = Column(Integer, primary_key=True, server_default=text("nextval('incident_id_seq'::regclass)"))
-    report_id = Column(String(10))
+    id = Column(Integer, Sequence('incident_id_seq'), primary_key=True)
+    report_id = Column(String(10), unique=True)
     dispatch_time = Column(DateTime)
     dispatch_source = Column(String(50))
     category = Column(String(50))
@@ -41,6 +43,7 @@ class Incident(Base):
     call_taker_id = Column(ForeignKey(u'dispatcher.id'))
     primary_officer_id = Column(ForeignKey(u'officer.id'))
     geocode_failed = Column(Boolean)
+    geocoded_at = Column(DateTime)
     location = Column(String(300))
     formatted_location = Column(String(1000))
     latitude = Column(Numeric(8, 6))
@@ -52,23 +55,67 @@ class Incident(Base):
     call_taker = relationship(u'Dispatcher')
     primary_officer = relationship(u'Officer')
 
+    __table_args__ = (
+        # for box queries outside Postgres, which narrows on both axes with the GiST
+        # index incident_point_idx in schema/create_tables.sql instead
+        Index(u'incident_lat_lon_idx', u'latitude', u'longitude'),
+        Index(u'incident_dispatch_time_idx', u'dispatch_time'),
+        Index(u'incident_call_taker_id_idx', u'call_taker_id'),
+        Index(u'incident_primary_officer_id_idx', u'primary_officer_id'),
+        Index(u'incident_ungeocoded_idx', u'location', u'id',
+              postgresql_where=text(u'latitude is null'), sqlite_where=text(u'latitude is null')),
+        Index(u'incident_geocoded_at_idx', u'geocoded_at'),
+    )
+
+
+class GeocodeCacheEntry(Base):
+    __tablename__ = u'geocode_cache'
+
+    address_key = Column(String(300), primary_key=True)
+    formatted_address = Column(String(1000))
+    latitude = Column(Numeric(8, 6))
+    longitude = Column(Numeric(8, 6))
+    match_quality = Column(String(50))
+    source = Column(String(50))
+    succeeded = Column(Boolean, nullable=False)
+    looked_up_at = Column(DateTime, nullable=False)
+
+
+class IngestLedger(Base):
+    __tablename__ = u'ingest_ledger'
+
+    id = Column(Integer, Sequence('ingest_ledger_id_seq'), primary_key=True)
+    source_file = Column(String(300), nullable=False, unique=True)
+    content_hash = Column(String(64), nullable=False)
+    report_date = Column(Date)
+    parser_version = Column(Integer)
+    incident_count = Column(Integer)
+    responding_officer_count = Column(Integer)
+    location_change_count = Column(Integer)
+    arrest_count = Column(Integer)
+    summons_count = Column(Integer)
+    protective_custody_count = Column(Integer)
+    loaded_at = Column(DateTime)
+
 
 class LocationChange(Base):
     __tablename__ = u'location_change'
 
-    id = Column(Integer, primary_key=True, server_default=text("nextval('location_change_id_seq'::regclass)"))
+    id = Column(Integer, Sequence('location_change_id_seq'), primary_key=True)
     incident_id = Column(ForeignKey(u'incident.id'), nullable=False)
     location = Column(String(300))
     change_date = Column(Date)
 
     incident = relationship(u'Incident')
 
+    __table_args__ = (Index(u'location_change_incident_id_idx', u'incident_id'),)
+
 
 class Officer(Base):
     __tablename__ = u'officer'
 
-    id = Column(Integer, primary_key=True, server_default=text("nextval('officer_id_seq'::regclass)"))
-    number = Column(Integer)
+    id = Column(Integer, Sequence('officer_id_seq'), primary_key=True)
+    number = Column(Integer, unique=True)
     last_name = Column(String(50))
     first_name = Column(String(50))
 
@@ -76,7 +123,7 @@ class Officer(Base):
 class ProtectiveCustody(Base):
     __tablename__ = u'protective_custody'
 
-    id = Column(Integer, primary_key=True, server_default=text("nextval('protective_custody_id_seq'::regclass)"))
+    id = Column(Integer, Sequence('protective_custody_id_seq'), primary_key=True)
     incident_id = Column(ForeignKey(u'incident.id'), nullable=False)
     first_name = Column(String(100))
     last_name = Column(String(100))
@@ -86,11 +133,13 @@ class ProtectiveCustody(Base):
 
     incident = relationship(u'Incident')
 
+    __table_args__ = (Index(u'protective_custody_incident_id_idx', u'incident_id'),)
+
 
 class RespondingOfficer(Base):
     __tablename__ = u'responding_officer'
 
-    id = Column(Integer, primary_key=True, server_default=text("nextval('responding_officer_id_seq'::regclass)"))
+    id = Column(Integer, Sequence('responding_officer_id_seq'), primary_key=True)
     incident_id = Column(ForeignKey(u'incident.id'), nullable=False)
     officer_id = Column(ForeignKey(u'officer.id'), nullable=False)
     dispatch_time = Column(DateTime)
@@ -100,10 +149,41 @@ class RespondingOfficer(Base):
     incident = relationship(u'Incident')
     officer = relationship(u'Officer')
 
+    __table_args__ = (
+        Index(u'responding_officer_incident_id_idx', u'incident_id'),
+        Index(u'responding_officer_officer_id_idx', u'officer_id'),
+    )
+
+class ResponseRollup(Base):
+    __tablename__ = u'response_rollup'
+
+    report_date = Column(Date, primary_key=True)
+    officer_id = Column(ForeignKey(u'officer.id'), primary_key=True)
+    category = Column(String(50), primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    response_count = Column(Integer, nullable=False)
+    arrival_count = Column(Integer, nullable=False)
+    arrival_seconds = Column(Float, nullable=False)
+    arrival_digest = Column(Text)
+    on_scene_count = Column(Integer, nullable=False)
+    on_scene_seconds = Column(Float, nullable=False)
+    on_scene_digest = Column(Text)
+
+    officer = relationship(u'Officer')
+
+
+class SchemaMigration(Base):
+    __tablename__ = u'schema_migrations'
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(100), nullable=False)
+    applied_at = Column(DateTime, nullable=False)
+
+
 class Summon(Base):
     __tablename__ = u'summons'
 
-    id = Column(Integer, primary_key=True, server_default=text("nextval('summons_id_seq'::regclass)"))
+    id = Column(Integer, Sequence('summons_id_seq'), primary_key=True)
     incident_id = Column(ForeignKey(u'incident.id'), nullable=False)
     first_name = Column(String(100))
     last_name = Column(String(100))
@@ -112,3 +192,5 @@ class Summon(Base):
     address = Column(String(100))
 
     incident = relationship(u'Incident')
+
+    __table_args__ = (Index(u'summons_incident_id_idx', u'incident_id'),)
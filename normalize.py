@@ -0,0 +1,85 @@
+import functools
+import re
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+TAGGED_LOCATION_RE = re.compile("\s*\[.+\]\s*")
+ADDRESS_WITH_NUMBER = re.compile("[1-9][0-9]*\s+")
+ADDRESS_WITH_ZERO_NUMBER = re.compile("^\s*0\s+(.+)")
+WHITESPACE_RE = re.compile(r"\s+")
+
+# locations repeat constantly across incidents, so this many are remembered
+MEMO_SIZE = 50000
+
+def join_wrapped(location, continuation):
+    """ Joins a location to the next line of it when the report wraps the line """
+    return WHITESPACE_RE.sub(" ", location + " " + continuation).strip()
+
+def canonical_locations(locations):
+    """ Collapses the runs of spaces in a column of locations, which the text of a report
+        leaves in a location's line and in the lines it wraps onto, so the same place is
+        always spelled the same way. A pandas Series gives back a Series; anything else a list.
+    """
+    if pandas is not None and isinstance(locations, pandas.Series):
+        return locations.str.replace(WHITESPACE_RE, " ", regex=True).str.strip()
+    spelled = dict((location, WHITESPACE_RE.sub(" ", location).strip())
+                   for location in set(locations) if location is not None)
+    return [spelled.get(location) for location in locations]
+
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def clean_query(query_text):
+    """ Reduces an incident location to an address Bing can geocode, dropping tags
+        like "[KEE 123]" and place names, and turning "X @ Y" into an address or
+        an intersection "X & Y"
+    """
+    q = TAGGED_LOCATION_RE.sub("", query_text)
+    elems = q.split(" - ")
+    q = elems[-1]
+    if "@" in q:
+        elems = q.split("@")
+        if ADDRESS_WITH_NUMBER.match(elems[0]):
+            return elems[0].strip()
+        elif ADDRESS_WITH_NUMBER.match(elems[1]):
+            return elems[1].strip()
+        else:
+            for i in range(len(elems)):
+                elems[i] = ADDRESS_WITH_ZERO_NUMBER.sub(r"\1", elems[i]).strip()
+            q = " & ".join(elems)
+    return q
+
+def address_key(query):
+    """ The key a cleaned query is cached under, insensitive to case and spacing """
+    return WHITESPACE_RE.sub(" ", query).strip().upper()
+
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def normalize_location(location):
+    """ Returns the cleaned query and cache key of an incident location """
+    cleaned_q = clean_query(location)
+    return (cleaned_q, address_key(cleaned_q))
+
+def location_key(location):
+    """ The geocode cache key of an incident location """
+    return normalize_location(location)[1]
+
+def normalize_locations(locations):
+    """ Returns the cleaned query and cache key of each of a column of locations, normalizing
+        each distinct location once. A pandas Series is factorized and gives back a Series
+        with the same index; anything else a list. Missing locations give None.
+    """
+    if pandas is not None and isinstance(locations, pandas.Series):
+        codes, uniques = pandas.factorize(locations)
+        normalized = pandas.Series([normalize_location(u) for u in uniques] + [None], dtype=object)
+        # factorize codes missing values as -1, which picks the trailing None
+        return pandas.Series(normalized.values[codes], index=locations.index, dtype=object)
+    distinct = dict((location, normalize_location(location)) for location in set(locations) if location is not None)
+    return [distinct.get(location) for location in locations]
+
+def location_keys(locations):
+    """ The geocode cache keys of a column of locations, as `normalize_locations` """
+    normalized = normalize_locations(locations)
+    if pandas is not None and isinstance(normalized, pandas.Series):
+        return normalized.map(lambda n: None if n is None else n[1])
+    return [None if n is None else n[1] for n in normalized]
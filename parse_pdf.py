@@ -3,12 +3,18 @@ import re
 import datetime
 import time
 import string
-import models
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import itertools
+import logging
+import instrument
+import normalize
+import records
+import sinks
+import timeparse
 import sqlalchemy.dialects.postgresql
 import psycopg2
 
+from records import Record
+
 DATE_HEADER_RE = re.compile("For\s+Date:\s+(?P<date>[0-9/]+)")
 HEADER_RE = re.compile(r"(?P<recid>[0-9]{2}-[0-9]+)\s+(?P<time>[0-9]{4})" + 
                         "\s+(?P<source>[A-z0-9-\(\)]+)\s+-\s+(?P<category>((([A-Z0-9\(\)-/]+)\s)+|Fraud|Police Training Event))(?P<outcome>[\w /]+)")
@@ -38,6 +44,8 @@ REFER_TO_AUX_RE = re.compile(r"Refer\s+To\s+(?P<aux_type>[\w \/]+):\s+(?P<aux_id
 K9_RE = re.compile(r"K9RIOT.+")
 CALL_CLOSED_BY_RE = re.compile("Call\s+Closed\s+By.+")
 
+log = logging.getLogger(__name__)
+
 class DuplicateError(Exception):
     pass
 
@@ -47,305 +55,449 @@ class ParsingError(Exception):
     """
     pass
 
+FLUSH_INTERVAL = 500
+
+# bump whenever a change to the parser changes the rows it produces,
+# so that the batch importer knows to load every file again
+PARSER_VERSION = 5
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("source", help="The file to read report information from in text format.")
+    parser.add_argument("source", nargs="+", help="The files to read report information from in text format.")
+    parser.add_argument("--db-url", default=None,
+            help="Where to write the records: a Postgres or SQLite URL, csv:///dir or parquet:///dir. "
+                 "Defaults to $KEENE_DB_URL, then the local keene_police_logs database.")
+    parser.add_argument("--bulk", action="store_true",
+            help="Stage the records of every file and write them all at once instead of every {0} records.".format(FLUSH_INTERVAL))
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
-    engine = create_engine("postgresql+psycopg2:///keene_police_logs").connect()
-
-    with open(args.source, "r") as handle:
-    
-        # first, extract the date of the report
-        for line in handle:
-            if line.strip():
-                break
-
-        match = DATE_HEADER_RE.search(line.strip())
-        if not match:
-            raise ParsingError("Unable to interpret header line: {0}".format(line))
-        date_val = datetime.datetime.strptime(match.groupdict()["date"], "%m/%d/%Y")
-
-        print("Processing date {0}".format(date_val))
-
-        # now, remove the next header of field names
-        for line in handle:
-            if line.strip():
-                break
-
-        # now, we're in the guts of the report. Start reading records
-        lines = [l.strip() for l in handle if l.strip()]
-        position = 0
-        Session = sessionmaker(bind  = engine)
-        session = Session()
-        while True:
-            try:
-                (record, position) = read_record(lines, position, date_val, session)
-            except DuplicateError  as e:
-                print(e)
-                break
-
-            if position == -1:
-                break
-        session.commit()
-
-def read_record(lines, position, report_date, db_session):
-    """ Reads a record from the source file defined by `lines` starting at line number `position`.
-        Return a 2-tuple representing:
-            1) the record that was read and 
-            2) the position at which the next record begins, or -1 if the end of the file has been reached
+    with instrument.run(args):
+        load_files(args.source, args.db_url, args.bulk)
+
+def load_files(sources, db_url=None, bulk=False):
+    """ Parses each of `sources` and writes their records to the sink at `db_url` in one transaction """
+    sink = sinks.open_sink(db_url)
+    sink.begin()
+    try:
+        report_dates = set()
+        # write the records as we go so finished records don't pile up in memory
+        for source in sources:
+            for count, record in enumerate(parse_file(source, sink.officers, sink.dispatchers), 1):
+                sink.add(record)
+                if record.incident.dispatch_time is not None:
+                    report_dates.add(record.incident.dispatch_time.date())
+                if not bulk and count % FLUSH_INTERVAL == 0:
+                    sink.flush()
+        sink.flush()
+        sink.refresh_rollups(report_dates)
+        sink.commit()
+    except Exception:
+        sink.rollback()
+        raise
+    finally:
+        sink.close()
+
+def parse_file(source, officers, dispatchers):
+    """ Yields the records of the report in the text file `source` """
+    with open(source, "r") as handle:
+        lines = read_lines(handle)
+        date_val = read_report_date(lines)
+
+        log.info("Processing date %s", date_val)
+
+        try:
+            for record in read_records(lines, date_val, officers, dispatchers):
+                yield record
+        except DuplicateError as e:
+            log.warning("%s: %s", source, e)
+
+class LineReader(object):
+    """ Iterates over the non-blank lines of `handle` with surrounding whitespace removed,
+        keeping the number of the line last returned in `line_number`
     """
-    incident = models.Incident()
 
-    print(lines[position])
-    match = HEADER_RE.match(lines[position])
-    header_info = match.groupdict()
+    def __init__(self, handle):
+        self.handle = handle
+        self.line_number = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        for line in self.handle:
+            self.line_number += 1
+            line = line.strip()
+            if line:
+                return line
+        raise StopIteration()
+
+def read_lines(handle):
+    """ Returns an iterator over the non-blank lines of `handle` with surrounding whitespace removed """
+    return LineReader(handle)
+
+def read_report_date(lines):
+    """ Consumes the preamble of a report from the iterator `lines`, that is the
+        `For Date:` line and the header of field names which follows it.
+        Returns the date of the report.
+    """
+    line = next(lines, "")
+    match = DATE_HEADER_RE.search(line)
+    if not match:
+        raise ParsingError("Unable to interpret header line: {0}".format(line))
+    date_val = timeparse.parse_date(match.groupdict()["date"])
+
+    # now, remove the next header of field names
+    next(lines, None)
+    return date_val
+
+def split_records(lines, skip_repeated_preamble=False):
+    """ Groups the lines of a report into records in a single pass over `lines`.
+        Yields a list of the lines belonging to each record, the first of which
+        is the record header.
+    """
+    for line_number, record_lines in split_numbered_records(lines, skip_repeated_preamble):
+        yield record_lines
 
-    incident.report_id = header_info["recid"]
+def split_numbered_records(lines, skip_repeated_preamble=False):
+    """ Like `split_records`, but yields (line number, lines) pairs, the line number being
+        that of the first line of the record if `lines` came from `read_lines`.
 
-    rectime = datetime.datetime.strptime(header_info["time"], "%H%M").time()
-    timestamp = datetime.datetime.combine(report_date.date(), rectime)
+        Rarely, a file contains its content twice over, preamble and all. That raises
+        `DuplicateError`, unless `skip_repeated_preamble` is set, in which case the
+        preamble is passed over and the records after it are yielded as usual.
+    """
+    record_lines = []
+    first_line = None
+    skip_field_names = False
+    for line in lines:
+        if line.startswith("For Date"):
+            if not skip_repeated_preamble:
+                raise DuplicateError("Duplicated content!")
+            if record_lines:
+                yield (first_line, record_lines)
+                record_lines = []
+            skip_field_names = True
+            continue
+        if skip_field_names:
+            skip_field_names = False
+            if not HEADER_RE.match(line):
+                continue
 
-    incident.dispatch_time = timestamp
-    incident.dispatch_source = header_info["source"]
-    incident.category = header_info["category"]
-    incident.outcome = header_info["outcome"]
+        # check if a new record starts on this line
+        if HEADER_RE.match(line) and record_lines:
+            yield (first_line, record_lines)
+            record_lines = []
+        if not record_lines:
+            first_line = getattr(lines, "line_number", None)
+        record_lines.append(line)
+
+    if record_lines:
+        yield (first_line, record_lines)
+
+def read_records(lines, report_date, officers, dispatchers, quarantine=None):
+    """ Yields a `Record` for each incident in `lines`, reading the lines only once.
+
+        Given a `quarantine` list, a record which can't be read is appended to it as a
+        dict of its line number, lines and error rather than raising, and reading picks
+        up again at the next record header. A repeated preamble is skipped over, and
+        so are the repeated records after it, which are recognized by their report id.
+    """
+    reader = RecordReader(report_date, officers, dispatchers)
+    if quarantine is None:
+        for record_lines in split_records(lines):
+            yield reader.read(record_lines)
+        return
+
+    report_ids = set()
+    for line_number, record_lines in split_numbered_records(lines, skip_repeated_preamble=True):
+        try:
+            record = reader.read(record_lines)
+        except Exception as e:
+            quarantine.append({"line_number" : line_number, "lines" : record_lines,
+                               "error" : u"{0}: {1}".format(type(e).__name__, e)})
+            continue
+        if record.incident.report_id in report_ids:
+            continue
+        report_ids.add(record.incident.report_id)
+        yield record
+
+def read_record(lines, report_date, officers, dispatchers):
+    """ Reads a record from `lines`, the lines of a single record as produced by
+        `split_records`. Returns a `Record` holding the incident that was read and
+        the responding officers, location changes, arrests, summons and
+        protective custodies that belong to it.
+
+        Officers and dispatchers are resolved through the `identity.IdentityCache`
+        instances `officers` and `dispatchers`.
+    """
+    return RecordReader(report_date, officers, dispatchers).read(lines)
+
+# the tags which may begin a line, in the order they're tried, grouped by the type of line they begin
+LINE_TAGS = [
+    ("ignored", ["Call Closed By", "Call Modified By", "Cleared By", "Con:", "Arrived By",
+                 "Dispatched By", "DOB", "Juvenile Arrest", "Enroute By", "Juvenile Protective Custody"]),
+    ("additional_activity", ["Additional Activity:"]),
+    ("call_taker", ["Call Taker:"]),
+    ("location_address", ["Location/Address:", "Location:", "Vicinity of:"]),
+    ("lat_lon", ["Lat:"]),
+    ("location_change", ["Location Change:"]),
+    ("primary_id", ["Primary Id:"]),
+    ("jurisdiction", ["Jurisdiction:"]),
+    ("officer", ["ID:"]),
+    ("refer", ["Refer"]),
+]
+LINE_TYPE_RE = re.compile("|".join("(?P<{0}>{1})".format(line_type, "|".join(re.escape(t) for t in tags))
+                                   for line_type, tags in LINE_TAGS))
+PRINTABLE_RE = re.compile("[{0}]".format(re.escape(string.printable)))
+
+# the counter of each type of line, plus untagged lines which continue the line before
+LINE_COUNTERS = dict((line_type, 'parse_lines_total{{type="{0}"}}'.format(line_type))
+                     for line_type in [t for t, tags in LINE_TAGS] + ["continuation", "blank"])
+
+# the entities introduced by a `Refer To` line:
+# the row type, the attribute of `Record` it's kept in, the tag and RE of its name line,
+# the attribute holding the age, and whether wrapped charges are kept
+REFER_ENTITIES = {
+    "P/C" : (records.ProtectiveCustody, "custodies", "P/C", PC_NAME_RE, "age_at_custody", True),
+    "Arrest" : (records.Arrest, "arrests", "Arrest:", ARREST_NAME_RE, "age_at_arrest", False),
+    "Summons" : (records.Summons, "summons", "Summons:", SUMMONS_NAME_RE, "age_at_summons", False),
+}
+
+def classify_line(line):
+    """ Returns the type of tag which begins `line`, or None if it has no tag """
+    match = LINE_TYPE_RE.match(line)
+    return match.lastgroup if match else None
+
+class RecordReader(object):
+    """ Builds a `Record` from the lines of each record in a report.
+        Every line is classified by a single match of `LINE_TYPE_RE` and passed
+        to the handler for its tag. A line without a tag continues the entity
+        read before it, so it goes to the continuation handler for that entity.
+    """
 
-    newpos = position + 1
-    responding_officers = []
+    def __init__(self, report_date, officers, dispatchers):
+        self.report_date = report_date
+        self.report_day = report_date.date()
+        self.officers = officers
+        self.dispatchers = dispatchers
+
+        self.line_handlers = {
+            "ignored" : self.read_ignored,
+            "additional_activity" : self.read_additional_activity,
+            "call_taker" : self.read_call_taker,
+            "location_address" : self.read_location_address,
+            "lat_lon" : self.read_lat_lon,
+            "location_change" : self.read_location_change,
+            "primary_id" : self.read_primary_id,
+            "jurisdiction" : self.read_jurisdiction,
+            "officer" : self.read_officer,
+            "refer" : self.read_refer,
+        }
+        self.continuation_handlers = {
+            "officer" : self.continue_officer,
+            "refer_P/C" : self.continue_refer,
+            "refer_Arrest" : self.continue_refer,
+            "refer_Summons" : self.continue_refer,
+            "location_change" : self.read_ignored, # sometimes the line wraps around
+            "location_address" : self.continue_location_address,
+            "additional_activity" : self.read_ignored,
+        }
+
+    def read(self, lines):
+        """ Reads the record made up of `lines`, the first of which is the record header """
+        self.incident = records.Incident()
+        self.record = Record(self.incident)
+        self.last_entity_type = None
+        self.last_entity_subtype = None
+        self.entity = None
+
+        start = time.perf_counter()
+        log.debug("%s", lines[0])
+        self.read_header(lines[0])
+
+        counters = instrument.METRICS.counters
+        line_handlers = self.line_handlers
+        continuation_handlers = self.continuation_handlers
+        dispatch_start = time.perf_counter()
+        for line in itertools.islice(lines, 1, None):
+            match = LINE_TYPE_RE.match(line)
+            if match:
+                counters[LINE_COUNTERS[match.lastgroup]] += 1
+                line_handlers[match.lastgroup](line)
+            elif not PRINTABLE_RE.search(line): # skip blanks
+                counters[LINE_COUNTERS["blank"]] += 1
+            elif self.last_entity_type in continuation_handlers:
+                counters[LINE_COUNTERS["continuation"]] += 1
+                continuation_handlers[self.last_entity_type](line)
+            else:
+                raise ParsingError(u"Unrecognized Input '{0}'".format(line))
 
-    last_entity_type = None
-    last_entity_subtype = None
+        end = time.perf_counter()
+        # classifying the lines and running their handlers' regexes, apart from the header
+        instrument.METRICS.observe("parse_line_dispatch_seconds", end - dispatch_start)
+        instrument.METRICS.observe("parse_record_seconds", end - start)
+        return self.record
 
-    for line in lines[newpos:]:
+    def read_header(self, line):
+        match = HEADER_RE.match(line)
+        header_info = match.groupdict()
 
-        # rarely, a file will contain duplicated content
-        if line.startswith("For Date"):
-            raise DuplicateError("Duplicated content!")
+        incident = self.incident
+        incident.report_id = header_info["recid"]
 
-        # check if a new record starts on this line
-        match = HEADER_RE.match(line)
-        if match:
-            break
-
-        # use the beginning of this line to inform which RE to use
-        if line.strip() == '' or not [x for x in line if x in string.printable]: # skip blanks
-            pass
-        elif line.startswith("Call Closed By") or line.startswith("Call Modified By") or \
-                line.startswith("Cleared By") or line.startswith("Con:") or \
-                line.startswith("Arrived By") or line.startswith("Dispatched By") \
-                or line.startswith("DOB") or line.startswith("Juvenile Arrest") or \
-                line.startswith("Enroute By") or line.startswith("Juvenile Protective Custody"):
-            pass # ignore those
-        elif line.startswith("Additional Activity:"):
-            last_entity_type = "additional_activity"
-        elif line.startswith("Call Taker:"):
-            last_entity_type = "call_taker"
-            match = CALL_TAKER_RE.match(line)
-            first_name = match.groupdict()["first_name"].strip()
-            last_name = match.groupdict()["last_name"].strip()
-            number = int(match.groupdict()["number"].strip())
-
-            dispatcher = db_session.query(models.Dispatcher).filter(models.Dispatcher.number == number).first()
-            if not dispatcher:
-                disp = models.Dispatcher(number = number, first_name = first_name, last_name = last_name)
-                db_session.add(disp)
-            incident.call_taker = dispatcher
-
-        elif line.startswith("Location/Address:") or line.startswith("Location:") or line.startswith("Vicinity of:"):
-            last_entity_type = "location_address"
-            match = LOCATION_RE.match(line)
-            location = match.groupdict()["addr"].strip()
-            incident.location = location
-
-        elif line.startswith("Lat:"):
-            last_entity_type = "lat_lon"
-            match = LAT_LON_RE.match(line)
-            incident.latitude = float(match.groupdict()["lat"].strip())
-            incident.longitude = float(match.groupdict()["lon"].strip())
-
-        elif line.startswith("Location Change:"):
-            last_entity_type = "location_change"
-            match = LOCATION_CHANGE_RE.match(line)
-            location_and_date = match.groupdict()["addr"].strip()
-            mod_date_match = MODIFIED_RE.search(location_and_date)
-            if mod_date_match: # sometimes the line wraps around
-                mod_date = mod_date_match.groupdict()["moddate"].strip()
-                change_date = datetime.datetime.strptime(mod_date, "%m/%d/%Y%H%M")
-            else:
-               change_date = None
-            if "[Modified" in location_and_date:
-                location = location_and_date[:location_and_date.index("[Modified")]
-            else:
-                location = location_and_date
-
-            loc_change = models.LocationChange(incident = incident, location=location, change_date=change_date)
-            db_session.add(loc_change)
-        elif line.startswith("Primary Id:"):
-            last_entity_type = "primary_id"
-            match = PRIMARY_ID_RE.match(line)
-            first_name = match.groupdict()["first_name"].strip()
-            last_name = match.groupdict()["last_name"].strip()
-            number = int(match.groupdict()["number"].strip())
-
-            officer = db_session.query(models.Officer).filter(models.Officer.number == number).first()
-            if not officer:
-                officer = models.Officer(number = number, first_name = first_name, last_name = last_name)
-                db_session.add(officer)
-
-            incident.primary_officer = officer
-
-        elif line.startswith("Jurisdiction:"):
-            last_entity_type = "jurisdiction"
-            match = JURISDICTION_RE.match(line)
-            incident.jurisdiction = match.groupdict()["juris"].strip()
-
-        elif line.startswith("ID:"):
-            last_entity_type = "officer"
-            match = OFFICER_ID_RE.match(line)
-            first_name = match.groupdict()["first_name"].strip()
-            last_name = match.groupdict()["last_name"].strip()
-            number_str = match.groupdict()["number"].strip()
-            if number_str.startswith("K9"):
-                number_str = "9000"
-            number = int(number_str)
-
-            officer = db_session.query(models.Officer).filter(models.Officer.number == number).first()
-            if not officer:
-                officer = models.Officer(number = number, first_name = first_name, last_name = last_name)
-                db_session.add(officer)
-
-            resp_officer = models.RespondingOfficer(incident = incident, officer = officer)
-            db_session.add(resp_officer)
-            responding_officers.append(resp_officer)
-
-        elif line.startswith("Refer"):
-            match = REFER_TO_AUX_RE.match(line)
-            aux_type = match.groupdict()["aux_type"].strip()
-            aux_id = match.groupdict()["aux_id"].strip()
-            last_entity_type = "refer_" + aux_type
-
-            incident.aux_event_type = aux_type
-            incident.aux_event_id = aux_id
-            if aux_type == "P/C":
-                custody = models.ProtectiveCustody(incident=incident)
-                db_session.add(custody)
-            elif aux_type == "Arrest":
-                arrest = models.Arrest(incident=incident)
-                db_session.add(arrest)
-            elif aux_type == "Summons":
-                summons = models.Summon(incident=incident)
-                db_session.add(summons)
-
-        elif last_entity_type == "officer" and HANGING_OFFICER_ID_RE.match(line):
-            pass # not sure what this means when it's present
-
-        # probably a continuation of a previous tag
-        elif last_entity_type == "officer":
-            response = responding_officers[-1]
-            arv_match = ARRIVAL_RE.match(line)
-            k9_match = K9_RE.match(line)
-
-            if arv_match:
-                cleared_time = arv_match.groupdict()["clrdtime"]
-                arrival_time = arv_match.groupdict()["arvtime"]
-                dispatch_time = arv_match.groupdict()["disptime"]
-                
-                if cleared_time and len(cleared_time) == 8:
-                    response.cleared_time = datetime.datetime.combine(report_date.date(),
-                            datetime.datetime.strptime(cleared_time, "%H:%M:%S").time())
-                elif cleared_time:
-                    response.cleared_time = datetime.datetime.strptime(cleared_time, "%m/%d/%Y @ %H:%M:%S")
-
-                if arrival_time and len(arrival_time) == 8:
-                    response.arrival_time = datetime.datetime.combine(report_date.date(),
-                            datetime.datetime.strptime(arrival_time, "%H:%M:%S").time())
-                elif arrival_time:
-                    response.arrival_time = datetime.datetime.strptime(arrival_time, "%m/%d/%Y @ %H:%M:%S")
-
-                if dispatch_time and len(dispatch_time) == 8:
-                    response.dispatch_time = datetime.datetime.combine(report_date.date(),
-                            datetime.datetime.strptime(dispatch_time, "%H:%M:%S").time())
-                elif dispatch_time:
-                    response.dispatch_time = datetime.datetime.strptime(dispatch_time, "%m/%d/%Y @ %H:%M:%S")
-
-            elif k9_match:
-                pass # can't use this right now
-            else:
-                raise ParsingError("Unrecognized Input {0}".format(line))
-        elif last_entity_type == "refer_P/C":
-            if line.startswith("P/C"):
-                match = PC_NAME_RE.match(line)
-                custody.last_name = match.groupdict()["last_name"]
-                custody.first_name = match.groupdict()["first_name"]
-            elif line.startswith("Address"):
-                match = ADDRESS_RE.match(line)
-                custody.address = match.groupdict()["address"].strip()
-            elif line.startswith("Age"):
-                match = AGE_RE.match(line)
-                custody.age_at_custody = int(match.groupdict()["age"].strip())
-            elif line.startswith("Charges"):
-                last_entity_subtype = "charges"
-                match = CHARGES_RE.match(line)
-                custody.charges = match.groupdict()["charges"].strip()
-            elif last_entity_subtype == "charges":
-                custody.charges += "," + line.strip()
-            else:
-                raise ParsingError("Unrecognized Input {0}".format(line))
-        elif last_entity_type == "refer_Arrest":
-            if line.startswith("Arrest:"):
-                match = ARREST_NAME_RE.match(line)
-                arrest.last_name = match.groupdict()["last_name"]
-                arrest.first_name = match.groupdict()["first_name"]
-            elif line.startswith("Address"):
-                match = ADDRESS_RE.match(line)
-                arrest.address = match.groupdict()["address"].strip()
-            elif line.startswith("Age"):
-                match = AGE_RE.match(line)
-                arrest.age = int(match.groupdict()["age"].strip())
-            elif line.startswith("Charges"):
-                last_entity_subtype = "charges"
-                match = CHARGES_RE.match(line)
-                arrest.charges = match.groupdict()["charges"].strip()
-            elif last_entity_subtype == "charges":
-                pass # ignore duplicated charges
-            else:
-                raise ParsingError("Unrecognized Input {0}".format(line))
-        elif last_entity_type == "refer_Summons":
-            if line.startswith("Summons:"):
-                match = SUMMONS_NAME_RE.match(line)
-                summons.last_name = match.groupdict()["last_name"]
-                summons.first_name = match.groupdict()["first_name"]
-            elif line.startswith("Address"):
-                match = ADDRESS_RE.match(line)
-                summons.address = match.groupdict()["address"].strip()
-            elif line.startswith("Age"):
-                match = AGE_RE.match(line)
-                summons.age = int(match.groupdict()["age"].strip())
-            elif line.startswith("Charges"):
-                last_entity_subtype = "charges"
-                match = CHARGES_RE.match(line)
-                summons.charges = match.groupdict()["charges"].strip()
-            elif last_entity_subtype == "charges":
-                pass # ignore duplicated charges
-            else:
-                raise ParsingError("Unrecognized Input {0}".format(line))
-        elif last_entity_type == "location_change":
-            pass # sometimes the line wraps around
-        elif last_entity_type == "location_address" and not ":" in line:
-            incident.location += " " + line.strip()
-        elif last_entity_type == "additional_activity":
-            pass 
-        else:
-            raise ParsingError(u"Unrecognized Input '{0}'".format(line))
+        incident.dispatch_time = datetime.datetime.combine(self.report_day, timeparse.parse_hhmm(header_info["time"]))
+        incident.dispatch_source = header_info["source"]
+        incident.category = header_info["category"]
+        incident.outcome = header_info["outcome"]
+
+    def read_ignored(self, line):
+        pass
 
-        newpos += 1
+    def read_additional_activity(self, line):
+        self.last_entity_type = "additional_activity"
 
-    db_session.add(incident)
-    if newpos == len(lines):
-        return (None, -1)
-    else:
-        return (None, newpos)
+    def read_call_taker(self, line):
+        self.last_entity_type = "call_taker"
+        match = CALL_TAKER_RE.match(line)
+        first_name = match.groupdict()["first_name"].strip()
+        last_name = match.groupdict()["last_name"].strip()
+        number = int(match.groupdict()["number"].strip())
+
+        self.incident.call_taker = self.dispatchers.get_or_create(number, first_name, last_name)
+
+    def read_location_address(self, line):
+        self.last_entity_type = "location_address"
+        match = LOCATION_RE.match(line)
+        self.incident.location = match.groupdict()["addr"].strip()
+
+    def continue_location_address(self, line):
+        if ":" in line:
+            raise ParsingError(u"Unrecognized Input '{0}'".format(line))
+        self.incident.location = normalize.join_wrapped(self.incident.location, line)
+
+    def read_lat_lon(self, line):
+        self.last_entity_type = "lat_lon"
+        match = LAT_LON_RE.match(line)
+        self.incident.latitude = float(match.groupdict()["lat"].strip())
+        self.incident.longitude = float(match.groupdict()["lon"].strip())
+
+    def read_location_change(self, line):
+        self.last_entity_type = "location_change"
+        match = LOCATION_CHANGE_RE.match(line)
+        location_and_date = match.groupdict()["addr"].strip()
+        mod_date_match = MODIFIED_RE.search(location_and_date)
+        if mod_date_match: # sometimes the line wraps around
+            mod_date = mod_date_match.groupdict()["moddate"].strip()
+            change_date = timeparse.parse_compact_stamp(mod_date)
+        else:
+            change_date = None
+        if "[Modified" in location_and_date:
+            location = location_and_date[:location_and_date.index("[Modified")]
+        else:
+            location = location_and_date
+
+        loc_change = records.LocationChange(location=location, change_date=change_date)
+        self.record.location_changes.append(loc_change)
+
+    def read_primary_id(self, line):
+        self.last_entity_type = "primary_id"
+        match = PRIMARY_ID_RE.match(line)
+        first_name = match.groupdict()["first_name"].strip()
+        last_name = match.groupdict()["last_name"].strip()
+        number = int(match.groupdict()["number"].strip())
+
+        self.incident.primary_officer = self.officers.get_or_create(number, first_name, last_name)
+
+    def read_jurisdiction(self, line):
+        self.last_entity_type = "jurisdiction"
+        match = JURISDICTION_RE.match(line)
+        self.incident.jurisdiction = match.groupdict()["juris"].strip()
+
+    def read_officer(self, line):
+        self.last_entity_type = "officer"
+        match = OFFICER_ID_RE.match(line)
+        first_name = match.groupdict()["first_name"].strip()
+        last_name = match.groupdict()["last_name"].strip()
+        number_str = match.groupdict()["number"].strip()
+        if number_str.startswith("K9"):
+            number_str = "9000"
+        number = int(number_str)
+
+        officer = self.officers.get_or_create(number, first_name, last_name)
+        resp_officer = records.RespondingOfficer(officer = officer)
+        self.record.responding_officers.append(resp_officer)
+
+    def continue_officer(self, line):
+        if HANGING_OFFICER_ID_RE.match(line):
+            return # not sure what this means when it's present
+
+        response = self.record.responding_officers[-1]
+        arv_match = ARRIVAL_RE.match(line)
+        k9_match = K9_RE.match(line)
+
+        if arv_match:
+            times = arv_match.groupdict()
+            # read in the order they happened, so that each can roll past midnight after the one before
+            previous = self.incident.dispatch_time
+            if times["disptime"]:
+                response.dispatch_time = previous = self.read_time(times["disptime"], previous)
+            if times["arvtime"]:
+                response.arrival_time = previous = self.read_time(times["arvtime"], previous)
+            if times["clrdtime"]:
+                response.cleared_time = self.read_time(times["clrdtime"], previous)
+
+        elif k9_match:
+            pass # can't use this right now
+        else:
+            raise ParsingError("Unrecognized Input {0}".format(line))
+
+    def read_time(self, value, after=None):
+        """ Reads a time given either as HH:MM:SS on the day of the report or as MM/DD/YYYY @ HH:MM:SS.
+            An HH:MM:SS time well before `after`, the time it follows, is taken to be the next day.
+        """
+        if len(value) == 8:
+            return timeparse.roll_forward(timeparse.on_day(self.report_day, value), after)
+        return timeparse.parse_stamp(value)
+
+    def read_refer(self, line):
+        match = REFER_TO_AUX_RE.match(line)
+        aux_type = match.groupdict()["aux_type"].strip()
+        aux_id = match.groupdict()["aux_id"].strip()
+        self.last_entity_type = "refer_" + aux_type
+
+        self.incident.aux_event_type = aux_type
+        self.incident.aux_event_key = aux_id
+        if aux_type in REFER_ENTITIES:
+            row_type, collection = REFER_ENTITIES[aux_type][:2]
+            self.entity = row_type()
+            getattr(self.record, collection).append(self.entity)
+
+    def continue_refer(self, line):
+        """ Reads a line describing the person in a protective custody, arrest or summons """
+        name_tag, name_re, age_attr, keep_wrapped_charges = REFER_ENTITIES[self.last_entity_type[len("refer_"):]][2:]
+        entity = self.entity
+
+        if line.startswith(name_tag):
+            match = name_re.match(line)
+            entity.last_name = match.groupdict()["last_name"]
+            entity.first_name = match.groupdict()["first_name"]
+        elif line.startswith("Address"):
+            match = ADDRESS_RE.match(line)
+            entity.address = match.groupdict()["address"].strip()
+        elif line.startswith("Age"):
+            match = AGE_RE.match(line)
+            setattr(entity, age_attr, int(match.groupdict()["age"].strip()))
+        elif line.startswith("Charges"):
+            self.last_entity_subtype = "charges"
+            match = CHARGES_RE.match(line)
+            entity.charges = match.groupdict()["charges"].strip()
+        elif self.last_entity_subtype == "charges":
+            if keep_wrapped_charges:
+                entity.charges += "," + line.strip()
+            # otherwise ignore duplicated charges
+        else:
+            raise ParsingError("Unrecognized Input {0}".format(line))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,316 @@
+import argparse
+import collections
+import datetime
+import decimal
+import json
+import logging
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import db
+import instrument
+import models
+import rollups
+import spatial
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.pool import QueuePool
+
+POOL_SIZE = 8
+CACHE_SIZE = 1000
+# a cached response is dropped after this many seconds even if nothing was loaded or geocoded
+CACHE_TTL = 300
+# how often to look for newly loaded reports and geocoded incidents, in seconds
+INGEST_CHECK_INTERVAL = 5
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+INCIDENT_COLUMNS = ["id", "report_id", "dispatch_time", "dispatch_source", "category", "outcome",
+                    "location", "formatted_location", "latitude", "longitude", "jurisdiction",
+                    "aux_event_type", "aux_event_key"]
+
+log = logging.getLogger(__name__)
+
+class BadRequest(ValueError):
+    pass
+
+class ResponseCache(object):
+    """ The most recently used responses, each kept for up to `ttl` seconds.
+        Shared by the request threads, so every access holds the lock.
+    """
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL, clock=time.monotonic):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class IngestWatcher(object):
+    """ Notices when reports have been loaded or incidents geocoded, by the latest load in
+        the ingest ledger, the largest incident id, which catches loads that skip the
+        ledger, and the latest `geocoded_at`. The database is asked at most every
+        `interval` seconds.
+    """
+
+    def __init__(self, engine, interval=INGEST_CHECK_INTERVAL, clock=time.monotonic):
+        self.engine = engine
+        self.interval = interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.last_state = None
+        self.checked_at = None
+
+    def changed(self):
+        """ True if something was loaded or geocoded since the last time this returned """
+        with self.lock:
+            now = self.clock()
+            if self.checked_at is not None and now - self.checked_at < self.interval:
+                return False
+            self.checked_at = now
+            ingest = models.IngestLedger.__table__
+            incident = models.Incident.__table__
+            with self.engine.connect() as connection:
+                state = tuple(connection.execute(select([
+                    select([func.max(ingest.c.loaded_at)]).as_scalar(),
+                    select([func.max(incident.c.id)]).as_scalar(),
+                    select([func.max(incident.c.geocoded_at)]).as_scalar()])).first())
+            changed = self.last_state is not None and state != self.last_state
+            self.last_state = state
+            return changed
+
+def create_engine(url=None, pool_size=POOL_SIZE):
+    """ An engine whose pool of `pool_size` connections is shared by the request threads """
+    if db.database_url(url).startswith("sqlite"):
+        # SQLite connections are otherwise neither pooled nor allowed to change threads
+        return db.create_db_engine(url, poolclass=QueuePool, pool_size=pool_size,
+                                   connect_args={"check_same_thread" : False})
+    return db.create_db_engine(url, pool_size=pool_size, pool_pre_ping=True)
+
+def parse_date(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise BadRequest("{0} must be a date as YYYY-MM-DD".format(name))
+
+def parse_number(params, name, kind=int):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return kind(value)
+    except ValueError:
+        raise BadRequest("{0} must be a number".format(name))
+
+def parse_bbox(params):
+    """ Reads `bbox` as south,west,north,east in degrees """
+    value = params.get("bbox")
+    if value is None:
+        return None
+    try:
+        south, west, north, east = [float(v) for v in value.split(",")]
+    except ValueError:
+        raise BadRequest("bbox must be south,west,north,east")
+    return (south, west, north, east)
+
+def parse_cursor(params):
+    """ Reads the `after` cursor of a page, the dispatch time and id of the last incident before it """
+    value = params.get("after")
+    if value is None:
+        return None
+    moment, _, incident_id = value.rpartition("_")
+    try:
+        return (datetime.datetime.strptime(moment, "%Y-%m-%dT%H:%M:%S"), int(incident_id))
+    except ValueError:
+        raise BadRequest("after must be a cursor from the next field of a page")
+
+def json_value(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+def query_incidents(connection, params):
+    """ Returns a page of incidents in dispatch order matching `params`, a dict of query
+        parameters: `start` and `end` dates, `category`, the badge number of a responding
+        `officer`, a `bbox` and the `limit` of the page. A page holds the cursor of the
+        next in `next`, to be passed back as `after`, so no page costs more than the first.
+    """
+    incident = models.Incident.__table__
+    start = parse_date(params, "start")
+    end = parse_date(params, "end")
+    officer_number = parse_number(params, "officer")
+    bbox = parse_bbox(params)
+    cursor = parse_cursor(params)
+    limit = parse_number(params, "limit")
+    if limit is None:
+        limit = PAGE_SIZE
+    elif not 0 < limit <= MAX_PAGE_SIZE:
+        raise BadRequest("limit must be from 1 to {0}".format(MAX_PAGE_SIZE))
+
+    query = select([incident.c[c] for c in INCIDENT_COLUMNS]).where(incident.c.dispatch_time != None)
+    if start is not None:
+        query = query.where(incident.c.dispatch_time >= datetime.datetime.combine(start, datetime.time()))
+    if end is not None:
+        query = query.where(incident.c.dispatch_time < datetime.datetime.combine(end, datetime.time()))
+    if params.get("category") is not None:
+        query = query.where(incident.c.category == params["category"])
+    if officer_number is not None:
+        responding = models.RespondingOfficer.__table__
+        officer = models.Officer.__table__
+        query = query.where(incident.c.id.in_(select([responding.c.incident_id])
+            .select_from(responding.join(officer, responding.c.officer_id == officer.c.id))
+            .where(officer.c.number == officer_number)))
+    if bbox is not None:
+        query = query.where(spatial.box_condition(*bbox, dialect_name=connection.dialect.name))
+    if cursor is not None:
+        moment, incident_id = cursor
+        query = query.where(or_(incident.c.dispatch_time > moment,
+                                and_(incident.c.dispatch_time == moment, incident.c.id > incident_id)))
+
+    # one more than the page, to tell whether there's another
+    rows = connection.execute(query.order_by(incident.c.dispatch_time, incident.c.id).limit(limit + 1)).fetchall()
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = "{0}_{1}".format(last["dispatch_time"].strftime("%Y-%m-%dT%H:%M:%S"), last["id"])
+    return {
+        "incidents" : [dict((c, json_value(row[c])) for c in INCIDENT_COLUMNS) for row in page],
+        "next" : next_cursor,
+    }
+
+def query_response_times(connection, params):
+    """ Returns the response time summaries of report dates from `start` up to `end`,
+        grouped by the comma separated columns of `by`, from the response rollups
+    """
+    start = parse_date(params, "start")
+    end = parse_date(params, "end")
+    if start is None or end is None:
+        raise BadRequest("start and end are required")
+    by = tuple(params.get("by", "officer_id").split(","))
+    if not set(by) <= set(["report_date", "officer_id", "category", "hour"]):
+        raise BadRequest("by may only name report_date, officer_id, category and hour")
+    summaries = rollups.summarize(connection, start, end, by)
+    return {"groups" : [dict(list(zip(by, [json_value(v) for v in key])) + list(summary.items()))
+                        for key, summary in sorted(summaries.items(), key=lambda item: str(item[0]))]}
+
+ROUTES = {
+    "/incidents" : query_incidents,
+    "/response_times" : query_response_times,
+}
+
+class QueryService(object):
+    """ Answers the routes in `ROUTES` from a pooled engine, caching the responses until
+        the cache entry expires or reports are loaded or geocoded
+    """
+
+    def __init__(self, engine, cache=None, watcher=None):
+        self.engine = engine
+        self.cache = cache or ResponseCache()
+        self.watcher = watcher or IngestWatcher(engine)
+
+    def respond(self, path, params):
+        """ Returns the status, JSON body and whether the body came from the cache """
+        if path == "/health":
+            return (200, json.dumps({"cache_entries" : len(self.cache.entries), "cache_hits" : self.cache.hits,
+                                     "cache_misses" : self.cache.misses}).encode("utf-8"), False)
+        route = ROUTES.get(path)
+        if route is None:
+            return (404, json.dumps({"error" : "no such route {0}".format(path)}).encode("utf-8"), False)
+
+        if self.watcher.changed():
+            log.info("Reports were loaded or geocoded; clearing %s cached responses", len(self.cache.entries))
+            self.cache.clear()
+        key = (path, tuple(sorted(params.items())))
+        body = self.cache.get(key)
+        if body is not None:
+            return (200, body, True)
+        try:
+            with self.engine.connect() as connection:
+                body = json.dumps(route(connection, params)).encode("utf-8")
+        except BadRequest as e:
+            return (400, json.dumps({"error" : str(e)}).encode("utf-8"), False)
+        self.cache.put(key, body)
+        return (200, body, False)
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """ Serves GET requests for the `QueryService` in `server.service` """
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict((k, v[-1]) for k, v in urllib.parse.parse_qs(url.query).items())
+        try:
+            status, body, cached = self.server.service.respond(url.path.rstrip("/") or "/", params)
+        except Exception:
+            log.exception("Failed to answer %s", self.path)
+            status, body, cached = (500, json.dumps({"error" : "internal error"}).encode("utf-8"), False)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Cache", "hit" if cached else "miss")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("%s " + format, self.address_string(), *args)
+
+def make_server(service, host="localhost", port=8080):
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.service = service
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves read-only queries over the incident database as JSON.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db-url", default=None,
+            help="The database to query. Defaults to $KEENE_DB_URL, then the local keene_police_logs database.")
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE, help="Database connections to keep open.")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="Responses to keep cached.")
+    parser.add_argument("--cache-ttl", type=float, default=CACHE_TTL, help="Seconds to keep a cached response.")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument.run(args):
+        service = QueryService(create_engine(args.db_url, args.pool_size), ResponseCache(args.cache_size, args.cache_ttl))
+        server = make_server(service, args.host, args.port)
+        log.info("Serving on http://%s:%s", args.host, args.port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import models
+
+class Row(object):
+    """ A row read from a report, as a plain object with `__slots__` rather than a
+        SQLAlchemy model, so that it's cheap to build, small in memory and quick to
+        pickle back from a worker process. The attributes are named for the columns
+        of the matching model and start out as None.
+    """
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.pop(name, None))
+        if values:
+            raise TypeError("{0} has no attributes {1}".format(type(self).__name__, ", ".join(sorted(values))))
+
+    # pickled as a bare tuple of values, which is smaller and quicker than the default for slots
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__,
+                                 ", ".join("{0}={1!r}".format(name, getattr(self, name)) for name in self.__slots__
+                                           if not isinstance(getattr(self, name), Row)))
+
+class PersonRef(Row):
+    """ An officer or dispatcher, known by badge number. `id` is given by the loader which writes them. """
+    __slots__ = ("id", "number", "first_name", "last_name")
+
+class Incident(Row):
+    """ `call_taker` and `primary_officer` are `PersonRef` instances """
+    __slots__ = ("report_id", "dispatch_time", "dispatch_source", "category", "outcome",
+                 "call_taker", "primary_officer", "location", "latitude", "longitude",
+                 "jurisdiction", "aux_event_type", "aux_event_key")
+
+class RespondingOfficer(Row):
+    """ `officer` is a `PersonRef` """
+    __slots__ = ("officer", "dispatch_time", "arrival_time", "cleared_time")
+
+class LocationChange(Row):
+    __slots__ = ("location", "change_date")
+
+class Arrest(Row):
+    __slots__ = ("first_name", "last_name", "age_at_arrest", "charges", "address")
+
+class Summons(Row):
+    __slots__ = ("first_name", "last_name", "age_at_summons", "charges", "address")
+
+class ProtectiveCustody(Row):
+    __slots__ = ("first_name", "last_name", "address", "age_at_custody", "charges")
+
+class Record(object):
+    """ An incident read from the report, along with the
+        rows that hang off of it
+    """
+    __slots__ = ("incident", "responding_officers", "location_changes", "arrests", "summons", "custodies")
+
+    def __init__(self, incident):
+        self.incident = incident
+        self.responding_officers = []
+        self.location_changes = []
+        self.arrests = []
+        self.summons = []
+        self.custodies = []
+
+    def __getstate__(self):
+        return (self.incident, self.responding_officers, self.location_changes,
+                self.arrests, self.summons, self.custodies)
+
+    def __setstate__(self, state):
+        (self.incident, self.responding_officers, self.location_changes,
+         self.arrests, self.summons, self.custodies) = state
+
+    def rows(self):
+        """ Returns every row read for this record """
+        return [self.incident] + self.responding_officers + self.location_changes + \
+                self.arrests + self.summons + self.custodies
+
+# the model each type of row becomes, for code that works through a session
+MODELS = {
+    Incident : models.Incident,
+    RespondingOfficer : models.RespondingOfficer,
+    LocationChange : models.LocationChange,
+    Arrest : models.Arrest,
+    Summons : models.Summon,
+    ProtectiveCustody : models.ProtectiveCustody,
+}
+
+def orm_rows(record, officers=None, dispatchers=None):
+    """ Builds the SQLAlchemy objects to persist `record` through a session. `officers` and
+        `dispatchers` map badge numbers to the `models.Officer` and `models.Dispatcher`
+        objects already built, so that each person is only built once across records.
+    """
+    officers = {} if officers is None else officers
+    dispatchers = {} if dispatchers is None else dispatchers
+
+    def person(people, model, ref):
+        if ref is None:
+            return None
+        if ref.number not in people:
+            people[ref.number] = model(id = ref.id, number = ref.number,
+                                       first_name = ref.first_name, last_name = ref.last_name)
+        return people[ref.number]
+
+    def build(row, **links):
+        values = dict((name, getattr(row, name)) for name in row.__slots__ if name not in links)
+        values.update(links)
+        return MODELS[type(row)](**values)
+
+    incident = build(record.incident,
+                     call_taker = person(dispatchers, models.Dispatcher, record.incident.call_taker),
+                     primary_officer = person(officers, models.Officer, record.incident.primary_officer))
+    rows = [incident]
+    for response in record.responding_officers:
+        rows.append(build(response, incident = incident, officer = person(officers, models.Officer, response.officer)))
+    for row in record.location_changes + record.arrests + record.summons + record.custodies:
+        rows.append(build(row, incident = incident))
+    return rows
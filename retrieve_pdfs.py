@@ -1,36 +1,167 @@
+
 from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import datetime
+import json
 import requests
-import requests_cache
+import threading
 import re
 import os
 
-requests_cache.install_cache("log_cache")
-rcache = requests_cache.get_cache()
+BASE_URL = "http://www.ci.keene.nh.us"
+CHUNK_SIZE = 1 << 16
+# seconds to wait to connect, and then between bytes, before giving up on a request
+TIMEOUT = 60
 
 # these pages represent yearly archives
 yearly_archive_pages = [
-    "http://www.ci.keene.nh.us/node/362",
-    "http://www.ci.keene.nh.us/node/89312",
-    "http://www.ci.keene.nh.us/node/88748",
-    "http://www.ci.keene.nh.us/node/90175",
-    "http://www.ci.keene.nh.us/node/90489",
-    "http://www.ci.keene.nh.us/node/90805",
-    "http://www.ci.keene.nh.us/node/90174",
+    "/node/362",
+    "/node/89312",
+    "/node/88748",
+    "/node/90175",
+    "/node/90489",
+    "/node/90805",
+    "/node/90174",
 ]
 
+class Manifest(object):
+    """ The PDFs fetched so far, keyed by URL, along with the validators
+        the server sent for them. Safe to update from several threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as handle:
+                self.entries = json.load(handle)
+        else:
+            self.entries = {}
+
+    def get(self, url):
+        with self.lock:
+            return self.entries.get(url)
+
+    def update(self, url, entry):
+        with self.lock:
+            self.entries[url] = entry
+
+    def save(self):
+        with self.lock:
+            with open(self.path + ".tmp", "w") as handle:
+                json.dump(self.entries, handle, indent=2, sort_keys=True)
+            os.replace(self.path + ".tmp", self.path)
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dest", default="pdfs", help="The directory to save PDFs in.")
+    parser.add_argument("--manifest", default=None,
+            help="The file recording fetched URLs. Defaults to manifest.json in the destination directory.")
+    parser.add_argument("--workers", type=int, default=8, help="The most downloads to run at once.")
+    parser.add_argument("--revalidate", action="store_true",
+            help="Ask the server whether PDFs already on disk have changed instead of skipping them.")
+    parser.add_argument("--base-url", default=BASE_URL, help="The site to retrieve logs from.")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT,
+            help="Seconds to wait on the server before giving up on a request.")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dest):
+        os.makedirs(args.dest)
+    manifest = Manifest(args.manifest or os.path.join(args.dest, "manifest.json"))
+    session = make_session(args.workers)
+
+    urls = []
     for page in yearly_archive_pages:
-        page_resp = requests.get(page)
-        soup = BeautifulSoup(page_resp.text, parse_only=SoupStrainer('a'))
-        for link in soup.find_all("a", href=re.compile(".*\.pdf")):
-            if not "http" in link["href"]:
-                url = "http://www.ci.keene.nh.us" + link["href"]
-            else:
-                url = link["href"]
-
-            with open("pdfs/{0}".format(os.path.basename(url)), "wb") as handle:
-                handle.write(requests.get(url).content)
+        urls.extend(find_pdf_links(session, args.base_url, page, args.timeout))
+
+    counts = {}
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            results = pool.map(lambda url: fetch_pdf(session, url, args.dest, manifest, args.revalidate, args.timeout),
+                               urls)
+            for url, status in zip(urls, results):
+                counts[status] = counts.get(status, 0) + 1
+                if status not in ("skipped", "failed"):
+                    print("{0} {1}".format(status, url))
+    finally:
+        # keep whatever was downloaded, even if the run was cut short
+        manifest.save()
+    print(counts)
+
+def make_session(pool_size):
+    """ Returns a session whose connection pool can serve `pool_size` threads at once """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def find_pdf_links(session, base_url, page, timeout=TIMEOUT):
+    """ Returns the absolute URL of every PDF linked from the archive page at `page` """
+    page_resp = session.get(base_url + page, timeout=timeout)
+    page_resp.raise_for_status()
+    soup = BeautifulSoup(page_resp.text, "html.parser", parse_only=SoupStrainer('a'))
+    urls = []
+    for link in soup.find_all("a", href=re.compile(r".*\.pdf")):
+        if not "http" in link["href"]:
+            urls.append(base_url + link["href"])
+        else:
+            urls.append(link["href"])
+    return urls
+
+def fetch_pdf(session, url, dest, manifest, revalidate=False, timeout=TIMEOUT):
+    """ Downloads the PDF at `url` into `dest`, streaming it to disk.
+        A PDF already on disk is skipped, or with `revalidate` only downloaded again if
+        the server says it has changed since the ETag/Last-Modified in the manifest.
+        Returns one of "skipped", "not modified", "fetched" or "failed", the
+        last after printing what went wrong.
+    """
+    path = os.path.join(dest, os.path.basename(url))
+    try:
+        return download_pdf(session, url, path, manifest, revalidate, timeout)
+    except (requests.RequestException, OSError) as e:
+        print("failed {0}: {1}".format(url, e))
+        if os.path.exists(path + ".part"):
+            os.remove(path + ".part")
+        return "failed"
+
+def download_pdf(session, url, path, manifest, revalidate, timeout):
+    """ Does the work of `fetch_pdf`, letting any error through """
+    entry = manifest.get(url)
+    headers = {}
+    if os.path.exists(path):
+        if not revalidate:
+            return "skipped"
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    r = session.get(url, headers=headers, stream=True, timeout=timeout)
+    try:
+        if r.status_code == 304:
+            return "not modified"
+        r.raise_for_status()
+
+        # write to a temporary file so an interrupted download never looks complete
+        size = 0
+        with open(path + ".part", "wb") as handle:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                handle.write(chunk)
+                size += len(chunk)
+        os.replace(path + ".part", path)
+    finally:
+        r.close()
+
+    manifest.update(url, {
+        "file" : os.path.basename(path),
+        "etag" : r.headers.get("ETag"),
+        "last_modified" : r.headers.get("Last-Modified"),
+        "size" : size,
+        "fetched_at" : datetime.datetime.now().isoformat(),
+    })
+    return "fetched"
 
 if __name__ == "__main__":
     main()
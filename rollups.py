@@ -0,0 +1,234 @@
+import argparse
+import bisect
+import datetime
+import json
+import math
+import db
+import models
+from sqlalchemy import select
+
+# how finely a digest keeps the distribution; about this many centroids are kept
+COMPRESSION = 100
+
+class TDigest(object):
+    """ A merging t-digest: a sketch of a distribution as a list of centroids,
+        [mean, count] pairs sorted by mean, kept small near the median and
+        smaller still at the tails so that extreme percentiles stay accurate.
+        Digests of disjoint samples merge into a digest of their union.
+    """
+
+    def __init__(self, centroids=None, compression=COMPRESSION):
+        self.compression = compression
+        self.centroids = centroids or []
+        self.buffer = []
+
+    @property
+    def count(self):
+        self.compress()
+        return sum(c[1] for c in self.centroids)
+
+    def add(self, value, count=1):
+        self.buffer.append([float(value), count])
+        if len(self.buffer) > 5 * self.compression:
+            self.compress()
+
+    def merge(self, other):
+        other.compress()
+        self.buffer.extend([c[0], c[1]] for c in other.centroids)
+        # buffered like added values, so merging many small digests sorts only now and then
+        if len(self.buffer) > 5 * self.compression:
+            self.compress()
+        return self
+
+    def scale(self, q):
+        """ The k1 scale function, which bounds how much of the distribution a centroid may cover """
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def compress(self):
+        if not self.buffer:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        total = float(sum(c[1] for c in points))
+        merged = [list(points[0])]
+        seen = 0.0
+        limit = self.scale(0.0) + 1
+        for mean, count in points[1:]:
+            last = merged[-1]
+            if self.scale((seen + last[1] + count) / total) <= limit:
+                last[0] += (mean - last[0]) * count / (last[1] + count)
+                last[1] += count
+            else:
+                seen += last[1]
+                limit = self.scale(seen / total) + 1
+                merged.append([mean, count])
+        self.centroids = merged
+
+    def quantile(self, q):
+        """ Estimates the value below which a fraction `q` of the values fall """
+        self.compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        total = float(sum(c[1] for c in self.centroids))
+        # each centroid's mean sits at the middle of the weight it covers
+        midpoints = []
+        seen = 0.0
+        for mean, count in self.centroids:
+            midpoints.append((seen + count / 2.0) / total)
+            seen += count
+        i = bisect.bisect_left(midpoints, q)
+        if i == 0:
+            return self.centroids[0][0]
+        if i == len(midpoints):
+            return self.centroids[-1][0]
+        fraction = (q - midpoints[i - 1]) / (midpoints[i] - midpoints[i - 1])
+        return self.centroids[i - 1][0] + fraction * (self.centroids[i][0] - self.centroids[i - 1][0])
+
+    def to_json(self):
+        self.compress()
+        return json.dumps([[round(mean, 3), count] for mean, count in self.centroids])
+
+    @classmethod
+    def from_json(cls, text, compression=COMPRESSION):
+        return cls(json.loads(text) if text else [], compression)
+
+class Rollup(object):
+    """ The response times of one (report date, officer, category, hour) group """
+
+    def __init__(self):
+        self.response_count = 0
+        self.arrival_seconds = 0.0
+        self.on_scene_seconds = 0.0
+        self.arrival = TDigest()
+        self.on_scene = TDigest()
+
+    def add(self, dispatch_time, arrival_time, cleared_time):
+        self.response_count += 1
+        if dispatch_time and arrival_time and arrival_time >= dispatch_time:
+            seconds = (arrival_time - dispatch_time).total_seconds()
+            self.arrival_seconds += seconds
+            self.arrival.add(seconds)
+        if arrival_time and cleared_time and cleared_time >= arrival_time:
+            seconds = (cleared_time - arrival_time).total_seconds()
+            self.on_scene_seconds += seconds
+            self.on_scene.add(seconds)
+
+    def merge(self, other):
+        self.response_count += other.response_count
+        self.arrival_seconds += other.arrival_seconds
+        self.on_scene_seconds += other.on_scene_seconds
+        self.arrival.merge(other.arrival)
+        self.on_scene.merge(other.on_scene)
+        return self
+
+    def row(self):
+        return {
+            "response_count" : self.response_count,
+            "arrival_count" : self.arrival.count,
+            "arrival_seconds" : self.arrival_seconds,
+            "arrival_digest" : self.arrival.to_json(),
+            "on_scene_count" : self.on_scene.count,
+            "on_scene_seconds" : self.on_scene_seconds,
+            "on_scene_digest" : self.on_scene.to_json(),
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        rollup = cls()
+        rollup.response_count = row["response_count"]
+        rollup.arrival_seconds = row["arrival_seconds"]
+        rollup.on_scene_seconds = row["on_scene_seconds"]
+        rollup.arrival = TDigest.from_json(row["arrival_digest"])
+        rollup.on_scene = TDigest.from_json(row["on_scene_digest"])
+        return rollup
+
+    def summary(self):
+        arrival_count = self.arrival.count
+        on_scene_count = self.on_scene.count
+
+        def quantile(digest, q):
+            value = digest.quantile(q)
+            return round(value, 1) if value is not None else None
+
+        return {
+            "responses" : self.response_count,
+            "arrival_mean" : round(self.arrival_seconds / arrival_count, 1) if arrival_count else None,
+            "arrival_p50" : quantile(self.arrival, 0.5),
+            "arrival_p90" : quantile(self.arrival, 0.9),
+            "on_scene_mean" : round(self.on_scene_seconds / on_scene_count, 1) if on_scene_count else None,
+            "on_scene_p50" : quantile(self.on_scene, 0.5),
+            "on_scene_p90" : quantile(self.on_scene, 0.9),
+        }
+
+def refresh(connection, report_dates):
+    """ Recomputes the `response_rollup` rows of each of `report_dates` from the responding
+        officers of the incidents dispatched that day. Should run in the same transaction
+        as the load which changed them. Returns the number of rows written.
+    """
+    rollup_table = models.ResponseRollup.__table__
+    incident = models.Incident.__table__
+    responding = models.RespondingOfficer.__table__
+    written = 0
+    for report_date in sorted(set(report_dates)):
+        start = datetime.datetime.combine(report_date, datetime.time())
+        query = select([responding.c.officer_id, incident.c.category, incident.c.dispatch_time,
+                        responding.c.dispatch_time, responding.c.arrival_time, responding.c.cleared_time]) \
+            .select_from(responding.join(incident, responding.c.incident_id == incident.c.id)) \
+            .where(incident.c.dispatch_time >= start) \
+            .where(incident.c.dispatch_time < start + datetime.timedelta(days=1))
+
+        groups = {}
+        for officer_id, category, incident_time, dispatch_time, arrival_time, cleared_time in connection.execute(query):
+            key = (officer_id, category or "", incident_time.hour)
+            groups.setdefault(key, Rollup()).add(dispatch_time, arrival_time, cleared_time)
+
+        connection.execute(rollup_table.delete().where(rollup_table.c.report_date == report_date))
+        rows = []
+        for (officer_id, category, hour), rollup in groups.items():
+            row = rollup.row()
+            row.update(report_date = report_date, officer_id = officer_id, category = category, hour = hour)
+            rows.append(row)
+        if rows:
+            connection.execute(rollup_table.insert(), rows)
+        written += len(rows)
+    return written
+
+def summarize(connection, start, end, by=("officer_id",)):
+    """ Merges the rollups of report dates in [start, end) grouped by the `by` columns of
+        `response_rollup` (any of report_date, officer_id, category and hour).
+        Returns a dict from tuples of those columns' values to `Rollup.summary` dicts.
+    """
+    rollup_table = models.ResponseRollup.__table__
+    query = rollup_table.select() \
+        .where(rollup_table.c.report_date >= start) \
+        .where(rollup_table.c.report_date < end)
+    merged = {}
+    for row in connection.execute(query):
+        key = tuple(row[column] for column in by)
+        rollup = Rollup.from_row(row)
+        if key in merged:
+            merged[key].merge(rollup)
+        else:
+            merged[key] = rollup
+    return dict((key, rollup.summary()) for key, rollup in merged.items())
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuilds the response time rollups.")
+    parser.add_argument("--start", type=lambda s: datetime.datetime.strptime(s, "%Y-%m-%d").date(),
+            help="The first report date to rebuild, YYYY-MM-DD. Defaults to the first loaded.")
+    parser.add_argument("--end", type=lambda s: datetime.datetime.strptime(s, "%Y-%m-%d").date(),
+            help="The report date to stop before. Defaults to after the last loaded.")
+    args = parser.parse_args()
+
+    connection = db.create_db_engine().connect()
+    ledger = models.IngestLedger.__table__
+    dates = [row[0] for row in connection.execute(
+        select([ledger.c.report_date]).where(ledger.c.report_date != None).distinct())]
+    dates = [d for d in dates if (args.start is None or d >= args.start) and (args.end is None or d < args.end)]
+    with connection.begin():
+        print("Wrote {0} rollup rows for {1} report dates".format(refresh(connection, dates), len(dates)))
+
+if __name__ == "__main__":
+    main()
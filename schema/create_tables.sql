@@ -2,7 +2,7 @@
 create table dispatcher
 (
     id serial primary key,
-    "number" int,
+    "number" int unique,
     first_name varchar(50),
     last_name varchar(50)
 );
@@ -10,7 +10,7 @@ create table dispatcher
 create table officer
 (
     id serial primary key,
-    "number" int,
+    "number" int unique,
     last_name varchar(50),
     first_name varchar(50)
 );
@@ -19,7 +19,7 @@ create table officer
 create table incident
 (
     id serial primary key,
-    report_id varchar(10),
+    report_id varchar(10) unique,
     dispatch_time timestamp,
     dispatch_source varchar(50),
     category varchar(50),
@@ -34,8 +34,9 @@ create table incident
     jurisdiction varchar(100),
     aux_event_type varchar(100),
     aux_event_key varchar(100),
-    geocode_failed bit,
-    formatted_location varchar(500)
+    geocode_failed boolean,
+    formatted_location varchar(1000),
+    geocoded_at timestamp
 );
 
 create table summons
@@ -91,3 +92,68 @@ create table responding_officer
     arrival_time timestamp,
     cleared_time timestamp
 );
+
+create table ingest_ledger
+(
+    id serial primary key,
+    source_file varchar(300) not null unique,
+    content_hash varchar(64) not null,
+    report_date date,
+    parser_version int,
+    incident_count int,
+    responding_officer_count int,
+    location_change_count int,
+    arrest_count int,
+    summons_count int,
+    protective_custody_count int,
+    loaded_at timestamp
+);
+
+create table geocode_cache
+(
+    address_key varchar(300) primary key,
+    formatted_address varchar(1000),
+    latitude decimal(8, 6),
+    longitude decimal(8, 6),
+    match_quality varchar(50),
+    source varchar(50),
+    succeeded boolean not null,
+    looked_up_at timestamp not null
+);
+
+create table response_rollup
+(
+    report_date date not null,
+    officer_id int not null references officer (id),
+    category varchar(50) not null,
+    hour int not null,
+    response_count int not null,
+    arrival_count int not null,
+    arrival_seconds double precision not null,
+    arrival_digest text,
+    on_scene_count int not null,
+    on_scene_seconds double precision not null,
+    on_scene_digest text,
+    primary key (report_date, officer_id, category, hour)
+);
+
+-- answers spatial.box_condition, which tests whether an incident's point is in a box
+create index incident_point_idx on incident using gist (point(longitude::float8, latitude::float8));
+create index incident_dispatch_time_idx on incident (dispatch_time);
+create index incident_call_taker_id_idx on incident (call_taker_id);
+create index incident_primary_officer_id_idx on incident (primary_officer_id);
+create index incident_ungeocoded_idx on incident (location, id) where latitude is null;
+create index incident_geocoded_at_idx on incident (geocoded_at);
+create index responding_officer_incident_id_idx on responding_officer (incident_id);
+create index responding_officer_officer_id_idx on responding_officer (officer_id);
+create index location_change_incident_id_idx on location_change (incident_id);
+create index arrest_incident_id_idx on arrest (incident_id);
+create index summons_incident_id_idx on summons (incident_id);
+create index protective_custody_incident_id_idx on protective_custody (incident_id);
+
+create table schema_migrations
+(
+    version int primary key,
+    name varchar(100) not null,
+    applied_at timestamp not null
+);
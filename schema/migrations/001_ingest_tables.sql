@@ -0,0 +1,45 @@
+-- the tables added for incremental imports, geocoding and response time rollups,
+-- for databases created before they were added to create_tables.sql
+create table if not exists ingest_ledger
+(
+    id serial primary key,
+    source_file varchar(300) not null unique,
+    content_hash varchar(64) not null,
+    report_date date,
+    parser_version int,
+    incident_count int,
+    responding_officer_count int,
+    location_change_count int,
+    arrest_count int,
+    summons_count int,
+    protective_custody_count int,
+    loaded_at timestamp
+);
+
+create table if not exists geocode_cache
+(
+    address_key varchar(300) primary key,
+    formatted_address varchar(1000),
+    latitude decimal(8, 6),
+    longitude decimal(8, 6),
+    match_quality varchar(50),
+    source varchar(50),
+    succeeded boolean not null,
+    looked_up_at timestamp not null
+);
+
+create table if not exists response_rollup
+(
+    report_date date not null,
+    officer_id int not null references officer (id),
+    category varchar(50) not null,
+    hour int not null,
+    response_count int not null,
+    arrival_count int not null,
+    arrival_seconds double precision not null,
+    arrival_digest text,
+    on_scene_count int not null,
+    on_scene_seconds double precision not null,
+    on_scene_digest text,
+    primary key (report_date, officer_id, category, hour)
+);
@@ -0,0 +1,3 @@
+-- indexes for the bounding box and time window queries in spatial.py
+create index if not exists incident_lat_lon_idx on incident (latitude, longitude);
+create index if not exists incident_dispatch_time_idx on incident (dispatch_time);
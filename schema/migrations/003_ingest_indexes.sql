@@ -0,0 +1,42 @@
+-- geocode_failed was a bit, though the models have always treated it as a boolean
+do $$
+begin
+    if (select data_type from information_schema.columns
+        where table_name = 'incident' and column_name = 'geocode_failed') = 'bit' then
+        alter table incident alter column geocode_failed type boolean using geocode_failed = B'1';
+    end if;
+end
+$$;
+alter table incident alter column formatted_location type varchar(1000);
+
+-- a report listing an incident twice loaded it twice; keep the first copy
+create temporary table duplicate_incident on commit drop as
+    select id from (
+        select id, row_number() over (partition by report_id order by id) as copy
+        from incident where report_id is not null
+    ) copies
+    where copy > 1;
+delete from responding_officer where incident_id in (select id from duplicate_incident);
+delete from location_change where incident_id in (select id from duplicate_incident);
+delete from arrest where incident_id in (select id from duplicate_incident);
+delete from summons where incident_id in (select id from duplicate_incident);
+delete from protective_custody where incident_id in (select id from duplicate_incident);
+delete from incident where id in (select id from duplicate_incident);
+
+-- the identity caches and upserts look people up by badge number
+create unique index if not exists officer_number_key on officer ("number");
+create unique index if not exists dispatcher_number_key on dispatcher ("number");
+create unique index if not exists incident_report_id_key on incident (report_id);
+
+-- replace_report_date and the rollups find child rows by incident
+create index if not exists responding_officer_incident_id_idx on responding_officer (incident_id);
+create index if not exists responding_officer_officer_id_idx on responding_officer (officer_id);
+create index if not exists location_change_incident_id_idx on location_change (incident_id);
+create index if not exists arrest_incident_id_idx on arrest (incident_id);
+create index if not exists summons_incident_id_idx on summons (incident_id);
+create index if not exists protective_custody_incident_id_idx on protective_custody (incident_id);
+create index if not exists incident_call_taker_id_idx on incident (call_taker_id);
+create index if not exists incident_primary_officer_id_idx on incident (primary_officer_id);
+
+-- the geocoder's backlog: the incidents still waiting for coordinates
+create index if not exists incident_ungeocoded_idx on incident (location, id) where latitude is null;
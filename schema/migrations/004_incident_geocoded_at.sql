@@ -0,0 +1,4 @@
+-- when geocode.py last wrote an incident's coordinates, so exports and caches of
+-- incidents can tell which have changed since they were made
+alter table incident add column if not exists geocoded_at timestamp;
+create index if not exists incident_geocoded_at_idx on incident (geocoded_at);
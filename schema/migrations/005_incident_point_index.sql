@@ -0,0 +1,5 @@
+-- box and radius queries in spatial.py and query_service.py test whether an incident's point
+-- is in a box, which a GiST index narrows on both axes; the btree narrowed by latitude only
+create index if not exists incident_point_idx on incident
+    using gist (point(longitude::float8, latitude::float8));
+drop index if exists incident_lat_lon_idx;
@@ -0,0 +1,355 @@
+import csv
+import datetime
+import io
+import json
+import os
+import bulk_load
+import db
+import export
+import identity
+import instrument
+import ledger
+import models
+import records
+import rollups
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+class Sink(object):
+    """ Somewhere to write the records read by the parser.
+
+        Records are staged with `add` and written by `flush`, inside a transaction
+        opened by `begin` and ended by `commit` or `rollback`. A sink also keeps
+        an ingest ledger of the files loaded into it, and can replace the rows
+        of a report date when a changed file is loaded again.
+    """
+
+    def add(self, record):
+        self.loader.add(record)
+
+    def flush(self):
+        """ Writes the staged records, returning the number of rows written to each table """
+        with instrument.METRICS.timer("sink_flush_seconds"):
+            rows = self.loader.flush()
+        for table, count in rows.items():
+            instrument.METRICS.count('rows_written_total{{table="{0}"}}'.format(table), count)
+        return rows
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        self.loader.commit()
+
+    def rollback(self):
+        self.loader.rollback()
+
+    def replace_report_date(self, report_date):
+        """ Removes whatever was loaded for `report_date` in favor of the rows flushed next """
+        raise NotImplementedError()
+
+    def refresh_rollups(self, report_dates):
+        """ Recomputes the response time rollups of `report_dates` after they're loaded """
+        pass
+
+    def is_current(self, source_file, content_hash, parser_version):
+        raise NotImplementedError()
+
+    def record_load(self, source_file, content_hash, report_date, parser_version, rows):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+class DatabaseSink(Sink):
+    """ A sink writing to a database through SQLAlchemy """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connection = engine.connect()
+        session = sessionmaker(bind = self.connection)()
+        self.officers = identity.officer_cache(session)
+        self.dispatchers = identity.dispatcher_cache(session)
+        self.ledger = ledger.Ledger(session)
+        session.close()
+        self.loader = self.make_loader()
+        self.transaction = None
+
+    def make_loader(self):
+        raise NotImplementedError()
+
+    def begin(self):
+        self.transaction = self.connection.begin()
+
+    def commit(self):
+        self.transaction.commit()
+        self.transaction = None
+        self.loader.commit()
+
+    def rollback(self):
+        self.transaction.rollback()
+        self.transaction = None
+        self.loader.rollback()
+
+    def replace_report_date(self, report_date):
+        ledger.replace_report_date(self.connection, report_date)
+
+    def refresh_rollups(self, report_dates):
+        rollups.refresh(self.connection, report_dates)
+
+    def is_current(self, source_file, content_hash, parser_version):
+        return self.ledger.is_current(source_file, content_hash, parser_version)
+
+    def record_load(self, source_file, content_hash, report_date, parser_version, rows):
+        self.ledger.record(self.connection, source_file, content_hash, report_date, parser_version, rows)
+
+    def close(self):
+        self.connection.close()
+
+class PostgresSink(DatabaseSink):
+    """ Writes each table to Postgres with COPY """
+
+    def make_loader(self):
+        return bulk_load.BulkLoader(self.connection, self.officers, self.dispatchers)
+
+class SQLiteLoader(bulk_load.BulkLoader):
+    """ Numbers rows from the largest id in each table, since SQLite has no sequences,
+        and writes them with a multi-row insert
+    """
+
+    # report ids looked up in one query, under SQLite's limit on bound parameters
+    LOOKUP_SIZE = 500
+
+    def __init__(self, connection, officers, dispatchers):
+        bulk_load.BulkLoader.__init__(self, connection, officers, dispatchers)
+        self.next_ids = {}
+
+    def reserve_ids(self, table, count):
+        if table not in self.next_ids:
+            max_id = self.connection.execute("select max(id) from {0}".format(table)).scalar()
+            self.next_ids[table] = (max_id or 0) + 1
+        start = self.next_ids[table]
+        self.next_ids[table] += count
+        return list(range(start, start + count))
+
+    def assign_ids(self, table, people):
+        return self.reserve_people_ids(table, people)
+
+    def write_rows(self, table, columns, rows):
+        self.connection.execute(models.metadata.tables[table].insert(),
+                                [dict(zip(columns, row)) for row in rows])
+
+    def write_incidents(self, rows):
+        # nothing else writes to the database during the transaction, so it's enough to look first
+        incident = models.Incident.__table__
+        report_ids = [row[1] for row in rows if row[1] is not None]
+        loaded = set()
+        for i in range(0, len(report_ids), self.LOOKUP_SIZE):
+            loaded.update(r[0] for r in self.connection.execute(select([incident.c.report_id])
+                .where(incident.c.report_id.in_(report_ids[i:i + self.LOOKUP_SIZE]))))
+        rows = [row for row in rows if row[1] not in loaded]
+        if rows:
+            self.write_rows("incident", self.COLUMNS["incident"], rows)
+        return set(row[0] for row in rows)
+
+    def rollback(self):
+        bulk_load.BulkLoader.rollback(self)
+        self.next_ids = {}
+
+class SQLiteSink(DatabaseSink):
+    """ Writes to a SQLite database, creating the tables if they don't exist yet """
+
+    def __init__(self, engine):
+        models.metadata.create_all(engine)
+        DatabaseSink.__init__(self, engine)
+
+    def make_loader(self):
+        return SQLiteLoader(self.connection, self.officers, self.dispatchers)
+
+class ColumnarLoader(bulk_load.BulkLoader):
+    """ Numbers rows from counters kept by a `ColumnarSink` and stages them with it """
+
+    def __init__(self, sink):
+        bulk_load.BulkLoader.__init__(self, None, sink.officers, sink.dispatchers)
+        self.sink = sink
+
+    def reserve_ids(self, table, count):
+        start = self.sink.state["next_ids"].get(table, 1)
+        self.sink.state["next_ids"][table] = start + count
+        return list(range(start, start + count))
+
+    def assign_ids(self, table, people):
+        return self.reserve_people_ids(table, people)
+
+    def write_rows(self, table, columns, rows):
+        self.sink.pending.setdefault(table, []).extend(rows)
+
+    def write_incidents(self, rows):
+        # the parts written on commit replace what was there, so only this transaction's rows can clash
+        pending = set(row[1] for row in self.sink.pending.get("incident", []))
+        rows = [row for row in rows if row[1] is None or row[1] not in pending]
+        self.write_rows("incident", self.COLUMNS["incident"], rows)
+        return set(row[0] for row in rows)
+
+class ColumnarSink(Sink):
+    """ Writes each table to a directory of CSV or Parquet files for analytics.
+
+        The rows loaded for a report date go to a part file named for that date,
+        `incident/2015-01-05.csv` for instance, so loading a report again simply
+        replaces its parts. Without `replace_report_date`, incidents are sorted
+        into the parts of the days they were dispatched on. Officers and
+        dispatchers are small enough to be rewritten whole on every commit.
+        Parquet needs pyarrow, and every Parquet file of a table has the same
+        schema, taken from `models`.
+    """
+
+    TABLES = [t for t in bulk_load.BulkLoader.TABLE_ORDER if t not in ("officer", "dispatcher")]
+
+    def __init__(self, directory, file_format="csv"):
+        if file_format == "parquet" and pyarrow is None:
+            raise ValueError("Writing Parquet requires pyarrow")
+        self.directory = directory
+        self.file_format = file_format
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.state = self.read_json("_state.json", {"next_ids" : {}})
+        self.ledger = self.read_json("_ledger.json", {})
+        self.officers = identity.IdentityCache(models.Officer)
+        self.dispatchers = identity.IdentityCache(models.Dispatcher)
+        for cache, table in ((self.officers, "officer"), (self.dispatchers, "dispatcher")):
+            for row in self.read_table(table):
+                cache.by_number[row["number"]] = records.PersonRef(**row)
+        self.loader = ColumnarLoader(self)
+        self.pending = {}
+        self.part = None
+
+    def begin(self):
+        self.pending = {}
+        self.part = None
+
+    def replace_report_date(self, report_date):
+        self.part = report_date.isoformat()
+
+    def commit(self):
+        # a report date's part of every table is replaced, even by no rows at all
+        parts = {} if self.part is None else {self.part : {}}
+        incident_parts = {}
+        for row in self.pending.get("incident", []):
+            dispatch_time = row[2]
+            incident_parts[row[0]] = self.part or (dispatch_time.date().isoformat() if dispatch_time else "undated")
+        for table in self.TABLES:
+            for row in self.pending.get(table, []):
+                part = incident_parts[row[0] if table == "incident" else row[1]]
+                parts.setdefault(part, {}).setdefault(table, []).append(row)
+
+        for part, part_rows in sorted(parts.items()):
+            for table in self.TABLES:
+                path = os.path.join(self.directory, table, "{0}.{1}".format(part, self.file_format))
+                rows = part_rows.get(table)
+                if rows:
+                    self.write_file(path, table, rows)
+                elif os.path.exists(path):
+                    os.remove(path)
+
+        for table, cache in (("officer", self.officers), ("dispatcher", self.dispatchers)):
+            columns = bulk_load.BulkLoader.COLUMNS[table]
+            people = sorted((p for p in cache.by_number.values() if p.id is not None), key=lambda p: p.id)
+            self.write_file(os.path.join(self.directory, "{0}.{1}".format(table, self.file_format)), table,
+                            [tuple(getattr(p, c) for c in columns) for p in people])
+
+        self.write_json("_state.json", self.state)
+        self.write_json("_ledger.json", self.ledger)
+        self.pending = {}
+        self.part = None
+        Sink.commit(self)
+
+    def rollback(self):
+        Sink.rollback(self)
+        self.pending = {}
+        self.part = None
+
+    def is_current(self, source_file, content_hash, parser_version):
+        entry = self.ledger.get(source_file)
+        return entry is not None and entry["content_hash"] == content_hash and \
+                entry["parser_version"] == parser_version
+
+    def record_load(self, source_file, content_hash, report_date, parser_version, rows):
+        self.ledger[source_file] = {
+            "content_hash" : content_hash,
+            "report_date" : report_date.isoformat() if report_date else None,
+            "parser_version" : parser_version,
+            "rows" : rows,
+            "loaded_at" : datetime.datetime.now().isoformat(),
+        }
+
+    def read_json(self, name, default):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return default
+        with open(path, "r") as handle:
+            return json.load(handle)
+
+    def write_json(self, name, value):
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w") as handle:
+            json.dump(value, handle, indent=2, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    def read_table(self, table):
+        """ Returns the rows of a table written whole, such as `officer`, as dicts """
+        path = os.path.join(self.directory, "{0}.{1}".format(table, self.file_format))
+        if not os.path.exists(path):
+            return []
+        if self.file_format == "parquet":
+            return pyarrow.parquet.read_table(path).to_pylist()
+        with io.open(path, "r", newline="") as handle:
+            return [dict((k, int(v) if k in ("id", "number") else v) for k, v in row.items())
+                    for row in csv.DictReader(handle)]
+
+    def arrow_schema(self, table):
+        """ The schema of the Parquet files of `table`, given in full so that a part
+            whose column is all None keeps the column's type
+        """
+        columns = models.metadata.tables[table].c
+        return pyarrow.schema([pyarrow.field(c, export.arrow_type(columns[c], dictionary=False))
+                               for c in bulk_load.BulkLoader.COLUMNS[table]])
+
+    def write_file(self, path, table, rows):
+        """ Writes `rows`, tuples of the values of `table`'s columns in `bulk_load.BulkLoader.COLUMNS` """
+        columns = bulk_load.BulkLoader.COLUMNS[table]
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if self.file_format == "parquet":
+            arrow_table = pyarrow.Table.from_pydict(dict((c, [row[i] for row in rows]) for i, c in enumerate(columns)),
+                                                    schema=self.arrow_schema(table))
+            pyarrow.parquet.write_table(arrow_table, path + ".tmp")
+        else:
+            with io.open(path + ".tmp", "w", newline="") as handle:
+                writer = csv.writer(handle)
+                writer.writerow(columns)
+                writer.writerows(rows)
+        os.replace(path + ".tmp", path)
+
+def open_sink(url=None):
+    """ Opens the sink named by `url`, which defaults to the database from `db.database_url`.
+        Postgres and SQLite URLs are SQLAlchemy URLs, and `csv:///path` or
+        `parquet:///path` write files under the directory `/path`.
+    """
+    url = db.database_url(url)
+    scheme = url.split(":", 1)[0]
+    if scheme in ("csv", "parquet"):
+        return ColumnarSink(url.split("://", 1)[1], scheme)
+    engine = db.create_db_engine(url)
+    if engine.dialect.name == "sqlite":
+        return SQLiteSink(engine)
+    elif engine.dialect.name == "postgresql":
+        return PostgresSink(engine)
+    raise ValueError("No sink for {0}".format(url))
@@ -0,0 +1,256 @@
+import argparse
+import heapq
+import math
+import db
+import models
+from sqlalchemy import Float, and_, cast, func, or_, select
+
+EARTH_RADIUS = 6371000.0
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+# grid cells are this many degrees on a side, about 110m north to south
+CELL_SIZE = 0.001
+
+def distance(lat1, lon1, lat2, lon2):
+    """ The great circle distance in meters between two points """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+def bounding_box(lat, lon, meters):
+    """ The (south, west, north, east) box holding every point within `meters` of a point """
+    dlat = meters / METERS_PER_DEGREE
+    # a circle is widest a little poleward of its center
+    dlon = meters / (METERS_PER_DEGREE * max(math.cos(math.radians(abs(lat) + dlat)), 0.01))
+    return (lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+
+def in_window(when, start, end):
+    if start is None and end is None:
+        return True
+    if when is None:
+        return False
+    return (start is None or when >= start) and (end is None or when < end)
+
+class SpatialIndex(object):
+    """ An in-memory grid over the geocoded incidents, answering radius, bounding box
+        and nearest neighbor queries. Each cell holds (id, latitude, longitude, dispatch time)
+        tuples. `load` reads the incidents located since the last load, so the index can be
+        kept up to date as the geocoder fills in coordinates.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.extent = None # the (lowest, highest) cell occupied on each axis
+        self.last_id = 0 # of the incidents loaded whose report gave their coordinates
+        self.geocoded_through = None # the (geocoded_at, id) of the last geocoded incident loaded
+        self.size = 0
+
+    def cell(self, lat, lon):
+        return (int(math.floor(lat / self.cell_size)), int(math.floor(lon / self.cell_size)))
+
+    def add(self, incident_id, lat, lon, dispatch_time=None):
+        cell = self.cell(lat, lon)
+        self.cells.setdefault(cell, []).append((incident_id, lat, lon, dispatch_time))
+        if self.extent is None:
+            self.extent = (cell, cell)
+        else:
+            low, high = self.extent
+            if not (low[0] <= cell[0] <= high[0] and low[1] <= cell[1] <= high[1]):
+                self.extent = ((min(low[0], cell[0]), min(low[1], cell[1])),
+                               (max(high[0], cell[0]), max(high[1], cell[1])))
+        self.size += 1
+
+    def load(self, connection, batch_size=10000):
+        """ Adds the incidents located since the last load, returning how many. Incidents
+            geocoded since are found by `geocoded_at`, since the geocoder gets to incidents
+            long after those with later ids were loaded. Those whose report gave their
+            coordinates have no `geocoded_at`, and are found by id.
+        """
+        incident = models.Incident.__table__
+        if self.geocoded_through is None:
+            geocoded = incident.c.geocoded_at != None
+        else:
+            geocoded_at, incident_id = self.geocoded_through
+            geocoded = or_(incident.c.geocoded_at > geocoded_at,
+                           and_(incident.c.geocoded_at == geocoded_at, incident.c.id > incident_id))
+        query = select([incident.c.id, incident.c.latitude, incident.c.longitude, incident.c.dispatch_time,
+                        incident.c.geocoded_at]) \
+            .where(incident.c.latitude != None) \
+            .where(or_(and_(incident.c.geocoded_at == None, incident.c.id > self.last_id), geocoded)) \
+            .order_by(incident.c.id)
+        count = 0
+        result = connection.execution_options(stream_results=True).execute(query)
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            for incident_id, lat, lon, dispatch_time, geocoded_at in rows:
+                self.add(incident_id, float(lat), float(lon), dispatch_time)
+                if geocoded_at is None:
+                    self.last_id = max(self.last_id, incident_id)
+                elif self.geocoded_through is None or (geocoded_at, incident_id) > self.geocoded_through:
+                    self.geocoded_through = (geocoded_at, incident_id)
+            count += len(rows)
+        return count
+
+    def reload(self, connection):
+        """ Rebuilds the index from scratch """
+        self.cells = {}
+        self.extent = None
+        self.last_id = 0
+        self.geocoded_through = None
+        self.size = 0
+        return self.load(connection)
+
+    def in_box(self, south, west, north, east, start=None, end=None):
+        """ Yields the points in a bounding box dispatched within [start, end) """
+        low = self.cell(south, west)
+        high = self.cell(north, east)
+        for i in range(low[0], high[0] + 1):
+            for j in range(low[1], high[1] + 1):
+                for point in self.cells.get((i, j), ()):
+                    if south <= point[1] <= north and west <= point[2] <= east and \
+                            in_window(point[3], start, end):
+                        yield point
+
+    def within_box(self, south, west, north, east, start=None, end=None):
+        """ Returns the ids of the incidents in a bounding box """
+        return [point[0] for point in self.in_box(south, west, north, east, start, end)]
+
+    def within_radius(self, lat, lon, meters, start=None, end=None):
+        """ Returns (distance, incident id) pairs for the incidents within `meters`
+            of a point, nearest first
+        """
+        found = []
+        for point in self.in_box(*bounding_box(lat, lon, meters), start=start, end=end):
+            d = distance(lat, lon, point[1], point[2])
+            if d <= meters:
+                found.append((d, point[0]))
+        found.sort()
+        return found
+
+    def nearest(self, lat, lon, k, start=None, end=None):
+        """ Returns (distance, incident id) pairs for the `k` incidents nearest a point,
+            searching rings of cells outward until no unsearched cell can hold a nearer one
+        """
+        if k <= 0:
+            return []
+        center = self.cell(lat, lon)
+        heap = [] # the best k so far, as (-distance, id)
+        for ring in range(self.max_ring(center) + 1):
+            bounds = [(self.cell_bound(lat, lon, cell), cell) for cell in ring_cells(center, ring)]
+            if len(heap) == k and min(bounds)[0] > -heap[0][0]:
+                break # every cell further out is further still
+            for bound, cell in sorted(bounds):
+                if len(heap) == k and bound > -heap[0][0]:
+                    break
+                for point in self.cells.get(cell, ()):
+                    if not in_window(point[3], start, end):
+                        continue
+                    d = distance(lat, lon, point[1], point[2])
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d, point[0]))
+                    elif d < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d, point[0]))
+        return sorted((-d, incident_id) for d, incident_id in heap)
+
+    def cell_bound(self, lat, lon, cell):
+        """ A lower bound on the meters between a point and anything in `cell` """
+        south, west = cell[0] * self.cell_size, cell[1] * self.cell_size
+        dlat = max(south - lat, 0, lat - south - self.cell_size)
+        dlon = max(west - lon, 0, lon - west - self.cell_size)
+        # shaved a little since the flat approximation can overshoot the great circle
+        return 0.99 * METERS_PER_DEGREE * math.hypot(dlat, dlon * math.cos(math.radians(lat)))
+
+    def max_ring(self, center):
+        """ The ring beyond which there are no occupied cells """
+        if self.extent is None:
+            return -1
+        low, high = self.extent
+        return max(center[0] - low[0], high[0] - center[0], center[1] - low[1], high[1] - center[1])
+
+def ring_cells(center, ring):
+    """ The cells exactly `ring` cells away from `center` """
+    if ring == 0:
+        yield center
+        return
+    i, j = center
+    for dj in range(-ring, ring + 1):
+        yield (i - ring, j + dj)
+        yield (i + ring, j + dj)
+    for di in range(-ring + 1, ring):
+        yield (i + di, j - ring)
+        yield (i + di, j + ring)
+
+def box_condition(south, west, north, east, dialect_name):
+    """ The condition that an incident lies in a bounding box. On Postgres the incident's
+        point must be in the box, which `incident_point_idx`, a GiST index over the points,
+        narrows on both axes at once; a btree over (latitude, longitude) could only narrow
+        a box to its band of latitudes. Elsewhere each coordinate is compared in turn.
+    """
+    incident = models.Incident.__table__
+    if dialect_name == "postgresql":
+        # the same expression as the index, or Postgres can't use it
+        point = func.point(cast(incident.c.longitude, Float), cast(incident.c.latitude, Float))
+        return point.op("<@")(func.box(func.point(west, south), func.point(east, north)))
+    return and_(incident.c.latitude.between(south, north), incident.c.longitude.between(west, east))
+
+def box_query(south, west, north, east, start=None, end=None, dialect_name="postgresql"):
+    """ A query for the id, coordinates and dispatch time of the incidents in a bounding
+        box, written for the database `dialect_name` as `box_condition`
+    """
+    incident = models.Incident.__table__
+    conditions = [box_condition(south, west, north, east, dialect_name)]
+    if start is not None:
+        conditions.append(incident.c.dispatch_time >= start)
+    if end is not None:
+        conditions.append(incident.c.dispatch_time < end)
+    return select([incident.c.id, incident.c.latitude, incident.c.longitude, incident.c.dispatch_time]) \
+        .where(and_(*conditions))
+
+def query_radius(connection, lat, lon, meters, start=None, end=None):
+    """ `SpatialIndex.within_radius` run in the database: the bounding box is filtered
+        by the index and the exact distance checked here
+    """
+    found = []
+    for incident_id, plat, plon, dispatch_time in connection.execute(
+            box_query(*bounding_box(lat, lon, meters), start=start, end=end, dialect_name=connection.dialect.name)):
+        d = distance(lat, lon, float(plat), float(plon))
+        if d <= meters:
+            found.append((d, incident_id))
+    found.sort()
+    return found
+
+def query_nearest(connection, lat, lon, k, start=None, end=None, initial_meters=250, max_meters=50000):
+    """ `SpatialIndex.nearest` run in the database, doubling the search radius
+        until it holds `k` incidents or reaches `max_meters`
+    """
+    if k <= 0:
+        return []
+    meters = initial_meters
+    while True:
+        found = query_radius(connection, lat, lon, meters, start, end)
+        if len(found) >= k or meters >= max_meters:
+            return found[:k]
+        meters = min(meters * 2, max_meters)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("lat", type=float)
+    parser.add_argument("lon", type=float)
+    parser.add_argument("--radius", type=float, default=500, help="Meters around the point to search.")
+    parser.add_argument("--nearest", type=int, help="Find this many of the nearest incidents instead.")
+    args = parser.parse_args()
+
+    connection = db.create_db_engine().connect()
+    if args.nearest:
+        found = query_nearest(connection, args.lat, args.lon, args.nearest)
+    else:
+        found = query_radius(connection, args.lat, args.lon, args.radius)
+    for d, incident_id in found:
+        print("{0}\t{1:.0f}m".format(incident_id, d))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import datetime
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+import synthetic
+
+@pytest.fixture
+def report_files(tmpdir):
+    """ Writes synthetic reports for three days in January 2015, returning their paths """
+    paths = []
+    for day in range(3):
+        report_date = datetime.date(2015, 1, 1) + datetime.timedelta(days=day)
+        path = tmpdir.join("reports", report_date.strftime("%Y-%m-%d.txt"))
+        path.write("\n".join(synthetic.generate_report(report_date, 40, day, day * 40 + 1)) + "\n", ensure=True)
+        paths.append(str(path))
+    return paths
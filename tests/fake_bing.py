@@ -0,0 +1,123 @@
+""" A stand-in for the Bing Maps Dataflow and Locations services, served from
+    http.server on an ephemeral port
+"""
+import csv
+import io
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESULT_FIELDS = ["Id", "GeocodeResponse/Address/FormattedAddress", "GeocodeResponse/Confidence",
+                 "GeocodeResponse/MatchCodes", "GeocodeResponse/Point/Latitude", "GeocodeResponse/Point/Longitude"]
+
+class FakeBingHandler(BaseHTTPRequestHandler):
+    """ Geocodes the addresses in `server.places`, a dict mapping addresses to
+        (latitude, longitude). The Dataflow service only matches those not in
+        `server.ambiguous`; Locations matches any of them. The first
+        `server.failures` requests are answered with 503.
+    """
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        self.server.log.append(("POST", url.path))
+        if self.busy():
+            return
+        if url.path != "/Dataflows/Geocode":
+            return self.reply(404, {})
+        lines = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8").splitlines()
+        job_id = "job{0}".format(len(self.server.jobs) + 1)
+        self.server.jobs[job_id] = {"polls" : 0,
+                                    "queries" : [(row["Id"], row["GeocodeRequest/Address/AddressLine"])
+                                                 for row in csv.DictReader(lines[1:], delimiter="|")]}
+        self.reply(201, {"resourceSets" : [{"resources" : [{"id" : job_id, "status" : "Pending"}]}]})
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        self.server.log.append(("GET", urllib.parse.unquote(url.path)))
+        if self.busy():
+            return
+        parts = url.path.split("/")
+        if url.path.startswith("/Dataflows/Geocode/"):
+            job = self.server.jobs[parts[3]]
+            job["polls"] += 1
+            resource = {"id" : parts[3], "status" : "Pending"}
+            if job["polls"] >= self.server.polls_to_complete:
+                resource["status"] = "Completed"
+                resource["links"] = [{"role" : "succeeded", "url" : self.base_url() + "/results/" + parts[3]}]
+            self.reply(200, {"resourceSets" : [{"resources" : [resource]}]})
+        elif url.path.startswith("/results/"):
+            self.reply_results(self.server.jobs[parts[2]]["queries"])
+        elif url.path.startswith("/Locations/US/NH/03431/Keene/"):
+            self.reply_location(urllib.parse.unquote(parts[-1]))
+        elif url.path == "/Locations/":
+            self.reply_location(params["query"].replace(" Keene, NH", ""))
+        else:
+            self.reply(404, {})
+
+    def busy(self):
+        with self.server.lock:
+            if self.server.failures <= 0:
+                return False
+            self.server.failures -= 1
+        self.reply(503, {})
+        return True
+
+    def base_url(self):
+        return "http://localhost:{0}".format(self.server.server_address[1])
+
+    def reply_results(self, queries):
+        content = io.StringIO()
+        content.write("Bing Spatial Data Services|2.0\n")
+        writer = csv.DictWriter(content, fieldnames=RESULT_FIELDS, delimiter="|", lineterminator="\n")
+        writer.writeheader()
+        for query_id, address in queries:
+            point = self.server.places.get(address)
+            if point is None or address in self.server.ambiguous:
+                writer.writerow({"Id" : query_id, "GeocodeResponse/MatchCodes" : "Ambiguous"})
+            else:
+                writer.writerow({"Id" : query_id, "GeocodeResponse/Address/FormattedAddress" : address + ", Keene, NH",
+                                 "GeocodeResponse/Confidence" : "High", "GeocodeResponse/MatchCodes" : "Good",
+                                 "GeocodeResponse/Point/Latitude" : str(point[0]),
+                                 "GeocodeResponse/Point/Longitude" : str(point[1])})
+        self.reply(200, content.getvalue().encode("utf-8"), "text/plain")
+
+    def reply_location(self, address):
+        point = self.server.places.get(address)
+        resources = []
+        if point is not None:
+            resources.append({"address" : {"formattedAddress" : address + ", Keene, NH"},
+                              "point" : {"coordinates" : list(point)}, "confidence" : "Medium",
+                              "matchCodes" : ["Good"]})
+        self.reply(200, {"resourceSets" : [{"resources" : resources}]})
+
+    def reply(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start(places, ambiguous=(), polls_to_complete=2, failures=0):
+    """ Starts a fake server in a daemon thread, returning it. `shutdown` stops it. """
+    server = ThreadingHTTPServer(("localhost", 0), FakeBingHandler)
+    server.places = dict(places)
+    server.ambiguous = set(ambiguous)
+    server.polls_to_complete = polls_to_complete
+    server.failures = failures
+    server.lock = threading.Lock()
+    server.jobs = {}
+    server.log = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def urls(server):
+    """ The Dataflow and Locations URLs of a fake server, as `bing.BingClient` takes them """
+    base = "http://localhost:{0}".format(server.server_address[1])
+    return {"dataflow_url" : base + "/Dataflows/Geocode", "locations_url" : base + "/Locations"}
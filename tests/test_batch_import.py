@@ -0,0 +1,99 @@
+import csv
+import json
+import shutil
+import pytest
+import batch_import
+import sinks
+
+def dangling_references(connection):
+    """ Counts the foreign keys to officers and dispatchers which don't exist """
+    return connection.execute("""
+        select (select count(*) from incident where call_taker_id is not null
+                    and call_taker_id not in (select id from dispatcher))
+             + (select count(*) from incident where primary_officer_id is not null
+                    and primary_officer_id not in (select id from officer))
+             + (select count(*) from responding_officer where officer_id is not null
+                    and officer_id not in (select id from officer))""").scalar()
+
+def test_failed_load_forgets_new_people(tmpdir, report_files):
+    sink = sinks.open_sink("sqlite:///" + str(tmpdir.join("keene.db")))
+    record_load = sink.record_load
+
+    def fail_second_day(source_file, *args):
+        if source_file.endswith("2015-01-02.txt"):
+            raise RuntimeError("ledger unavailable")
+        record_load(source_file, *args)
+    sink.record_load = fail_second_day
+
+    try:
+        summary = batch_import.run_import(sink, report_files, 1, str(tmpdir.join("manifest.jsonl")))
+        assert (summary["loaded"], summary["failed"]) == (2, 1)
+        assert dangling_references(sink.connection) == 0
+        assert sink.connection.execute("select count(*) from incident").scalar() == 80
+    finally:
+        sink.close()
+
+    # the failed file is loaded on the next run, along with its people
+    sink = sinks.open_sink("sqlite:///" + str(tmpdir.join("keene.db")))
+    try:
+        summary = batch_import.run_import(sink, report_files, 1, str(tmpdir.join("manifest.jsonl")))
+        assert (summary["loaded"], summary["unchanged"]) == (1, 2)
+        assert dangling_references(sink.connection) == 0
+    finally:
+        sink.close()
+
+@pytest.mark.parametrize("scheme", ["sqlite", "csv"])
+def test_reissued_report_replaces_the_first(tmpdir, report_files, scheme):
+    reissued = tmpdir.join("reports", "2015-01-01_reissued.txt")
+    shutil.copy(report_files[0], str(reissued))
+    if scheme == "sqlite":
+        db_url = "sqlite:///" + str(tmpdir.join("keene.db"))
+    else:
+        db_url = "csv://" + str(tmpdir.join("out"))
+
+    sink = sinks.open_sink(db_url)
+    try:
+        summary = batch_import.run_import(sink, [report_files[0], str(reissued)], 1, str(tmpdir.join("manifest.jsonl")))
+        assert summary["loaded"] == 2
+    finally:
+        sink.close()
+
+    if scheme == "sqlite":
+        sink = sinks.open_sink(db_url)
+        try:
+            assert sink.connection.execute("select count(*) from incident").scalar() == 40
+        finally:
+            sink.close()
+    else:
+        with open(str(tmpdir.join("out", "incident", "2015-01-01.csv")), "r") as handle:
+            assert len(list(csv.DictReader(handle))) == 40
+
+def test_malformed_records_are_quarantined_and_the_rest_loaded(tmpdir, report_files):
+    with open(report_files[1], "r") as handle:
+        lines = handle.read().splitlines()
+    header = [i for i, line in enumerate(lines) if line.startswith("15-45 ")][0]
+    lines.insert(header + 1, "Call Taker: unknown")
+    with open(report_files[1], "w") as handle:
+        handle.write("\n".join(lines) + "\n")
+
+    manifest_path = str(tmpdir.join("manifest.jsonl"))
+    quarantine_path = str(tmpdir.join("quarantine.jsonl"))
+    sink = sinks.open_sink("sqlite:///" + str(tmpdir.join("keene.db")))
+    try:
+        summary = batch_import.run_import(sink, report_files, 1, manifest_path, quarantine_path=quarantine_path)
+        assert (summary["loaded"], summary["records"], summary["quarantined"]) == (3, 119, 1)
+        assert sink.connection.execute("select count(*) from incident").scalar() == 119
+    finally:
+        sink.close()
+
+    with open(manifest_path, "r") as handle:
+        entries = dict((e["file"], e) for e in (json.loads(line) for line in handle))
+    assert (entries["2015-01-02.txt"]["records"], entries["2015-01-02.txt"]["quarantined"]) == (39, 1)
+    assert entries["2015-01-02.txt"]["coverage"] == 0.975
+    assert [e["coverage"] for name, e in sorted(entries.items()) if name != "2015-01-02.txt"] == [1.0, 1.0]
+
+    with open(quarantine_path, "r") as handle:
+        (item,) = [json.loads(line) for line in handle]
+    assert (item["file"], item["report_date"], item["line_number"]) == ("2015-01-02.txt", "2015-01-02", header + 1)
+    assert item["lines"][:2] == [lines[header], "Call Taker: unknown"]
+    assert item["error"].startswith("AttributeError: ")
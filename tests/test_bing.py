@@ -0,0 +1,49 @@
+import socket
+import pytest
+import requests
+import bing
+import fake_bing
+
+@pytest.fixture(autouse=True)
+def quick_retries(monkeypatch):
+    monkeypatch.setattr(bing, "MAX_RETRIES", 2)
+    monkeypatch.setattr(bing, "RETRY_BACKOFF", 0.01)
+
+@pytest.fixture
+def listener():
+    """ A socket which accepts connections and never answers """
+    listener = socket.socket()
+    listener.bind(("localhost", 0))
+    listener.listen(8)
+    try:
+        yield listener
+    finally:
+        listener.close()
+
+def test_busy_responses_are_retried_and_counted():
+    server = fake_bing.start({"12 MAIN ST" : (42.933, -72.278)}, failures=2)
+    try:
+        client = bing.BingClient(key="test", rate=1000, burst=1000, **fake_bing.urls(server))
+        assert client.geocode("12 MAIN ST")[1] == [42.933, -72.278]
+    finally:
+        server.shutdown()
+        server.server_close()
+    summary = client.stats.summary()
+    assert (summary["requests"], summary["retries"], summary["errors"], summary["timeouts"]) == (3, 2, 2, 0)
+
+def test_a_stalled_connection_times_out(listener):
+    url = "http://localhost:{0}/Locations".format(listener.getsockname()[1])
+    client = bing.BingClient(key="test", rate=1000, burst=1000, locations_url=url, timeout=0.1)
+    with pytest.raises(requests.Timeout):
+        client.run_structured_query("12 MAIN ST")
+    summary = client.stats.summary()
+    assert (summary["requests"], summary["retries"], summary["errors"], summary["timeouts"]) == (3, 2, 3, 3)
+
+def test_failed_connections_are_retried_and_counted(listener):
+    port = listener.getsockname()[1]
+    listener.close()
+    client = bing.BingClient(key="test", rate=1000, burst=1000, locations_url="http://localhost:{0}/Locations".format(port))
+    with pytest.raises(requests.ConnectionError):
+        client.run_structured_query("12 MAIN ST")
+    summary = client.stats.summary()
+    assert (summary["requests"], summary["retries"], summary["errors"], summary["timeouts"]) == (3, 2, 3, 0)
@@ -0,0 +1,35 @@
+import datetime
+import classifier
+import parse_pdf
+import synthetic
+
+# lines whose tags begin alike, and lines which merely look like tags
+TRICKY_LINES = [
+    "Location/Address: [KEE 12] 12 MAIN ST", "Location: MAIN ST @ 0 COURT ST", "Location Change: 9 ELM ST",
+    "Location", "Location Change 9 ELM ST", "Vicinity of: CENTRAL SQ", "Lat: 42.93 Lon: -72.27", "Lat 42.93",
+    "Call Taker: 129 - ROE, ANN", "Call Closed By: ADAMS, JANE", "Call Modified By: ADAMS, JANE", "Call Back",
+    "ID: 40 - JONES, JANE", "ID 40", "IDENTITY THEFT", "Primary Id: 33 - LEWIS, LISA", "Primary ID: 33",
+    "Refer To Arrest: 15-12-AR", "Referred to DCYF", "Jurisdiction: Keene", "Additional Activity: 01/01/2015",
+    "Cleared By: SMITH, JOHN", "Con: RANDOM", "Arrived By: X", "Dispatched By: X", "Enroute By: X",
+    "DOB: 01/01/1990", "Juvenile Arrest", "Juvenile Protective Custody", "Juvenile", "Disp-01:24:49 Arvd-01:33:52",
+    "Arrest: DOE, JOHN", "Charges: SIMPLE ASSAULT", u"\u2022\u2022",
+]
+
+def classify(line):
+    """ The type `RecordReader.read` gives a line, in the terms of the old chain """
+    line_type = parse_pdf.classify_line(line)
+    if line_type is None and not parse_pdf.PRINTABLE_RE.search(line):
+        return "blank"
+    return line_type
+
+def test_classifier_matches_the_startswith_chain():
+    # as `parse_pdf.read_lines` gives them, stripped and never empty
+    lines = list(TRICKY_LINES)
+    for day in range(3):
+        lines.extend(synthetic.generate_report(datetime.date(2015, 1, 1) + datetime.timedelta(days=day), 100, day, 1))
+    assert [(line, classify(line)) for line in lines] == [(line, classifier.legacy_classify(line)) for line in lines]
+
+    found = set(classify(line) for line in lines)
+    assert found >= set(line_type for line_type, tags in parse_pdf.LINE_TAGS) | set(["blank", None])
+    assert classify("Location/Address: 12 MAIN ST") == classify("Location: 12 MAIN ST") == "location_address"
+    assert classify("Location Change: 9 ELM ST") == "location_change"
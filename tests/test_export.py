@@ -0,0 +1,79 @@
+import datetime
+import pytest
+import export
+import geocode
+import models
+import parse_pdf
+import sinks
+import synthetic
+
+pytest.importorskip("pyarrow")
+
+@pytest.fixture
+def db_url(tmpdir):
+    """ A SQLite database loaded with reports from January and February 2015 """
+    paths = []
+    for i, report_date in enumerate([datetime.date(2015, 1, 5), datetime.date(2015, 2, 5)]):
+        path = tmpdir.join("reports", report_date.strftime("%Y-%m-%d.txt"))
+        path.write("\n".join(synthetic.generate_report(report_date, 40, i, i * 40 + 1)) + "\n", ensure=True)
+        paths.append(str(path))
+    url = "sqlite:///" + str(tmpdir.join("keene.db"))
+    parse_pdf.load_files(paths, url)
+    return url
+
+def test_geocoded_months_are_exported_again(tmpdir, db_url):
+    directory = str(tmpdir.join("export"))
+    sink = sinks.open_sink(db_url)
+    connection = sink.connection
+    try:
+        months, count = export.export(connection, directory, "arrow")
+        assert (months, count) == ([(2015, 1), (2015, 2)], 80)
+        assert export.export(connection, directory, "arrow")[0] == []
+
+        incident = models.Incident.__table__
+        (location,) = connection.execute(incident.select()
+            .with_only_columns([incident.c.location])
+            .where(incident.c.latitude == None).where(incident.c.dispatch_time >= datetime.datetime(2015, 2, 1))
+            .order_by(incident.c.id).limit(1)).first()
+        touched = set((t.year, t.month) for (t,) in connection.execute(incident.select()
+            .with_only_columns([incident.c.dispatch_time])
+            .where(incident.c.location == location).where(incident.c.latitude == None)))
+        entry = models.GeocodeCacheEntry(address_key = location, formatted_address = "Somewhere, Keene, NH",
+                                         latitude = 42.9, longitude = -72.3, succeeded = True)
+        with connection.begin():
+            geocode.update_incidents(connection, [(location, entry)])
+
+        months, count = export.export(connection, directory, "arrow")
+        assert months == sorted(touched)
+        exported = export.read_table(directory, "incident", datetime.date(2015, 2, 1)).to_pylist()
+        assert set((row["formatted_location"], row["latitude"]) for row in exported
+                   if row["location"] == location) == set([("Somewhere, Keene, NH", 42.9)])
+        assert export.export(connection, directory, "arrow")[0] == []
+    finally:
+        sink.close()
+
+def test_failures_already_flagged_are_not_exported_again(tmpdir, db_url):
+    directory = str(tmpdir.join("export"))
+    sink = sinks.open_sink(db_url)
+    connection = sink.connection
+    try:
+        incident = models.Incident.__table__
+        (location,) = connection.execute(incident.select()
+            .with_only_columns([incident.c.location])
+            .where(incident.c.latitude == None).order_by(incident.c.id).limit(1)).first()
+        failure = models.GeocodeCacheEntry(address_key = location, succeeded = False)
+        with connection.begin():
+            geocode.update_incidents(connection, [(location, failure)])
+        stamped = connection.execute(incident.select().with_only_columns([incident.c.geocoded_at])
+                                     .where(incident.c.location == location)).fetchall()
+        assert all(row[0] is not None for row in stamped)
+        export.export(connection, directory, "arrow")
+
+        # the next geocode run finds the same cached failure for the location
+        with connection.begin():
+            geocode.update_incidents(connection, [(location, failure)])
+        assert connection.execute(incident.select().with_only_columns([incident.c.geocoded_at])
+                                  .where(incident.c.location == location)).fetchall() == stamped
+        assert export.export(connection, directory, "arrow")[0] == []
+    finally:
+        sink.close()
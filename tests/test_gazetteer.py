@@ -0,0 +1,63 @@
+import os
+import pytest
+import gazetteer
+import geocode
+
+SEGMENTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "segments.csv")
+
+@pytest.fixture
+def local():
+    return gazetteer.Gazetteer.load(SEGMENTS)
+
+def assert_point(result, expected):
+    assert result[1] == pytest.approx(expected)
+
+def test_numbers_are_interpolated_along_their_side(local):
+    # odd numbers run up the left side, evens up the right
+    address, point, quality = local.lookup("50 MAIN ST")
+    assert (address, quality) == ("50 Main Street, Keene, NH 03431", "Interpolated")
+    assert point == pytest.approx((42.93 + 0.01 * 48 / 98.0, -72.28))
+    assert_point(local.lookup("1 MAIN ST"), (42.93, -72.28))
+    assert_point(local.lookup("199 MAIN ST"), (42.95, -72.28))
+    # the next segment along holds the higher numbers
+    assert_point(local.lookup("150 MAIN STREET"), (42.94 + 0.01 * 48 / 98.0, -72.28))
+
+def test_a_descending_range_counts_down_the_segment(local):
+    assert_point(local.lookup("50 COURT ST"), (42.94, -72.28))
+    assert_point(local.lookup("2 COURT ST"), (42.94, -72.30))
+    assert_point(local.lookup("26 COURT ST"), (42.94, -72.29))
+
+def test_a_single_number_range_is_the_middle_of_the_segment(local):
+    assert_point(local.lookup("7 WEST ST"), (42.93, -72.285))
+
+def test_numbers_outside_every_range_miss(local):
+    assert local.lookup("201 MAIN ST") is None
+    # the right side of West Street holds no numbers
+    assert local.lookup("8 WEST ST") is None
+    assert local.lookup("12 ELM ST") is None
+
+def test_intersections_are_where_segments_meet(local):
+    address, point, quality = local.lookup("Main Street & COURT ST")
+    assert (address, quality) == ("Main Street & Court St., Keene, NH 03431", "Intersection")
+    assert point == pytest.approx((42.94, -72.28))
+    assert local.lookup("COURT ST & ELM ST") is None
+
+def test_a_bare_street_name_isnt_placed(local):
+    assert local.lookup("MAIN ST") is None
+
+def test_gazetteer_hits_skip_the_cache(local):
+    class Cache(object):
+        def __init__(self):
+            self.keys = []
+
+        def get(self, key):
+            self.keys.append(key)
+            return None
+
+    cache = Cache()
+    found, pending = geocode.resolve_locations(["[KEE 12] 50 MAIN ST", "MAIN ST"], cache, local)
+    assert [(location, entry.source, entry.succeeded) for location, entry in found] == \
+            [("[KEE 12] 50 MAIN ST", "gazetteer", True)]
+    # the bare street name goes on to the cache and Bing
+    assert "MAIN ST" in pending
+    assert "MAIN ST" in cache.keys
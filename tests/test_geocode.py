@@ -0,0 +1,123 @@
+import datetime
+import pytest
+import requests
+import bing
+import fake_bing
+import geocode
+import geocode_cache
+import models
+import normalize
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+PLACES = {
+    "12 MAIN ST" : (42.933, -72.278),
+    "99 COURT ST" : (42.941, -72.281),
+    "5 ROXBURY ST" : (42.934, -72.276),
+}
+
+@pytest.fixture
+def cache(tmpdir):
+    engine = create_engine("sqlite:///" + str(tmpdir.join("keene.db")))
+    models.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield geocode_cache.GeocodeCache(session)
+    finally:
+        session.close()
+
+@pytest.fixture
+def server():
+    server = fake_bing.start(PLACES, ambiguous=["5 ROXBURY ST"], polls_to_complete=3)
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def make_client(server):
+    return bing.BingClient(key="test", rate=1000, burst=1000, **fake_bing.urls(server))
+
+def test_batch_geocode_submits_polls_and_falls_back(server, cache):
+    queries = dict((normalize.address_key(q), q) for q in ["12 MAIN ST", "99 COURT ST", "5 ROXBURY ST", "1 NOWHERE LN"])
+    waits = []
+    entries = geocode.batch_geocode(make_client(server), cache, queries, fallback_workers=2,
+                                    poll_interval=10, max_poll_interval=15, sleep=waits.append)
+
+    # one job, polled until its third status check says it's done, backing off up to the limit
+    assert len(server.jobs) == 1
+    assert sorted(q for _, q in server.jobs["job1"]["queries"]) == sorted(queries.values())
+    assert waits == [10, 15, 15]
+
+    assert entries["12 MAIN ST"].source == "bing-dataflow"
+    assert (entries["12 MAIN ST"].latitude, entries["12 MAIN ST"].longitude) == PLACES["12 MAIN ST"]
+    assert entries["12 MAIN ST"].formatted_address == "12 MAIN ST, Keene, NH"
+    assert entries["99 COURT ST"].source == "bing-dataflow"
+    # the job couldn't match this one, so it was looked up on its own
+    assert entries["5 ROXBURY ST"].source == "bing"
+    assert entries["5 ROXBURY ST"].match_quality == "Medium"
+    # and this one nobody could, which is cached as a failure
+    assert not entries["1 NOWHERE LN"].succeeded
+    assert cache.get("1 NOWHERE LN") is not None
+
+    single = [path for method, path in server.log if path.startswith("/Locations")]
+    assert sorted(single) == ["/Locations/", "/Locations/US/NH/03431/Keene/1 NOWHERE LN",
+                              "/Locations/US/NH/03431/Keene/5 ROXBURY ST"]
+
+def test_lookups_which_go_unanswered_are_left_uncached(server, cache):
+    client = make_client(server)
+    geocode_one = client.geocode
+
+    def flaky_geocode(query_text):
+        if query_text == "99 COURT ST":
+            raise requests.ConnectionError("connection refused")
+        if query_text == "5 ROXBURY ST":
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")
+        return geocode_one(query_text)
+    client.geocode = flaky_geocode
+
+    queries = dict((normalize.address_key(q), q) for q in ["12 MAIN ST", "99 COURT ST", "5 ROXBURY ST", "1 NOWHERE LN"])
+    entries = geocode.geocode_singly(client, cache, queries, 2)
+    assert sorted(entries) == ["1 NOWHERE LN", "12 MAIN ST"]
+    assert entries["12 MAIN ST"].succeeded and not entries["1 NOWHERE LN"].succeeded
+    assert cache.get("99 COURT ST") is None
+    assert cache.get("5 ROXBURY ST") is None
+
+def test_failures_expire_and_are_looked_up_again(cache):
+    failure = cache.put_failure("1 NOWHERE LN", "bing")
+    cache.db_session.commit()
+    assert geocode.resolve_locations(["1 NOWHERE LN"], cache) == ([("1 NOWHERE LN", failure)], {})
+
+    # a month on, in a later run with nothing remembered
+    failure.looked_up_at -= geocode_cache.NEGATIVE_TTL + datetime.timedelta(minutes=1)
+    cache.db_session.commit()
+    later = geocode_cache.GeocodeCache(cache.db_session)
+    assert later.get("1 NOWHERE LN") is None
+    assert later.misses == 1
+    assert geocode.resolve_locations(["1 NOWHERE LN"], later) == ([], {"1 NOWHERE LN" : ("1 NOWHERE LN", ["1 NOWHERE LN"])})
+
+    # successes don't expire
+    success = cache.put("12 MAIN ST", "12 Main St, Keene, NH", 42.933, -72.278, "High", "bing")
+    success.looked_up_at -= datetime.timedelta(days=3650)
+    assert cache.get("12 MAIN ST") is success
+
+def test_an_aborted_job_raises(server):
+    client = make_client(server)
+    job_id = client.submit_job([(0, "12 MAIN ST")])
+    client.job_status = lambda job_id: ("Aborted", {})
+    with pytest.raises(bing.GeocodeError):
+        geocode.wait_for_job(client, job_id, 1, 1, sleep=lambda seconds: None)
+
+def test_read_dataflow_row():
+    assert bing.read_dataflow_row({
+        "GeocodeResponse/Address/FormattedAddress" : "12 Main St, Keene, NH",
+        "GeocodeResponse/Confidence" : "High",
+        "GeocodeResponse/MatchCodes" : "Good",
+        "GeocodeResponse/Point/Latitude" : "42.933",
+        "GeocodeResponse/Point/Longitude" : "-72.278",
+    }) == ("12 Main St, Keene, NH", (42.933, -72.278), "High")
+    # matches which aren't good, and rows without a point, are left for a single lookup
+    assert bing.read_dataflow_row({"GeocodeResponse/MatchCodes" : "Good, UpHierarchy",
+                                   "GeocodeResponse/Point/Latitude" : "42.9",
+                                   "GeocodeResponse/Point/Longitude" : "-72.2"}) is None
+    assert bing.read_dataflow_row({"GeocodeResponse/MatchCodes" : "Good"}) is None
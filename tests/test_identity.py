@@ -0,0 +1,61 @@
+import identity
+import parse_pdf
+import sinks
+from sqlalchemy.orm import sessionmaker
+
+def test_get_or_create_keeps_one_person_per_number():
+    officers = identity.officer_cache()
+    first = officers.get_or_create(40, "JANE", "JONES")
+    assert officers.get_or_create(40, "JANE", "JONES") is first
+    assert officers.get_or_create(41, "JOHN", "SMITH") is not first
+    assert sorted(officers.by_number) == [40, 41]
+
+def test_repeated_badges_load_once_with_the_right_call_taker(tmpdir, report_files):
+    db_url = "sqlite:///" + str(tmpdir.join("keene.db"))
+    parse_pdf.load_files(report_files, db_url)
+
+    # the badges each report gives its call taker and primary officer, by report id; the
+    # synthetic reports give a badge a different name each time, and the first one sticks
+    expected = {}
+    for path in report_files:
+        with open(path, "r") as handle:
+            report_id = None
+            for line in handle:
+                header = parse_pdf.HEADER_RE.match(line)
+                call_taker = parse_pdf.CALL_TAKER_RE.match(line)
+                primary = parse_pdf.PRIMARY_ID_RE.match(line)
+                if header:
+                    report_id = header.group("recid")
+                    expected[report_id] = [None, None]
+                elif call_taker:
+                    expected[report_id][0] = int(call_taker.group("number"))
+                elif primary:
+                    expected[report_id][1] = int(primary.group("number"))
+
+    sink = sinks.open_sink(db_url)
+    try:
+        connection = sink.connection
+        for table in ("officer", "dispatcher"):
+            numbers = [row[0] for row in connection.execute("select number from {0}".format(table))]
+            assert len(numbers) == len(set(numbers))
+        loaded = dict((row[0], [row[1], row[2]]) for row in connection.execute("""
+            select i.report_id, d.number, o.number from incident i
+            left join dispatcher d on d.id = i.call_taker_id
+            left join officer o on o.id = i.primary_officer_id"""))
+        assert loaded == expected
+        assert sum(1 for call_taker, primary in expected.values() if call_taker) == 120
+
+        # a later run finds everyone already there, by number
+        session = sessionmaker(bind=connection)()
+        dispatchers = identity.dispatcher_cache(session)
+        session.close()
+        number = next(iter(dispatchers.by_number))
+        assert dispatchers.get_or_create(number, "X", "Y").id is not None
+    finally:
+        sink.close()
+
+    counts = (sink.engine.execute("select count(*) from officer").scalar(),
+              sink.engine.execute("select count(*) from dispatcher").scalar())
+    parse_pdf.load_files(report_files, db_url)
+    assert (sink.engine.execute("select count(*) from officer").scalar(),
+            sink.engine.execute("select count(*) from dispatcher").scalar()) == counts
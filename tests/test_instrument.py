@@ -0,0 +1,50 @@
+import datetime
+import threading
+import pytest
+import identity
+import instrument
+import parse_pdf
+import synthetic
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+def test_metrics_can_be_shared_by_threads():
+    metrics = instrument.Metrics()
+
+    def work():
+        for _ in range(20000):
+            metrics.count("requests_total")
+            metrics.observe("request_seconds", 0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = metrics.report()
+    assert report["counters"]["requests_total"] == 160000
+    assert report["timers"]["request_seconds"]["count"] == 160000
+
+def test_failed_statements_leave_no_start_times(tmpdir):
+    metrics = instrument.Metrics()
+    engine = instrument.watch_engine(create_engine("sqlite:///" + str(tmpdir.join("watched.db"))), metrics)
+    with engine.connect() as connection:
+        connection.execute("create table t (x integer)")
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.execute("select * from missing")
+        connection.execute("insert into t values (1)")
+        assert "query_started" not in connection.info
+    assert metrics.report()["timers"]["db_query_seconds"]["count"] == 2
+
+def test_line_dispatch_is_timed_apart_from_the_record():
+    lines = iter(synthetic.generate_report(datetime.date(2015, 1, 1), 50, 0, 1))
+    report_date = parse_pdf.read_report_date(lines)
+    instrument.METRICS.drain()
+    records = list(parse_pdf.read_records(lines, report_date, identity.officer_cache(), identity.dispatcher_cache()))
+    timers = instrument.METRICS.drain()["timers"]
+
+    dispatch_count, dispatch_total, dispatch_max = timers["parse_line_dispatch_seconds"]
+    record_count, record_total, record_max = timers["parse_record_seconds"]
+    assert dispatch_count == record_count == len(records) == 50
+    assert 0 < dispatch_total <= record_total
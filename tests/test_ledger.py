@@ -0,0 +1,70 @@
+import datetime
+import batch_import
+import ledger
+import sinks
+import synthetic
+
+CHILD_TABLES = ["responding_officer", "location_change", "arrest", "summons", "protective_custody"]
+
+def import_reports(db_url, paths, manifest_path):
+    sink = sinks.open_sink(db_url)
+    try:
+        return batch_import.run_import(sink, paths, 1, manifest_path)
+    finally:
+        sink.close()
+
+def table_counts(db_url):
+    """ The rows of each table loaded for each report date, and the child rows left without an incident """
+    sink = sinks.open_sink(db_url)
+    try:
+        connection = sink.connection
+        counts = {"incident" : dict(connection.execute(
+            "select date(dispatch_time), count(*) from incident group by date(dispatch_time)").fetchall())}
+        for table in CHILD_TABLES:
+            counts[table] = dict(connection.execute("""
+                select date(i.dispatch_time), count(*) from {0} c join incident i on i.id = c.incident_id
+                group by date(i.dispatch_time)""".format(table)).fetchall())
+            counts[table + "_orphaned"] = connection.execute(
+                "select count(*) from {0} where incident_id not in (select id from incident)".format(table)).scalar()
+        return counts
+    finally:
+        sink.close()
+
+def test_unchanged_files_are_skipped(tmpdir, report_files):
+    db_url = "sqlite:///" + str(tmpdir.join("keene.db"))
+    manifest_path = str(tmpdir.join("manifest.jsonl"))
+    assert import_reports(db_url, report_files, manifest_path)["loaded"] == 3
+    before = table_counts(db_url)
+
+    summary = import_reports(db_url, report_files, manifest_path)
+    assert (summary["loaded"], summary["unchanged"]) == (0, 3)
+    assert table_counts(db_url) == before
+
+def test_a_changed_file_replaces_its_report_date(tmpdir, report_files):
+    db_url = "sqlite:///" + str(tmpdir.join("keene.db"))
+    manifest_path = str(tmpdir.join("manifest.jsonl"))
+    import_reports(db_url, report_files, manifest_path)
+    before = table_counts(db_url)
+    assert before["incident"]["2015-01-02"] == 40
+
+    # the second day's report is reissued with fewer, different incidents
+    with open(report_files[1], "w") as handle:
+        handle.write("\n".join(synthetic.generate_report(datetime.date(2015, 1, 2), 12, 7, 41)) + "\n")
+    summary = import_reports(db_url, report_files, manifest_path)
+    assert (summary["loaded"], summary["unchanged"]) == (1, 2)
+
+    after = table_counts(db_url)
+    assert after["incident"] == dict(before["incident"], **{"2015-01-02" : 12})
+    sink = sinks.open_sink(db_url)
+    try:
+        entry = sink.ledger.entries[ledger.source_name(report_files[1])]
+        assert entry.content_hash == ledger.file_digest(report_files[1])
+        rows = dict((table, getattr(entry, table + "_count")) for table in ["incident"] + CHILD_TABLES)
+    finally:
+        sink.close()
+    for table in CHILD_TABLES:
+        assert after[table + "_orphaned"] == 0
+        assert after[table].get("2015-01-02", 0) == rows[table]
+        # the other days' rows weren't touched
+        assert dict((d, c) for d, c in after[table].items() if d != "2015-01-02") == \
+                dict((d, c) for d, c in before[table].items() if d != "2015-01-02")
@@ -0,0 +1,44 @@
+import pytest
+import normalize
+import parse_pdf
+import sinks
+
+LOCATIONS = ["[KEE 12] CHESHIRE MEDICAL - 12 MAIN ST", "COURT ST @ 0 MAIN ST", None, "[KEE 12] CHESHIRE MEDICAL - 12 MAIN ST",
+             "99 COURT ST @ WASHINGTON ST"]
+
+def test_normalize_locations_matches_one_at_a_time():
+    normalize.normalize_location.cache_clear()
+    normalized = normalize.normalize_locations(LOCATIONS)
+    assert normalized == [None if l is None else normalize.normalize_location(l) for l in LOCATIONS]
+    assert normalized[1] == ("COURT ST & MAIN ST", "COURT ST & MAIN ST")
+    assert normalized[4] == ("99 COURT ST", "99 COURT ST")
+    # the repeated location was normalized just once
+    assert normalize.normalize_location.cache_info().misses == 3
+    assert normalize.location_keys(LOCATIONS) == ["12 MAIN ST", "COURT ST & MAIN ST", None, "12 MAIN ST", "99 COURT ST"]
+
+def test_normalize_locations_of_a_series():
+    pandas = pytest.importorskip("pandas")
+    column = pandas.Series(LOCATIONS, index=[5, 4, 3, 2, 1])
+    keys = normalize.location_keys(column)
+    assert list(keys.index) == [5, 4, 3, 2, 1]
+    assert list(keys) == normalize.location_keys(LOCATIONS)
+    assert list(normalize.canonical_locations(pandas.Series(["12  MAIN ST ", None]))) == ["12 MAIN ST", None]
+
+def test_locations_are_loaded_with_single_spaces(tmpdir, report_files):
+    with open(report_files[0], "r") as handle:
+        text = handle.read()
+    with open(report_files[0], "w") as handle:
+        handle.write(text.replace("Location: ", "Location:   ").replace(" @ 0 ", "  @  0 "))
+
+    sink = sinks.open_sink("sqlite:///" + str(tmpdir.join("keene.db")))
+    try:
+        sink.begin()
+        for record in parse_pdf.parse_file(report_files[0], sink.officers, sink.dispatchers):
+            sink.add(record)
+        sink.flush()
+        sink.commit()
+        locations = [row[0] for row in sink.connection.execute("select location from incident")]
+    finally:
+        sink.close()
+    assert any(" @ 0 " in location for location in locations)
+    assert not any("  " in location for location in locations)
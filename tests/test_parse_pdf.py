@@ -0,0 +1,70 @@
+import datetime
+import io
+import pytest
+import identity
+import parse_pdf
+import sinks
+import synthetic
+
+TABLES = ["dispatcher", "officer", "incident", "responding_officer", "location_change",
+          "arrest", "summons", "protective_custody"]
+
+def row_counts(db_url):
+    sink = sinks.open_sink(db_url)
+    try:
+        return dict((table, sink.connection.execute("select count(*) from {0}".format(table)).scalar())
+                    for table in TABLES)
+    finally:
+        sink.close()
+
+def test_loading_a_report_again_changes_nothing(tmpdir, report_files):
+    db_url = "sqlite:///" + str(tmpdir.join("keene.db"))
+    parse_pdf.load_files(report_files[:2], db_url)
+    first = row_counts(db_url)
+    assert first["incident"] == 80
+
+    parse_pdf.load_files(report_files[:2], db_url)
+    assert row_counts(db_url) == first
+
+    # a run mixing loaded and new reports adds just the new one
+    parse_pdf.load_files(report_files, db_url)
+    assert row_counts(db_url)["incident"] == 120
+
+def read_report(text, quarantine=None):
+    lines = parse_pdf.read_lines(io.StringIO(text))
+    report_date = parse_pdf.read_report_date(lines)
+    return list(parse_pdf.read_records(lines, report_date, identity.officer_cache(),
+                                       identity.dispatcher_cache(), quarantine))
+
+def malformed_report():
+    """ A report of three incidents whose second has a garbled Primary Id, and the line it starts on """
+    lines = synthetic.generate_report(datetime.date(2015, 1, 1), 3, 0, 1)
+    second = lines.index([l for l in lines if l.startswith("15-2 ")][0])
+    lines.insert(second + 1, "Primary Id: see narrative")
+    # a blank line before it still counts toward the line numbers
+    lines.insert(3, "")
+    return "\n".join(lines) + "\n", second + 2
+
+def test_a_malformed_record_is_quarantined():
+    text, line_number = malformed_report()
+    quarantine = []
+    records = read_report(text, quarantine)
+
+    # reading picked up again at the record after it
+    assert [r.incident.report_id for r in records] == ["15-1", "15-3"]
+    assert len(quarantine) == 1
+    assert quarantine[0]["line_number"] == line_number
+    assert quarantine[0]["lines"][0].startswith("15-2 ")
+    assert "Primary Id: see narrative" in quarantine[0]["lines"]
+    assert quarantine[0]["error"].startswith("AttributeError: ")
+
+    with pytest.raises(AttributeError):
+        read_report(text)
+
+def test_a_repeated_preamble_is_skipped_when_quarantining():
+    text = "\n".join(synthetic.generate_report(datetime.date(2015, 1, 1), 3, 0, 1)) + "\n"
+    quarantine = []
+    assert [r.incident.report_id for r in read_report(text + text, quarantine)] == ["15-1", "15-2", "15-3"]
+    assert quarantine == []
+    with pytest.raises(parse_pdf.DuplicateError):
+        read_report(text + text)
@@ -0,0 +1,40 @@
+import json
+import pytest
+import geocode
+import models
+import parse_pdf
+import query_service
+
+@pytest.fixture
+def service(tmpdir, report_files):
+    db_url = "sqlite:///" + str(tmpdir.join("keene.db"))
+    parse_pdf.load_files(report_files, db_url)
+    engine = query_service.create_engine(db_url, 2)
+    return query_service.QueryService(engine, watcher=query_service.IngestWatcher(engine, interval=0))
+
+def get(service, path, **params):
+    status, body, cached = service.respond(path, params)
+    return (status, json.loads(body.decode("utf-8")), cached)
+
+def test_limit_must_be_positive(service):
+    for limit in ("0", "-1", "1001"):
+        status, body, cached = get(service, "/incidents", limit=limit)
+        assert status == 400
+    assert len(get(service, "/incidents")[1]["incidents"]) == query_service.PAGE_SIZE
+    assert len(get(service, "/incidents", limit="1")[1]["incidents"]) == 1
+
+def test_geocoding_clears_the_cache(service):
+    status, body, cached = get(service, "/incidents")
+    location = [i["location"] for i in body["incidents"] if i["latitude"] is None][0]
+    assert get(service, "/incidents")[2]
+
+    entry = models.GeocodeCacheEntry(address_key = location, formatted_address = "Somewhere, Keene, NH",
+                                     latitude = 42.9, longitude = -72.3, succeeded = True)
+    with service.engine.connect() as connection:
+        with connection.begin():
+            geocode.update_incidents(connection, [(location, entry)])
+
+    status, body, cached = get(service, "/incidents")
+    assert not cached
+    assert set((i["formatted_location"], i["latitude"]) for i in body["incidents"] if i["location"] == location) == \
+            set([("Somewhere, Keene, NH", 42.9)])
@@ -0,0 +1,53 @@
+import datetime
+import multiprocessing
+import pickle
+import pytest
+import identity
+import parse_pdf
+import records
+import synthetic
+
+def parse_report():
+    lines = iter(synthetic.generate_report(datetime.date(2015, 1, 1), 200, 0, 1))
+    report_date = parse_pdf.read_report_date(lines)
+    return list(parse_pdf.read_records(lines, report_date, identity.officer_cache(), identity.dispatcher_cache()))
+
+def values(row):
+    """ A row's values, with the people it refers to as their own values """
+    return tuple(values(v) if isinstance(v, records.Row) else v for v in (getattr(row, n) for n in row.__slots__))
+
+def record_values(record):
+    return (values(record.incident),) + tuple(tuple(values(row) for row in rows) for rows in
+        (record.responding_officers, record.location_changes, record.arrests, record.summons, record.custodies))
+
+def test_records_survive_a_pickle_round_trip():
+    parsed = parse_report()
+    # every kind of row turns up in the report
+    for kind in ("responding_officers", "location_changes", "arrests", "summons", "custodies"):
+        assert any(getattr(r, kind) for r in parsed)
+    for protocol in range(2, pickle.HIGHEST_PROTOCOL + 1):
+        copies = pickle.loads(pickle.dumps(parsed, protocol))
+        assert [record_values(r) for r in copies] == [record_values(r) for r in parsed]
+        assert [type(row) for r in copies for row in r.rows()] == [type(row) for r in parsed for row in r.rows()]
+
+    # a person shared by several records is still one object once they're unpickled together
+    copies = pickle.loads(pickle.dumps(parsed, pickle.HIGHEST_PROTOCOL))
+    taker = parsed[0].incident.call_taker
+    shared = [r.incident.call_taker for r, original in zip(copies, parsed) if original.incident.call_taker is taker]
+    assert len(shared) > 1 and all(person is shared[0] for person in shared)
+
+def test_rows_reject_unknown_attributes():
+    with pytest.raises(TypeError):
+        records.Arrest(first_name="JOHN", middle_name="Q")
+    with pytest.raises(AttributeError):
+        records.Arrest().middle_name = "Q"
+
+def test_records_come_back_from_a_worker_process():
+    parsed = parse_report()
+    pool = multiprocessing.Pool(1)
+    try:
+        copies = pool.apply(parse_report)
+    finally:
+        pool.close()
+        pool.join()
+    assert [record_values(r) for r in copies] == [record_values(r) for r in parsed]
@@ -0,0 +1,104 @@
+import json
+import os
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import retrieve_pdfs
+
+PDFS = {
+    "/files/2015-01-01.pdf" : b"%PDF-1.4 first day",
+    "/files/2015-01-02.pdf" : b"%PDF-1.4 second day",
+}
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """ Serves an archive page linking the fixture PDFs and a missing one, answering
+        a request whose If-None-Match matches a PDF's ETag with 304
+    """
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/archive":
+            links = "".join('<a href="{0}">{0}</a>'.format(path) for path in sorted(PDFS) + ["/files/missing.pdf"])
+            self.reply(200, ("<html><body>" + links + "</body></html>").encode("utf-8"))
+        elif self.path in PDFS:
+            etag = '"{0}"'.format(os.path.basename(self.path))
+            if self.headers.get("If-None-Match") == etag:
+                self.reply(304, b"", etag)
+            else:
+                self.reply(200, PDFS[self.path], etag)
+        else:
+            self.reply(500, b"")
+
+    def reply(self, status, body, etag=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def archive():
+    server = ThreadingHTTPServer(("localhost", 0), ArchiveHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def run_main(monkeypatch, base_url, dest, *args):
+    monkeypatch.setattr(retrieve_pdfs, "yearly_archive_pages", ["/archive"])
+    monkeypatch.setattr(sys, "argv", ["retrieve_pdfs.py", "--dest", dest, "--base-url", base_url, "--workers", "2"]
+                                     + list(args))
+    retrieve_pdfs.main()
+    with open(os.path.join(dest, "manifest.json"), "r") as handle:
+        return json.load(handle)
+
+def test_a_failed_download_doesnt_stop_the_rest(monkeypatch, tmpdir, capsys, archive):
+    base_url = "http://localhost:{0}".format(archive.server_address[1])
+    dest = str(tmpdir.join("pdfs"))
+    manifest = run_main(monkeypatch, base_url, dest)
+
+    assert sorted(manifest) == [base_url + path for path in sorted(PDFS)]
+    for path, content in PDFS.items():
+        with open(os.path.join(dest, os.path.basename(path)), "rb") as handle:
+            assert handle.read() == content
+    assert not os.path.exists(os.path.join(dest, "missing.pdf.part"))
+    assert "'failed': 1" in capsys.readouterr().out
+
+def test_revalidate_sends_the_etag(monkeypatch, tmpdir, capsys, archive):
+    base_url = "http://localhost:{0}".format(archive.server_address[1])
+    dest = str(tmpdir.join("pdfs"))
+    run_main(monkeypatch, base_url, dest)
+    capsys.readouterr()
+    del archive.requests[:]
+
+    # without --revalidate, files on disk aren't asked about at all
+    run_main(monkeypatch, base_url, dest)
+    assert [path for path, etag in archive.requests if path in PDFS] == []
+
+    run_main(monkeypatch, base_url, dest, "--revalidate")
+    assert sorted((path, etag) for path, etag in archive.requests if path in PDFS) == \
+            [("/files/2015-01-01.pdf", '"2015-01-01.pdf"'), ("/files/2015-01-02.pdf", '"2015-01-02.pdf"')]
+    assert "'not modified': 2" in capsys.readouterr().out
+
+def test_a_stalled_server_times_out(tmpdir):
+    # a listening socket which never answers
+    listener = socket.socket()
+    listener.bind(("localhost", 0))
+    listener.listen(1)
+    try:
+        url = "http://localhost:{0}/files/stalled.pdf".format(listener.getsockname()[1])
+        manifest = retrieve_pdfs.Manifest(str(tmpdir.join("manifest.json")))
+        session = retrieve_pdfs.make_session(1)
+        assert retrieve_pdfs.fetch_pdf(session, url, str(tmpdir), manifest, timeout=0.2) == "failed"
+        assert manifest.entries == {}
+    finally:
+        listener.close()
@@ -0,0 +1,60 @@
+import bisect
+import datetime
+import random
+import parse_pdf
+import rollups
+import sinks
+
+def rank_error(values, estimate, q):
+    """ How far off `q` the fraction of sorted `values` below `estimate` is """
+    return abs(bisect.bisect_left(values, estimate) / float(len(values)) - q)
+
+def test_quantiles_are_close_to_exact():
+    rand = random.Random(0)
+    # response times are skewed, with a long tail
+    values = [rand.expovariate(1 / 300.0) for _ in range(20000)]
+    whole = rollups.TDigest()
+    parts = [rollups.TDigest() for _ in range(20)]
+    for i, value in enumerate(values):
+        whole.add(value)
+        parts[i % len(parts)].add(value)
+    merged = rollups.TDigest()
+    for part in parts:
+        merged.merge(rollups.TDigest.from_json(part.to_json()))
+
+    values.sort()
+    assert whole.count == merged.count == len(values)
+    for q in (0.01, 0.1, 0.5, 0.9, 0.99):
+        assert rank_error(values, whole.quantile(q), q) < 0.01
+        assert rank_error(values, merged.quantile(q), q) < 0.01
+    # the tails are held more finely than the middle
+    assert rank_error(values, merged.quantile(0.999), 0.999) < 0.001
+
+def test_refresh_rebuilds_only_the_dates_given(tmpdir, report_files):
+    db_url = "sqlite:///" + str(tmpdir.join("keene.db"))
+    parse_pdf.load_files(report_files, db_url)
+    sink = sinks.open_sink(db_url)
+    connection = sink.connection
+    try:
+        def rollup_rows():
+            return sorted(tuple(row) for row in connection.execute("select * from response_rollup"))
+        built = rollup_rows()
+        assert set(row[0] for row in built) == set(["2015-01-01", "2015-01-02", "2015-01-03"])
+
+        connection.execute("update response_rollup set response_count = -1")
+        with connection.begin():
+            written = rollups.refresh(connection, [datetime.date(2015, 1, 2)])
+        rows = rollup_rows()
+        assert written == sum(1 for row in rows if row[0] == "2015-01-02")
+        assert [row for row in rows if row[0] == "2015-01-02"] == [row for row in built if row[0] == "2015-01-02"]
+        assert all(row[4] == -1 for row in rows if row[0] != "2015-01-02")
+
+        # and the rollups agree with the responses they came from
+        exact = connection.execute("""
+            select count(*), sum((julianday(r.arrival_time) - julianday(r.dispatch_time)) * 86400)
+            from responding_officer r join incident i on i.id = r.incident_id
+            where date(i.dispatch_time) = '2015-01-02' and r.arrival_time >= r.dispatch_time""").first()
+        (summary,) = rollups.summarize(connection, datetime.date(2015, 1, 2), datetime.date(2015, 1, 3), ()).values()
+        assert summary["arrival_mean"] == round(exact[1] / exact[0], 1)
+    finally:
+        sink.close()
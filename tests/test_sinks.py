@@ -0,0 +1,42 @@
+import csv
+import datetime
+import glob
+import os
+import pytest
+import parse_pdf
+import sinks
+import synthetic
+
+def test_columnar_parts_are_replaced_on_reload(tmpdir, report_files):
+    directory = str(tmpdir.join("out"))
+    parse_pdf.load_files(report_files, "csv://" + directory)
+    parse_pdf.load_files(report_files, "csv://" + directory)
+
+    parts = sorted(os.path.basename(p) for p in glob.glob(os.path.join(directory, "incident", "*.csv")))
+    assert parts == ["2015-01-01.csv", "2015-01-02.csv", "2015-01-03.csv"]
+    report_ids = []
+    for part in parts:
+        with open(os.path.join(directory, "incident", part), "r") as handle:
+            report_ids.extend(row["report_id"] for row in csv.DictReader(handle))
+    assert len(report_ids) == len(set(report_ids)) == 120
+
+def test_parquet_parts_share_a_schema(tmpdir, report_files):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.dataset
+
+    # a single call with nothing referred to another report leaves aux_event_key all None
+    quiet = tmpdir.join("reports", "2015-01-04.txt")
+    lines = [line for line in synthetic.generate_report(datetime.date(2015, 1, 4), 1, 3, 121)
+             if not line.startswith(("Refer To", "Arrest:", "Summons:", "P/C:", "Address:", "Age:", "Charges:"))]
+    quiet.write("\n".join(lines) + "\n")
+
+    directory = str(tmpdir.join("out"))
+    parse_pdf.load_files([str(quiet)] + report_files, "parquet://" + directory)
+
+    sink = sinks.open_sink("parquet://" + directory)
+    schema = sink.arrow_schema("incident")
+    paths = sorted(glob.glob(os.path.join(directory, "incident", "*.parquet")))
+    assert len(paths) == 4
+    for path in paths:
+        assert pyarrow.parquet.read_schema(path).remove_metadata() == schema
+    assert pyarrow.dataset.dataset(os.path.join(directory, "incident")).to_table().num_rows == 121
@@ -0,0 +1,79 @@
+import datetime
+import random
+import geocode
+import models
+import parse_pdf
+import sinks
+import spatial
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql
+
+def make_index(count=2000, seed=0):
+    rand = random.Random(seed)
+    index = spatial.SpatialIndex()
+    points = []
+    for i in range(1, count + 1):
+        lat, lon = 42.90 + rand.random() * 0.06, -72.32 + rand.random() * 0.08
+        when = datetime.datetime(2015, 1, 1) + datetime.timedelta(hours=i)
+        index.add(i, lat, lon, when)
+        points.append((i, lat, lon, when))
+    return (index, points)
+
+def test_nearest_matches_a_full_scan():
+    index, points = make_index()
+    lat, lon = 42.93, -72.28
+    expected = sorted((spatial.distance(lat, lon, p[1], p[2]), p[0]) for p in points)[:10]
+    assert index.nearest(lat, lon, 10) == expected
+    # from outside the occupied cells too
+    assert [i for d, i in index.nearest(43.5, -72.28, 3)] == \
+            [i for d, i in sorted((spatial.distance(43.5, -72.28, p[1], p[2]), p[0]) for p in points)[:3]]
+
+def test_nearest_of_none_is_empty():
+    index, points = make_index(10)
+    assert index.nearest(42.93, -72.28, 0) == []
+    assert index.nearest(42.93, -72.28, -1) == []
+    assert spatial.SpatialIndex().nearest(42.93, -72.28, 3) == []
+
+def test_within_radius_and_window():
+    index, points = make_index()
+    lat, lon = 42.93, -72.28
+    start, end = datetime.datetime(2015, 1, 10), datetime.datetime(2015, 2, 10)
+    expected = sorted((spatial.distance(lat, lon, p[1], p[2]), p[0]) for p in points
+                      if spatial.distance(lat, lon, p[1], p[2]) <= 800 and start <= p[3] < end)
+    assert index.within_radius(lat, lon, 800, start, end) == expected
+
+def test_load_picks_up_incidents_geocoded_later(tmpdir, report_files):
+    db_url = "sqlite:///" + str(tmpdir.join("keene.db"))
+    parse_pdf.load_files(report_files, db_url)
+    sink = sinks.open_sink(db_url)
+    connection = sink.connection
+    try:
+        incident = models.Incident.__table__
+        index = spatial.SpatialIndex()
+        located = index.load(connection)
+        assert index.size == located
+
+        # the geocoder reaches the earliest incidents after the later ones were indexed
+        locations = [row[0] for row in connection.execute(select([incident.c.location])
+            .where(incident.c.latitude == None).order_by(incident.c.id).limit(2))]
+        for location, point in zip(locations, [(42.93, -72.28), (42.94, -72.29)]):
+            entry = models.GeocodeCacheEntry(address_key = location, formatted_address = location,
+                                             latitude = point[0], longitude = point[1], succeeded = True)
+            with connection.begin():
+                geocode.update_incidents(connection, [(location, entry)])
+            added = connection.execute(select([func.count()]).where(incident.c.location == location)).scalar()
+            assert index.load(connection) == added
+        assert index.load(connection) == 0
+
+        expected = sorted(row[0] for row in connection.execute(select([incident.c.id]).where(incident.c.latitude != None)))
+        assert sorted(i for d, i in index.nearest(42.93, -72.28, len(expected) + 1)) == expected
+        assert index.reload(connection) == len(expected)
+    finally:
+        sink.close()
+
+def test_box_queries_use_the_point_index_on_postgres():
+    query = spatial.box_query(42.9, -72.3, 42.95, -72.25, dialect_name="postgresql")
+    sql = str(query.compile(dialect=postgresql.dialect()))
+    assert "point(CAST(incident.longitude AS FLOAT), CAST(incident.latitude AS FLOAT)) <@ box(point(" in sql
+    assert "BETWEEN" not in sql
+    assert "BETWEEN" in str(spatial.box_query(42.9, -72.3, 42.95, -72.25, dialect_name="sqlite"))
@@ -0,0 +1,51 @@
+import datetime
+import io
+import identity
+import parse_pdf
+import timeparse
+
+def read_report(*records):
+    text = "\n".join(["For Date: 01/01/2015 - Thursday", "Call Number Time Call Reason Action"] +
+                     [line for record in records for line in record]) + "\n"
+    lines = parse_pdf.read_lines(io.StringIO(text))
+    report_date = parse_pdf.read_report_date(lines)
+    return list(parse_pdf.read_records(lines, report_date, identity.officer_cache(), identity.dispatcher_cache()))
+
+def response(header, times):
+    return [header, "Call Taker: 129 - ROE, ANN", "Location/Address: 12 MAIN ST", "ID: 40 - JONES, JANE", times]
+
+def test_times_after_midnight_roll_onto_the_next_day():
+    (late, early) = read_report(
+        response("15-1 2355 Officer - MOTOR VEHICLE STOP Citation Issued", "Disp-23:56:10 Arvd-23:59:40 Clrd-00:07:02"),
+        response("15-2 0004 Officer - MOTOR VEHICLE STOP Citation Issued", "Disp-00:04:30 Arvd-00:09:00 Clrd-00:20:00"))
+
+    officer = late.responding_officers[0]
+    assert late.incident.dispatch_time == datetime.datetime(2015, 1, 1, 23, 55)
+    assert officer.dispatch_time == datetime.datetime(2015, 1, 1, 23, 56, 10)
+    assert officer.arrival_time == datetime.datetime(2015, 1, 1, 23, 59, 40)
+    assert officer.cleared_time == datetime.datetime(2015, 1, 2, 0, 7, 2)
+
+    # the report lists the early hours of its own day after the late ones, which stay put
+    officer = early.responding_officers[0]
+    assert early.incident.dispatch_time == datetime.datetime(2015, 1, 1, 0, 4)
+    assert officer.dispatch_time == datetime.datetime(2015, 1, 1, 0, 4, 30)
+    assert officer.cleared_time == datetime.datetime(2015, 1, 1, 0, 20)
+
+def test_times_an_hour_or_so_apart_do_not_roll():
+    # 12:55 then 01:05, as a 12 hour clock would have it, is too little of a step back to be midnight
+    (record,) = read_report(
+        response("15-1 1250 Officer - NOISE COMPLAINT Gone On Arrival", "Disp-12:55:00 Arvd-01:05:00 Clrd-01:30:00"))
+    officer = record.responding_officers[0]
+    assert officer.arrival_time == datetime.datetime(2015, 1, 1, 1, 5)
+    assert officer.cleared_time == datetime.datetime(2015, 1, 1, 1, 30)
+
+    # nor are clocks which disagree by a minute
+    moment = datetime.datetime(2015, 1, 1, 23, 58)
+    assert timeparse.roll_forward(moment, datetime.datetime(2015, 1, 1, 23, 59)) == moment
+    assert timeparse.roll_forward(moment, None) == moment
+
+def test_full_stamps_are_taken_as_given():
+    (record,) = read_report(
+        response("15-1 2350 Officer - ASSIST OTHER AGENCY Services Rendered",
+                 "Disp-23:51:00 Arvd-23:58:00 Clrd-01/02/2015 @ 02:10:00"))
+    assert record.responding_officers[0].cleared_time == datetime.datetime(2015, 1, 2, 2, 10)
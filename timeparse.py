@@ -0,0 +1,78 @@
+import datetime
+import functools
+
+# the same few thousand times of day and timestamps turn up across every report
+MEMO_SIZE = 50000
+
+# a time this much earlier than the one before it is taken to be on the next day,
+# while small differences are left alone as the clocks of different people disagreeing
+ROLLOVER_GAP = datetime.timedelta(hours=12)
+ONE_DAY = datetime.timedelta(days=1)
+
+# Each parser reads the layout the reports use with slicing and int, which is many times
+# quicker than strptime, and hands anything else (a single digit month, say) to strptime.
+# Out of range values raise ValueError either way.
+
+def fixed_layout(value, layout):
+    """ True if `value` has the shape of `layout`, in which 9 stands for any digit """
+    if len(value) != len(layout):
+        return False
+    for character, expected in zip(value, layout):
+        if expected == "9":
+            if not "0" <= character <= "9":
+                return False
+        elif character != expected:
+            return False
+    return True
+
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def parse_clock(value):
+    """ Parses HH:MM:SS into a `datetime.time` """
+    if fixed_layout(value, "99:99:99"):
+        return datetime.time(int(value[0:2]), int(value[3:5]), int(value[6:8]))
+    return datetime.datetime.strptime(value, "%H:%M:%S").time()
+
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def parse_hhmm(value):
+    """ Parses the HHMM of a record header into a `datetime.time` """
+    if fixed_layout(value, "9999"):
+        return datetime.time(int(value[0:2]), int(value[2:4]))
+    return datetime.datetime.strptime(value, "%H%M").time()
+
+def parse_date(value):
+    """ Parses the MM/DD/YYYY of a report into a `datetime.datetime` at midnight """
+    if fixed_layout(value, "99/99/9999"):
+        return datetime.datetime(int(value[6:10]), int(value[0:2]), int(value[3:5]))
+    return datetime.datetime.strptime(value, "%m/%d/%Y")
+
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def parse_stamp(value):
+    """ Parses MM/DD/YYYY @ HH:MM:SS into a `datetime.datetime` """
+    if fixed_layout(value, "99/99/9999 @ 99:99:99"):
+        return datetime.datetime(int(value[6:10]), int(value[0:2]), int(value[3:5]),
+                                 int(value[13:15]), int(value[16:18]), int(value[19:21]))
+    return datetime.datetime.strptime(value, "%m/%d/%Y @ %H:%M:%S")
+
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def parse_compact_stamp(value):
+    """ Parses the MM/DD/YYYYHHMM of a location change into a `datetime.datetime` """
+    if fixed_layout(value, "99/99/99999999"):
+        return datetime.datetime(int(value[6:10]), int(value[0:2]), int(value[3:5]),
+                                 int(value[10:12]), int(value[12:14]))
+    return datetime.datetime.strptime(value, "%m/%d/%Y%H%M")
+
+def on_day(day, value):
+    """ The `datetime.datetime` of the HH:MM:SS `value` on the date `day`. Only the time
+        of day is memoized, since the same times turn up on every day but a given day's
+        times rarely repeat.
+    """
+    return datetime.datetime.combine(day, parse_clock(value))
+
+def roll_forward(moment, after):
+    """ Moves `moment` to the next day if it falls well before `after`, the time it must
+        follow, as when a call dispatched before midnight is cleared after it. Reports
+        give such times as HH:MM:SS, which are read as falling on the day of the report.
+    """
+    if after is not None and after - moment > ROLLOVER_GAP:
+        return moment + ONE_DAY
+    return moment